@@ -0,0 +1,24 @@
+from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import get_settings
+
+# The only route the frontend calls from the browser; everything else goes through its server.
+TILES_PATH_PREFIX = "/api/tiles/"
+
+
+class TileCORSMiddleware(CORSMiddleware):
+    """
+    CORSMiddleware for the vector tile route only, which the Leaflet map of the Streamlit frontend
+    fetches from another origin. Allows GET from settings.tile_cors_origins, read when the app starts.
+    """
+
+    def __init__(self, app: ASGIApp, path_prefix: str = TILES_PATH_PREFIX):
+        super().__init__(app, allow_origins=get_settings().tile_cors_origins, allow_methods=["GET"])
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.path_prefix):
+            await super().__call__(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
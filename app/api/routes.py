@@ -1,60 +1,874 @@
 
 
-from fastapi import APIRouter
-from pydantic import BaseModel
-from app.geo.parser import load_geodataframe
-from app.geo.analysis import analyze_site
-from app.rules.engine import evaluate_rules
-from app.llm.agent import generate_report
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from app.api.timing import run_in_threadpool
+from app.core.config import get_settings
+from app.core.metrics import render_metrics, stage
 from pathlib import Path
-from typing import Dict, Any
-import geopandas as gpd
+import asyncio
+import json
+from typing import TYPE_CHECKING, Dict, Any, AsyncIterator, Iterator, List, Literal
+import tempfile
+
+# The geo stack, the rules and the LLM modules are imported where they are used, so the app
+# (and /health) comes up without them; the lifespan warms them up in the background.
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    import geopandas as gpd
+    import numpy as np
+    import pandas as pd
+    from app.db.evaluations import EvaluationStore
+    from app.geo.cache import AnalysisCache
+    from app.geo.store import ReferenceLayerStore
+    from app.geo.tiles import VectorTileStore
+    from app.llm.jobs import ReportJob, ReportJobRegistry
 router = APIRouter()
 BASE_DIR = Path(__file__).parents[2] / "data"
 EXAMPLES_DIR = BASE_DIR / "examples"
-PROCESSED_DIR = BASE_DIR / "processed"
 TARGET_CRS = "EPSG:25832"
 
+# Sites analyzed together by /evaluate/stream before their results are sent.
+SITE_STREAM_CHUNK_SIZE = 1000
+PARQUET_CONTENT_TYPES = ("application/vnd.apache.parquet", "application/x-parquet", "application/parquet")
+
+ReportMode = Literal["llm", "template"]
+
 class SiteEvaluationRequest(BaseModel):
     site_geojson: Dict[str, Any]
+    report_mode: ReportMode = "llm"
+    include_map_data: bool = True
 
-@router.get("/health")
-def health_check():
-    return {"status": "ok"}
+class BatchEvaluationRequest(BaseModel):
+    sites_geojson: Dict[str, Any]
+    include_report: bool = False
+    report_mode: ReportMode = "llm"
 
-@router.post("/evaluate")
-def evaluate_site(payload: SiteEvaluationRequest):
-    if payload.site_geojson.get("type") == "FeatureCollection":
-        features = payload.site_geojson.get("features")
-    elif payload.site_geojson.get("type") == "Feature":
-        features = [payload.site_geojson]
+class SuitabilityRequest(BaseModel):
+    bbox: List[float] = Field(..., min_length=4, max_length=4)
+    bbox_crs: str = "EPSG:4326"
+    cell_size_m: float = 100.0
+    format: Literal["npz", "geotiff"] = "npz"
+
+class LayoutRequest(BaseModel):
+    site_geojson: Dict[str, Any]
+    spacing_m: float = Field(500.0, gt=0)
+    time_budget_s: float = Field(2.0, gt=0, le=30)
+    max_turbines: int | None = Field(None, ge=1)
+    include_buildable_area: bool = True
+
+
+def _site_gdf_from_geojson(geojson: Dict[str, Any]) -> "gpd.GeoDataFrame":
+    """Builds a GeoDataFrame in TARGET_CRS from a FeatureCollection, Feature or raw geometry."""
+    if geojson.get("type") == "FeatureCollection":
+        features = geojson.get("features")
+    elif geojson.get("type") == "Feature":
+        features = [geojson]
     else:
         # Handle raw geometry or other variations if necessary
-        features = [{"geometry": payload.site_geojson, "properties": {}}]
+        features = [{"geometry": geojson, "properties": {}}]
+
+    import geopandas as gpd
+    from app.geo.crs import to_crs
 
     site_gdf = gpd.GeoDataFrame.from_features(features)
 
     if site_gdf.crs is None:
         site_gdf.set_crs(epsg=4326, inplace=True)
 
-    settlements = load_geodataframe(PROCESSED_DIR / "settlements.gpkg")
-    protected_areas = load_geodataframe(PROCESSED_DIR / "protected_areas.gpkg")
+    return to_crs(site_gdf, TARGET_CRS)
 
-    # ensure common CRS
-    site_gdf = site_gdf.to_crs(TARGET_CRS)
-    settlements = settlements.to_crs(TARGET_CRS)
-    protected_areas = protected_areas.to_crs(TARGET_CRS)
 
-    analysis_results = analyze_site(site_gdf, settlements, protected_areas)
-    geo_metrics = analysis_results["metrics"]
-    map_data = analysis_results["map_data"]
+def _analysis_crs(geometries) -> "np.ndarray":
+    """Metric CRS to analyze each site geometry (TARGET_CRS) in: its UTM zone, or settings.analysis_crs if fixed."""
+    import numpy as np
+    from app.geo.crs import site_crs
 
-    rule_results = evaluate_rules(geo_metrics)
-    report = generate_report(geo_metrics, rule_results)
+    analysis_crs = get_settings().analysis_crs
+    if analysis_crs != "auto":
+        return np.full(len(geometries), analysis_crs, dtype=object)
+    return site_crs(geometries, TARGET_CRS)
 
-    return {
+
+async def _app_service(request: Request, name: str, optional: bool = False):
+    """
+    Returns a service the lifespan puts on app.state. While the app is still warming up, awaits the
+    warm-up task (up to settings.startup_wait_s) instead of failing the request; no thread is held.
+    """
+    state = request.app.state
+    ready = getattr(state, "ready", None)
+    if ready is not None and not ready.is_set():
+        try:
+            # shielded, so a request giving up does not cancel the warm-up
+            await asyncio.wait_for(asyncio.shield(state.warm_up), get_settings().startup_wait_s)
+        except TimeoutError:
+            raise HTTPException(status_code=503, detail="The service is still starting up.")
+    service = getattr(state, name, None)
+    if service is None and not optional:
+        raise HTTPException(status_code=503, detail="The service failed to start, see /api/ready.")
+    return service
+
+
+async def get_reference_store(request: Request) -> "ReferenceLayerStore":
+    """
+    Dependency returning the reference layer store created in the app lifespan, pinned to the current
+    dataset version so a snapshot switch during the request does not mix two versions.
+    """
+    store = await _app_service(request, "reference_store")
+    # pinned() takes the store lock, which a layer load may hold for a while
+    return await run_in_threadpool(store.pinned)
+
+
+async def get_analysis_cache(request: Request) -> "AnalysisCache":
+    """Dependency returning the analyze_site result cache created in the app lifespan."""
+    return await _app_service(request, "analysis_cache")
+
+
+async def get_report_jobs(request: Request) -> "ReportJobRegistry":
+    """Dependency returning the report job registry created in the app lifespan."""
+    return await _app_service(request, "report_jobs")
+
+
+async def get_tile_store(request: Request) -> "VectorTileStore":
+    """Dependency returning the vector tile store created in the app lifespan."""
+    return await _app_service(request, "tile_store")
+
+
+async def get_raster_pool(request: Request) -> "ProcessPoolExecutor | None":
+    """Dependency returning the /suitability process pool created in the app lifespan (None: compute in-thread)."""
+    return await _app_service(request, "raster_pool", optional=True)
+
+
+async def get_evaluation_store(request: Request) -> "EvaluationStore | None":
+    """Dependency returning the evaluation store created in the app lifespan (None if disabled)."""
+    return await _app_service(request, "evaluation_store", optional=True)
+
+
+@router.get("/health")
+async def health_check():
+    """Liveness: answers as soon as the process serves requests, before the reference data is loaded."""
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def readiness_check(request: Request):
+    """Readiness: 200 once the lifespan has loaded the reference layers and created all services, else 503."""
+    state = request.app.state
+    ready = getattr(state, "ready", None)
+    error = getattr(state, "startup_error", None)
+    if ready is None or not ready.is_set() or error is not None:
+        status = "failed" if error is not None else "starting"
+        return JSONResponse({"status": status, "error": error}, status_code=503)
+    return {"status": "ready"}
+
+
+@router.get("/metrics")
+def prometheus_metrics():
+    """Request, stage and LLM token metrics in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def _analyze_and_check(
+        site_geojson: Dict[str, Any],
+        store: "ReferenceLayerStore",
+        cache: "AnalysisCache",
+        include_map_data: bool = True,
+) -> dict:
+    """CPU-bound part of an evaluation: spatial analysis (cached per site geometry) and rule check."""
+    from app.geo.analysis import analyze_site
+    from app.geo.cache import site_cache_key
+    from app.rules.engine import evaluate_rules, get_rule_set
+
+    typed_distances = get_rule_set().typed_distances("distance_to_settlements_m")
+    # reference layers are already held in TARGET_CRS by the store
+    with stage("parse_site"):
+        site_gdf = _site_gdf_from_geojson(site_geojson)
+        usable = ~(site_gdf.geometry.isna() | site_gdf.geometry.is_empty)
+        if not site_gdf.empty and not usable.any():
+            raise HTTPException(status_code=422, detail="The site has no usable geometry.")
+        site_gdf = site_gdf[usable]
+    with stage("cache_lookup"):
+        dataset_version = store.version()
+        key = site_cache_key(site_gdf) if not site_gdf.empty else None
+        if key and not include_map_data:
+            key += ":no-map"
+        if key and typed_distances:
+            key += ":" + ";".join(sorted(typed_distances))
+        analysis_results = cache.get(key, dataset_version) if key else None
+
+    if analysis_results is None and site_gdf.empty:
+        # Nothing to analyze; return before any store reads a window around an empty site.
+        analysis_results = {"metrics": {}, "map_data": {}}
+    if analysis_results is None:
+        site_geo = site_gdf.union_all()
+        crs = _analysis_crs([site_geo])[0]
+        with stage("load_layers"):
+            settlements, protected_areas = store.layers_for_site(site_geo, crs, typed_distances.values())
+            constraint_sources = store.constraint_sources(site_geo, crs)
+        analysis_results = analyze_site(
+            site_gdf, settlements, protected_areas, constraint_sources,
+            include_map_data=include_map_data, crs=crs, typed_distances=typed_distances,
+        )
+        if key:
+            cache.put(key, dataset_version, analysis_results)
+
+    geo_metrics = analysis_results["metrics"]
+
+    result = {
+        "dataset_version": dataset_version,
+        "analysis_crs": analysis_results.get("crs"),
         "geo_metrics": geo_metrics,
-        "rule_results": rule_results,
+        "rule_results": evaluate_rules(geo_metrics),
+        "constraints": analysis_results.get("constraints", {}),
+        "nearest_settlements": analysis_results.get("nearest_settlements", []),
+    }
+    if include_map_data:
+        result["map_data"] = analysis_results["map_data"]
+    return result
+
+
+def _json_response(content: dict) -> Response:
+    """Serializes directly to JSON bytes with orjson when it is installed, else with FastAPI's encoder."""
+    try:
+        import orjson
+    except ImportError:
+        return JSONResponse(jsonable_encoder(content))
+    return Response(orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
+
+
+@router.post("/evaluate")
+async def evaluate_site(
+        payload: SiteEvaluationRequest,
+        store: "ReferenceLayerStore" = Depends(get_reference_store),
+        cache: "AnalysisCache" = Depends(get_analysis_cache),
+        jobs: "ReportJobRegistry" = Depends(get_report_jobs),
+        evaluations: "EvaluationStore | None" = Depends(get_evaluation_store),
+):
+    """
+    Returns metrics and rule results right away. In "llm" report mode the report is generated
+    in the background; fetch it from /reports/{report_job_id} or stream it from
+    /reports/{report_job_id}/stream. In "template" mode it is rendered inline without the LLM.
+    The evaluation is stored in the background and can be fetched again from /evaluations/{evaluation_id}.
+    """
+    result = await run_in_threadpool(
+        _analyze_and_check, payload.site_geojson, store, cache, payload.include_map_data
+    )
+
+    report = None
+    if payload.report_mode == "template":
+        from app.llm.template import render_template_report
+
+        with stage("report_template"):
+            report = render_template_report(result["geo_metrics"], result["rule_results"])
+
+    evaluation_id = None
+    if evaluations is not None:
+        evaluation_id = evaluations.save(payload.site_geojson, {**result, "report": report}, result["dataset_version"])
+
+    report_job_id = None
+    if payload.report_mode != "template":
+        on_done = None
+        if evaluation_id is not None:
+            def on_done(job: "ReportJob") -> None:
+                evaluations.set_report(evaluation_id, job.report, job.status)
+        job = await jobs.submit(result["geo_metrics"], result["rule_results"], on_done)
+        report_job_id = job.id
+
+    response = {
+        "evaluation_id": evaluation_id,
+        "dataset_version": result["dataset_version"],
+        "analysis_crs": result["analysis_crs"],
+        "geo_metrics": result["geo_metrics"],
+        "rule_results": result["rule_results"],
         "report": report,
-        "map_data": map_data
+        "report_job_id": report_job_id,
+        "constraints": result["constraints"],
+        "nearest_settlements": result["nearest_settlements"],
+    }
+    if payload.include_map_data:
+        response["map_data"] = result["map_data"]
+    with stage("serialize"):
+        return _json_response(response)
+
+
+def _get_evaluations_or_503(evaluations: "EvaluationStore | None") -> "EvaluationStore":
+    if evaluations is None:
+        raise HTTPException(status_code=503, detail="The evaluation store is disabled.")
+    return evaluations
+
+
+def _ndjson_response(summaries: Iterator[dict]) -> StreamingResponse:
+    """Streams summaries as newline-delimited JSON, reading them from the database chunk by chunk."""
+    return StreamingResponse(
+        (json.dumps(summary, default=str) + "\n" for summary in summaries),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/evaluations")
+def list_evaluations(
+        limit: int = Query(100, ge=1, le=10_000),
+        before: str | None = None,
+        evaluations: "EvaluationStore | None" = Depends(get_evaluation_store),
+):
+    """
+    Stored evaluations, newest first, as NDJSON (one summary per line, without the site and report).
+    For the next page pass the id of the last line as before.
+    """
+    evaluations = _get_evaluations_or_503(evaluations)
+    try:
+        return _ndjson_response(evaluations.iter_evaluations(limit, before))
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown cursor '{before}'.")
+
+
+@router.get("/evaluations/search")
+def search_evaluations(
+        bbox: str = Query(..., description="min_lon,min_lat,max_lon,max_lat"),
+        limit: int = Query(100, ge=1, le=10_000),
+        before: str | None = None,
+        evaluations: "EvaluationStore | None" = Depends(get_evaluation_store),
+):
+    """Stored evaluations whose site intersects the bbox (WGS84), newest first, as NDJSON like /evaluations."""
+    evaluations = _get_evaluations_or_503(evaluations)
+    try:
+        min_x, min_y, max_x, max_y = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be 'min_lon,min_lat,max_lon,max_lat'.")
+    try:
+        return _ndjson_response(evaluations.iter_in_area((min_x, min_y, max_x, max_y), limit, before))
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown cursor '{before}'.")
+
+
+@router.get("/evaluations/{evaluation_id}")
+def get_evaluation(evaluation_id: str, evaluations: "EvaluationStore | None" = Depends(get_evaluation_store)):
+    evaluation = _get_evaluations_or_503(evaluations).get(evaluation_id)
+    if evaluation is None:
+        raise HTTPException(status_code=404, detail=f"Unknown evaluation '{evaluation_id}'.")
+    return _json_response(evaluation)
+
+
+def _get_job_or_404(jobs: "ReportJobRegistry", job_id: str) -> "ReportJob":
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown report job '{job_id}'.")
+    return job
+
+
+@router.get("/dataset")
+def dataset_info(store: "ReferenceLayerStore" = Depends(get_reference_store)):
+    """Version of the reference data the evaluations run against and, if it is a snapshot, its manifest."""
+    snapshot = store.snapshot
+    return {
+        "version": store.version(),
+        "snapshot": snapshot.version if snapshot is not None else None,
+        "manifest": snapshot.manifest if snapshot is not None else None,
     }
+
+
+@router.get("/evaluate/cache")
+def analysis_cache_stats(cache: "AnalysisCache" = Depends(get_analysis_cache)):
+    return cache.stats()
+
+
+@router.get("/reports/cache")
+def report_cache_stats(jobs: "ReportJobRegistry" = Depends(get_report_jobs)):
+    if jobs.cache is None:
+        return {"backend": None}
+    return jobs.cache.stats()
+
+
+@router.get("/reports/{job_id}")
+def get_report(job_id: str, jobs: "ReportJobRegistry" = Depends(get_report_jobs)):
+    job = _get_job_or_404(jobs, job_id)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "report": job.report,
+        "error": job.error,
+        "fallback": job.fallback,
+    }
+
+
+@router.get("/reports/{job_id}/stream")
+async def stream_report_events(job_id: str, jobs: "ReportJobRegistry" = Depends(get_report_jobs)):
+    """
+    Server-sent events: one 'data' event per text delta, then a final 'done' or 'failed' event.
+    If the LLM failed and the template fallback was used, the final event carries the full report.
+    """
+    job = _get_job_or_404(jobs, job_id)
+
+    async def events():
+        async for chunk in job.iter_chunks():
+            yield f"data: {json.dumps({'delta': chunk})}\n\n"
+        final = {"error": job.error, "fallback": job.fallback, "report": job.report if job.fallback else None}
+        yield f"event: {job.status}\ndata: {json.dumps(final)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _generate_report_sync(geo_metrics: dict, rule_results: dict, report_mode: str, jobs: "ReportJobRegistry") -> str:
+    from app.llm.agent import generate_report
+    from app.llm.template import render_template_report
+
+    if report_mode == "template":
+        return render_template_report(geo_metrics, rule_results)
+    try:
+        return generate_report(geo_metrics, rule_results, cache=jobs.cache)
+    except Exception:
+        if not jobs.fallback_to_template:
+            raise
+        return render_template_report(geo_metrics, rule_results)
+
+
+@router.post("/evaluate/batch")
+def evaluate_sites_batch(
+        payload: BatchEvaluationRequest,
+        store: "ReferenceLayerStore" = Depends(get_reference_store),
+        jobs: "ReportJobRegistry" = Depends(get_report_jobs),
+):
+    """Evaluates every feature of the collection as an independent site."""
+    from app.rules.engine import evaluate_rules_batch
+
+    with stage("parse_site"):
+        sites_gdf = _site_gdf_from_geojson(payload.sites_geojson)
+    metrics_df = _analyze_sites_by_crs(sites_gdf, _batch_layers(store))
+    rules_df = evaluate_rules_batch(metrics_df)
+
+    results = []
+    for site_index, (geo_metrics, rule_results) in enumerate(_batch_records(metrics_df, rules_df)):
+        result = {
+            "site_index": site_index,
+            "geo_metrics": geo_metrics,
+            "rule_results": rule_results,
+        }
+        if payload.include_report:
+            result["report"] = _generate_report_sync(geo_metrics, rule_results, payload.report_mode, jobs)
+        results.append(result)
+
+    return {"dataset_version": store.version(), "results": results}
+
+
+def _batch_layers(store: "ReferenceLayerStore"):
+    """
+    Returns layers(crs, geometries): settlements, protected areas and constraint sources in an analysis CRS
+    for a group of sites (TARGET_CRS). In-memory stores return their projected layers, windowed ones a
+    window covering the sites.
+    """
+    from app.rules.engine import get_rule_set
+
+    settlement_types = get_rule_set().typed_distances("distance_to_settlements_m").values()
+
+    def layers(crs: str, geometries) -> tuple["gpd.GeoDataFrame", "gpd.GeoDataFrame", dict]:
+        with stage("load_layers"):
+            return (
+                *store.layers_for_sites(geometries, crs, settlement_types),
+                store.constraint_sources_for_sites(geometries, crs),
+            )
+
+    return layers
+
+
+def _analyze_sites_by_crs(sites_gdf: "gpd.GeoDataFrame", layers) -> "pd.DataFrame":
+    """
+    analyze_sites_batch for sites (TARGET_CRS) that may lie in several zones: each group is analyzed in
+    its analysis CRS against layers(crs, geometries), the reference layers in that CRS.
+    """
+    import numpy as np
+    import pandas as pd
+    from app.geo.analysis import analyze_sites_batch
+    from app.rules.engine import get_rule_set
+
+    typed_distances = get_rule_set().typed_distances("distance_to_settlements_m")
+    crs_per_site = _analysis_crs(sites_gdf.geometry.values)
+    groups = [np.flatnonzero(crs_per_site == crs) for crs in dict.fromkeys(crs_per_site)]
+    if len(groups) <= 1:
+        crs = crs_per_site[0] if len(sites_gdf) else TARGET_CRS
+        with stage("analysis_batch"):
+            return analyze_sites_batch(
+                sites_gdf, *layers(crs, sites_gdf.geometry.values), crs=crs, typed_distances=typed_distances
+            )
+
+    frames = []
+    for idx in groups:
+        crs = crs_per_site[idx[0]]
+        site_layers = layers(crs, sites_gdf.geometry.values[idx])
+        with stage("analysis_batch"):
+            frames.append(
+                analyze_sites_batch(sites_gdf.iloc[idx], *site_layers, crs=crs, typed_distances=typed_distances)
+            )
+    # Back to the order of the sites
+    return pd.concat(frames).iloc[np.argsort(np.concatenate(groups), kind="stable")]
+
+
+def _batch_records(metrics_df, rules_df) -> zip:
+    """Pairs of (geo_metrics, rule_results) dicts per site from the batch analysis and rule frames."""
+    # NaN distances (no settlement layer) are reported as null
+    metrics_records = metrics_df.astype(object).where(metrics_df.notna(), None).to_dict("records")
+    return zip(metrics_records, rules_df.to_dict("records"))
+
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that may be sent while the request body is still being read. The default one
+    listens for a disconnect on receive() (ASGI < 2.4), which would swallow the remaining body.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+
+def _evaluate_sites_chunk(sites_gdf: "gpd.GeoDataFrame", layers, dataset_version: str) -> str:
+    """
+    NDJSON result lines of one chunk of sites; the index of sites_gdf holds the site indices.
+    layers(crs, geometries) returns the reference layers in an analysis CRS (see _batch_layers).
+    """
+    from app.geo.crs import to_crs
+    from app.rules.engine import evaluate_rules_batch
+
+    metrics_df = _analyze_sites_by_crs(to_crs(sites_gdf, TARGET_CRS), layers)
+    rules_df = evaluate_rules_batch(metrics_df)
+    lines = []
+    for site_index, site_id, (geo_metrics, rule_results) in zip(
+            sites_gdf.index, sites_gdf["id"], _batch_records(metrics_df, rules_df)
+    ):
+        record = {
+            "site_index": int(site_index),
+            "id": site_id,
+            "dataset_version": dataset_version,
+            "geo_metrics": geo_metrics,
+            "rule_results": rule_results,
+        }
+        lines.append(json.dumps(record, default=str) + "\n")
+    return "".join(lines)
+
+
+def _parse_site_line(line: bytes) -> dict:
+    """One NDJSON site (Feature or geometry); raises ValueError if it is not JSON or holds no valid geometry."""
+    from shapely.geometry import shape
+
+    try:
+        feature = json.loads(line)
+        if not isinstance(feature, dict):
+            raise ValueError("expected a GeoJSON object")
+    except ValueError as e:
+        raise ValueError(f"Invalid line: {e}")
+    geometry = feature.get("geometry") if feature.get("type") == "Feature" else feature
+    try:
+        if not isinstance(geometry, dict):
+            raise ValueError("missing geometry")
+        shape(geometry)
+    except Exception as e:
+        # shape() raises all kinds of errors for malformed geometries
+        raise ValueError(f"Invalid geometry: {e}")
+    return feature
+
+
+async def _ndjson_site_chunks(request: Request, chunk_size: int) -> AsyncIterator["gpd.GeoDataFrame | str"]:
+    """
+    Reads newline-delimited GeoJSON features from the request body as it arrives and yields them as
+    GeoDataFrames of up to chunk_size sites. Lines that are not valid JSON objects or hold no valid
+    GeoJSON geometry are yielded as ready error lines instead.
+    """
+    from app.geo.parser import features_to_geodataframe
+
+    buffer, features, indices, site_index = b"", [], [], 0
+
+    def flush() -> "gpd.GeoDataFrame":
+        gdf = features_to_geodataframe(features)
+        gdf.index = list(indices)
+        features.clear()
+        indices.clear()
+        return gdf
+
+    async def lines() -> AsyncIterator[bytes]:
+        nonlocal buffer
+        async for data in request.stream():
+            buffer += data
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                yield line
+        yield buffer
+
+    async for line in lines():
+        if not line.strip():
+            continue
+        try:
+            feature = _parse_site_line(line)
+        except ValueError as e:
+            yield json.dumps({"site_index": site_index, "error": str(e)}) + "\n"
+        else:
+            features.append(feature)
+            indices.append(site_index)
+            if len(features) >= chunk_size:
+                yield flush()
+        site_index += 1
+    if features:
+        yield flush()
+
+
+async def _parquet_site_chunks(request: Request, chunk_size: int) -> AsyncIterator["gpd.GeoDataFrame"]:
+    """Spools an uploaded GeoParquet file to disk (its footer comes last) and yields it in record batches."""
+    from app.geo.parser import iter_geoparquet_chunks
+
+    with tempfile.TemporaryFile() as spool:
+        async for data in request.stream():
+            spool.write(data)
+        spool.seek(0)
+        batches, offset = iter_geoparquet_chunks(spool, chunk_size), 0
+        while (gdf := await run_in_threadpool(next, batches, None)) is not None:
+            gdf.index = range(offset, offset + len(gdf))
+            offset += len(gdf)
+            yield gdf
+
+
+@router.post("/evaluate/stream")
+async def evaluate_sites_stream(
+        request: Request,
+        chunk_size: int = Query(SITE_STREAM_CHUNK_SIZE, ge=1, le=100_000),
+        store: "ReferenceLayerStore" = Depends(get_reference_store),
+):
+    """
+    Evaluates a very large number of sites without holding them in memory. The body is either
+    newline-delimited GeoJSON (one Feature or geometry per line, WGS84) or a GeoParquet file
+    (Content-Type application/vnd.apache.parquet). Sites are analyzed in chunks of chunk_size and
+    the results stream back as NDJSON, one line per site with its site_index (position in the
+    upload), id, geo_metrics and rule_results, as soon as each chunk is done.
+    """
+    is_parquet = request.headers.get("content-type", "").split(";")[0].strip() in PARQUET_CONTENT_TYPES
+    if is_parquet:
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="GeoParquet input requires pyarrow to be installed.")
+
+    async def results() -> AsyncIterator[str]:
+        layers = _batch_layers(store)
+        dataset_version = await run_in_threadpool(store.version)
+        chunks = _parquet_site_chunks(request, chunk_size) if is_parquet else _ndjson_site_chunks(request, chunk_size)
+        try:
+            async for chunk in chunks:
+                if isinstance(chunk, str):
+                    yield chunk
+                else:
+                    yield await run_in_threadpool(
+                        _evaluate_sites_chunk, chunk, layers, dataset_version
+                    )
+        except Exception as e:
+            # The status line is already sent, so a failure ends the stream with an error line.
+            yield json.dumps({"error": str(e) or type(e).__name__}) + "\n"
+
+    return _DuplexStreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.post("/suitability")
+def suitability_grid(
+        payload: SuitabilityRequest,
+        store: "ReferenceLayerStore" = Depends(get_reference_store),
+        pool: "ProcessPoolExecutor | None" = Depends(get_raster_pool),
+):
+    """
+    Returns a raster of settlement distance, protected-area flag and rule compliance over a bbox.
+    With SUITABILITY_WORKERS > 1 the grid is computed in the app's process pool. Unlike the site
+    endpoints, the grid and its distances are always in TARGET_CRS (ANALYSIS_CRS does not apply).
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
+    from app.geo.raster import compute_suitability_grid, grid_to_geotiff, grid_to_npz
+    from app.geo.store import resolve_layer_path
+    from app.rules.engine import get_rule_set
+
+    bbox = gpd.GeoSeries([box(*payload.bbox)], crs=payload.bbox_crs).to_crs(TARGET_CRS).total_bounds
+    rules = get_rule_set()
+
+    try:
+        with stage("suitability_grid"):
+            if pool is not None:
+                layers = (None, None)
+                layer_files = (
+                    resolve_layer_path(store.paths["settlements"]),
+                    resolve_layer_path(store.paths["protected_areas"]),
+                )
+            else:
+                # Cell centres lie within the bbox grown by one cell (the grid is rounded up).
+                layers = store.layers_for_bbox(
+                    (bbox[0] - payload.cell_size_m, bbox[1] - payload.cell_size_m,
+                     bbox[2] + payload.cell_size_m, bbox[3] + payload.cell_size_m)
+                )
+                layer_files = None
+            grid = compute_suitability_grid(
+                tuple(bbox),
+                payload.cell_size_m,
+                *layers,
+                min_distance_to_settlements_m=rules.min_distance("distance_to_settlements_m"),
+                no_build_in_protected_area=rules.forbids_overlap("overlaps_protected_area"),
+                pool=pool,
+                layer_files=layer_files,
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if payload.format == "geotiff":
+        try:
+            content = grid_to_geotiff(grid)
+        except ImportError:
+            raise HTTPException(status_code=501, detail="GeoTIFF output requires rasterio to be installed.")
+        return Response(
+            content=content,
+            media_type="image/tiff",
+            headers={"Content-Disposition": 'attachment; filename="suitability.tif"'},
+        )
+
+    return Response(
+        content=grid_to_npz(grid),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="suitability.npz"'},
+    )
+
+
+def _layout_exclusions(store: "ReferenceLayerStore", parcel, rules, crs: str | None = None) -> list:
+    """
+    Exclusion zones (in crs), one per rule and restricted to the feature types it checks: min_distance rules
+    buffer their layer, forbidden overlaps exclude the features themselves and buffer rules with max_count 0
+    exclude the layer's buffer. Rules on metrics the analysis does not compute are skipped.
+    """
+    from app.geo.analysis import CONSTRAINT_LAYERS
+    from app.geo.layout import ExclusionZone
+    from app.rules.engine import BufferRule, ForbiddenOverlapRule, MinDistanceRule
+
+    # metric -> (source layer, feature types the metric covers, buffer)
+    metric_layers = {
+        "distance_to_settlements_m": ("settlements", None, 0.0),
+        "overlaps_settlements": ("settlements", None, 0.0),
+        "distance_to_protected_areas_m": ("protected_areas", None, 0.0),
+        "overlaps_protected_area": ("protected_areas", None, 0.0),
+    }
+    for layer in CONSTRAINT_LAYERS.values():
+        for metric in (f"distance_to_{layer.name}_m", f"overlaps_{layer.name}", f"{layer.name}_within_buffer_count"):
+            metric_layers[metric] = (layer.source, layer.types, layer.buffer_m)
+
+    exclusions = []
+    for rule in rules.rules:
+        if rule.metric not in metric_layers:
+            continue
+        source, layer_types, buffer_m = metric_layers[rule.metric]
+        if isinstance(rule, MinDistanceRule) and rule.min_m > 0:
+            # only the settlement distance is measured per type (see RuleSet.typed_distances)
+            if rule.types is not None and rule.metric != "distance_to_settlements_m":
+                continue
+            distance, rule_types = rule.min_m, rule.types
+        elif isinstance(rule, ForbiddenOverlapRule):
+            # a type filter without the metric holding the overlapped types never applies
+            if rule.types is not None and rule.type_metric is None:
+                continue
+            distance, rule_types = 0.0, rule.types
+        elif isinstance(rule, BufferRule) and rule.max_count == 0 and rule.metric.endswith("_within_buffer_count"):
+            distance, rule_types = buffer_m, None
+        else:
+            continue
+
+        if layer_types is None or rule_types is None:
+            types = layer_types if rule_types is None else tuple(sorted(rule_types))
+        else:
+            types = tuple(sorted(set(layer_types) & rule_types))
+        if types != () and store.available(source):
+            exclusions.append(ExclusionZone(store.features_near(source, parcel, distance, crs), distance, types))
+    return exclusions
+
+
+def _optimize_layout(payload: LayoutRequest, store: "ReferenceLayerStore") -> dict:
+    """Turbine layout of a parcel with per-turbine metrics and rule results (from the batch analysis)."""
+    import geopandas as gpd
+    import numpy as np
+    from app.geo.analysis import analyze_sites_batch
+    from app.geo.crs import to_crs, transform_geometries
+    from app.geo.layout import optimize_layout
+    from app.rules.engine import evaluate_rules_batch, get_rule_set
+
+    with stage("parse_site"):
+        parcel_gdf = _site_gdf_from_geojson(payload.site_geojson)
+        if parcel_gdf.empty:
+            raise ValueError("The site contains no geometry.")
+        parcel = parcel_gdf.union_all()
+        # Spacing and distances are laid out in the parcel's own metric CRS
+        crs = _analysis_crs([parcel])[0]
+        local_parcel = transform_geometries([parcel], TARGET_CRS, crs)[0]
+    rules = get_rule_set()
+    typed_distances = rules.typed_distances("distance_to_settlements_m")
+    with stage("load_layers"):
+        exclusions = _layout_exclusions(store, parcel, rules, crs)
+    with stage("layout"):
+        layout = optimize_layout(
+            local_parcel, exclusions, payload.spacing_m, payload.time_budget_s, payload.max_turbines
+        )
+
+    turbines_gdf = gpd.GeoDataFrame(geometry=gpd.points_from_xy(*layout.positions.T), crs=crs)
+    with stage("load_layers"):
+        settlements, protected_areas = store.layers_for_site(parcel, crs, typed_distances.values())
+        constraint_sources = store.constraint_sources(parcel, crs)
+    with stage("analysis_batch"):
+        metrics_df = analyze_sites_batch(
+            turbines_gdf, settlements, protected_areas, constraint_sources, crs=crs, typed_distances=typed_distances
+        )
+    rules_df = evaluate_rules_batch(metrics_df)
+
+    lon_lat = to_crs(turbines_gdf.geometry, "EPSG:4326")
+    turbines = []
+    for i, (geo_metrics, rule_results) in enumerate(_batch_records(metrics_df, rules_df)):
+        nearest = layout.nearest_turbine_m[i]
+        turbines.append({
+            "index": i,
+            "lon": lon_lat.x.iloc[i],
+            "lat": lon_lat.y.iloc[i],
+            "nearest_turbine_m": None if np.isnan(nearest) else float(nearest),
+            "geo_metrics": geo_metrics,
+            "rule_results": rule_results,
+        })
+
+    result = {
+        "dataset_version": store.version(),
+        "analysis_crs": crs,
+        "turbine_count": len(turbines),
+        "spacing_m": layout.spacing_m,
+        "parcel_area_m2": local_parcel.area,
+        "buildable_area_m2": layout.buildable_area.area,
+        "restarts": layout.restarts,
+        "elapsed_s": layout.elapsed_s,
+        "turbines": turbines,
+    }
+    if payload.include_buildable_area:
+        buildable = to_crs(gpd.GeoSeries([layout.buildable_area], crs=crs), "EPSG:4326")
+        result["buildable_area"] = buildable.iloc[0].__geo_interface__
+    return result
+
+
+@router.post("/layout")
+async def layout_turbines(payload: LayoutRequest, store: "ReferenceLayerStore" = Depends(get_reference_store)):
+    """
+    Places as many turbines as possible in a parcel: the buildable area is the parcel minus the
+    exclusion zones of the rules (settlement distance, forbidden protected areas, constraint layers),
+    and turbines keep spacing_m to each other. The search stops after time_budget_s. Returns the
+    positions (WGS84) with per-turbine metrics and rule results.
+    """
+    try:
+        result = await run_in_threadpool(_optimize_layout, payload, store)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with stage("serialize"):
+        return _json_response(result)
+
+
+@router.get("/tiles/{layer}/{z}/{x}/{y}.mvt")
+def get_vector_tile(layer: str, z: int, x: int, y: int, tiles: "VectorTileStore" = Depends(get_tile_store)):
+    """Mapbox Vector Tile of a reference layer, served from the MBTiles cache (rendered once on a miss)."""
+    try:
+        data = tiles.get_tile(layer, z, x, y)
+    except (KeyError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail=f"Unknown or unavailable tile layer '{layer}'.")
+    return Response(
+        content=data,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"Cache-Control": "public, max-age=3600"},
+    )
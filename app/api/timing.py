@@ -0,0 +1,77 @@
+import cProfile
+import io
+import pstats
+import time
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool as _run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import get_settings
+from app.core.metrics import REQUEST_DURATION, request_profilers, request_timings
+
+# Number of functions listed in a ?profile=1 dump.
+PROFILE_TOP_FUNCTIONS = 60
+
+
+def _profiled(func, *args):
+    profilers = request_profilers.get()
+    if profilers is None:
+        return func(*args)
+    profiler = cProfile.Profile()
+    profilers.append(profiler)
+    return profiler.runcall(func, *args)
+
+
+async def run_in_threadpool(func, *args):
+    """Like fastapi's run_in_threadpool, but the call is profiled as well when the request asked for it."""
+    return await _run_in_threadpool(_profiled, func, *args)
+
+
+def _server_timing(timings: dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    return ", ".join(entries + [f"total;dur={total * 1000:.1f}"])
+
+
+def _profile_report(profilers: list[cProfile.Profile]) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(profilers[0], stream=out)
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    return out.getvalue()
+
+
+async def timing_middleware(request: Request, call_next):
+    """
+    Measures every request and adds a Server-Timing header with the stages it went through.
+    With ?profile=1 (if settings.allow_request_profiling) the response is replaced by a cProfile
+    report of the request. The event-loop thread profile includes whatever else ran concurrently.
+    """
+    timings: dict[str, float] = {}
+    timings_token = request_timings.set(timings)
+    profilers = None
+    if get_settings().allow_request_profiling and request.query_params.get("profile") == "1":
+        profilers = [cProfile.Profile()]
+        profilers_token = request_profilers.set(profilers)
+        profilers[0].enable()
+
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if profilers is not None:
+            profilers[0].disable()
+            request_profilers.reset(profilers_token)
+        request_timings.reset(timings_token)
+    total = time.perf_counter() - started
+
+    # Routes are labelled by endpoint name: the route template in the scope lacks the router prefix.
+    route = request.scope.get("route")
+    REQUEST_DURATION.observe(
+        total, method=request.method, route=route.name if route else "unmatched", status=response.status_code
+    )
+    if profilers is not None:
+        response = PlainTextResponse(_profile_report(profilers))
+    response.headers["Server-Timing"] = _server_timing(timings, total)
+    return response
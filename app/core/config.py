@@ -1,17 +1,72 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
+from typing import Literal
 
 
 class Settings(BaseSettings):
-    openai_api_key: str = Field(..., validation_alias="OPENAI_API_KEY")
+    # Only needed for LLM reports; without it they fall back to the template report
+    openai_api_key: str | None = Field(None, validation_alias="OPENAI_API_KEY")
+    # Point this at any OpenAI-compatible server, e.g. a local fake for tests
+    openai_base_url: str | None = Field(None, validation_alias="OPENAI_BASE_URL")
     environment: str = "local"
 
+    llm_model: str = "gpt-4.1-mini"
+    llm_max_output_tokens: int = 2000
+    # Maximum number of report completions in flight at the same time
+    llm_max_concurrency: int = 4
+    # Reports taking longer than this (or failing) fall back to the template report
+    llm_timeout_s: float = 30.0
+    llm_fallback_to_template: bool = True
+
+    # Report cache: "memory" (LRU), "sqlite" (on disk) or "none"
+    report_cache_backend: Literal["memory", "sqlite", "none"] = "memory"
+    report_cache_path: str = "data/cache/reports.sqlite3"
+    report_cache_max_entries: int = 1024
+    report_cache_ttl_s: float | None = 7 * 24 * 3600
+    # Distances are rounded to this step (in metres) before hashing
+    report_cache_distance_precision_m: float = 1.0
+
+    # "memory" keeps the reference layers in RAM, "windowed" reads per-site windows from disk,
+    # "shared" memory-maps packed layers shared by all worker processes (uvicorn --workers N)
+    reference_loading: Literal["memory", "windowed", "shared"] = "memory"
+    reference_tile_size_m: float = 10_000
+    reference_max_tiles: int = 64
+    # How often the app checks data/processed/snapshots/CURRENT for a newly published snapshot (0 = never)
+    snapshot_poll_s: float = 10.0
+
+    # Metric CRS the distances are measured in: "auto" picks the UTM zone of each site, or a fixed
+    # CRS such as "EPSG:25832" for all sites
+    analysis_crs: str = "auto"
+
+    # Worker processes shared by all /suitability requests; 1 computes the grid in the request thread
+    suitability_workers: int = 1
+
+    # Upper bound for cached analyze_site results (approximate JSON size)
+    analysis_cache_max_bytes: int = 64 * 1024 * 1024
+
+    # Every /evaluate result is stored here (SQLite) and can be browsed via /evaluations
+    evaluation_store_enabled: bool = True
+    evaluation_store_path: str = "data/cache/evaluations.sqlite3"
+    evaluation_store_pool_size: int = 4
+
+    # Origins allowed to fetch /api/tiles cross-origin (the Streamlit frontend's map)
+    tile_cors_origins: list[str] = ["http://localhost:8501", "http://127.0.0.1:8501"]
+
+    # Requests arriving while the app is still starting up wait this long for it before getting a 503
+    startup_wait_s: float = 60.0
+
+    # Lets any request append ?profile=1 to get a cProfile report instead of its response (opt-in,
+    # e.g. ALLOW_REQUEST_PROFILING=true on a staging instance)
+    allow_request_profiling: bool = False
+
     model_config = SettingsConfigDict(
         env_file=".env",
         extra="ignore",
     )
 
 
-settings = Settings()
-
-
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """The settings, read from the environment and .env on first use."""
+    return Settings()
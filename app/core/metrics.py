@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import bisect
+import cProfile
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per label combination."""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            counts, totals = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, totals) in sorted(self._series.items()):
+                labels = ",".join(f'{name}="{label}"' for name, label in zip(self.label_names, key))
+                cumulative = 0
+                for bound, count in zip([*map(str, self.buckets), "+Inf"], counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{labels}}} {totals[0]}")
+                lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Prometheus-style counter with one series per label combination."""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = ",".join(f'{name}="{label}"' for name, label in zip(self.label_names, key))
+                lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "windgpt_request_duration_seconds", "HTTP request latency.", ("method", "route", "status")
+)
+STAGE_DURATION = Histogram(
+    "windgpt_stage_duration_seconds", "Latency of the processing stages of a request.", ("stage",)
+)
+LLM_TOKENS = Counter("windgpt_llm_tokens_total", "Tokens used by report completions.", ("model", "kind"))
+
+_METRICS = (REQUEST_DURATION, STAGE_DURATION, LLM_TOKENS)
+
+# Stage timings of the current request (stage name -> seconds), set by the timing middleware.
+request_timings: ContextVar[dict[str, float] | None] = ContextVar("request_timings", default=None)
+
+# Profilers of the current ?profile=1 request; worker threads add their own (cProfile is per thread).
+request_profilers: ContextVar[list[cProfile.Profile] | None] = ContextVar("request_profilers", default=None)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in _METRICS for line in metric.render()) + "\n"
+
+
+def record_llm_usage(model: str, usage) -> None:
+    """Adds the token counts of an OpenAI response's usage object to the LLM token counter."""
+    if usage is None:
+        return
+    for kind in ("input_tokens", "output_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            LLM_TOKENS.inc(value, model=model, kind=kind.removesuffix("_tokens"))
+
+
+@contextmanager
+def stage(name: str):
+    """Times a block: recorded in the stage histogram and in the current request's Server-Timing header."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
@@ -0,0 +1,275 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from SQLite at a time while streaming a listing.
+FETCH_SIZE = 200
+
+# Queued writes committed together in one transaction.
+WRITE_BATCH_SIZE = 100
+
+SUMMARY_COLUMNS = "id, created_at, is_compliant, geo_metrics, rule_results, report_status, min_x, min_y, max_x, max_y"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    is_compliant INTEGER,
+    dataset_version TEXT,
+    min_x REAL, min_y REAL, max_x REAL, max_y REAL,
+    site_geojson TEXT NOT NULL,
+    geo_metrics TEXT NOT NULL,
+    rule_results TEXT NOT NULL,
+    constraints TEXT,
+    nearest_settlements TEXT,
+    report TEXT,
+    report_status TEXT,
+    map_data TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS evaluations_bbox USING rtree(rowid, min_x, max_x, min_y, max_y);
+"""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=lambda o: o.item() if isinstance(o, np.generic) else str(o))
+
+
+def geojson_bounds(geojson: dict) -> tuple[float, float, float, float] | None:
+    """Bounding box of a site given as FeatureCollection, Feature or raw geometry, or None if it has no geometry."""
+    if geojson.get("type") == "FeatureCollection":
+        geometries = [feature.get("geometry") for feature in geojson.get("features") or []]
+    elif geojson.get("type") == "Feature":
+        geometries = [geojson.get("geometry")]
+    else:
+        geometries = [geojson]
+    try:
+        bounds = shapely.bounds(shapely.union_all([shape(g) for g in geometries if g]))
+    except (AttributeError, KeyError, TypeError, ValueError, shapely.errors.GEOSException):
+        return None
+    if np.isnan(bounds).any():
+        return None
+    return tuple(float(v) for v in bounds)
+
+
+class EvaluationStore:
+    """
+    Persists evaluation results in a SQLite database (WAL mode). Writes are queued and committed by
+    a background thread in batches, so requests never wait for the disk. Reads use a small pool of
+    connections and stream rows in chunks. Site bounding boxes (WGS84) are kept in an R*Tree index
+    for area searches.
+    """
+
+    def __init__(self, path: str | Path, pool_size: int = 4):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        writer = self._connect()
+        writer.executescript(_SCHEMA)
+        self._writer = writer
+
+        self._pool: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        self._writes: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, name="evaluation-store-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    # --- Writing (background thread) ---
+
+    def save(self, site_geojson: dict, result: dict, dataset_version: str | None = None) -> str:
+        """Queues an evaluation (an /evaluate response) for storage and returns its id right away."""
+        evaluation_id = uuid.uuid4().hex
+        self._writes.put(("save", evaluation_id, time.time(), site_geojson, result, dataset_version))
+        return evaluation_id
+
+    def set_report(self, evaluation_id: str, report: str | None, status: str) -> None:
+        """Queues the (later finished) report of an evaluation."""
+        self._writes.put(("report", evaluation_id, report, status))
+
+    def flush(self) -> None:
+        """Blocks until every queued write is committed."""
+        self._writes.join()
+
+    def close(self) -> None:
+        self._writes.put(None)
+        self._thread.join()
+        self._writer.close()
+        while not self._pool.empty():
+            self._pool.get().close()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write_batch([item for item in batch if item is not None])
+            except Exception:
+                logger.exception("Failed to store %d evaluation writes", len(batch))
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch: list[tuple]) -> None:
+        conn = self._writer
+        conn.execute("BEGIN")
+        try:
+            for item in batch:
+                if item[0] == "save":
+                    self._insert(conn, *item[1:])
+                else:
+                    _, evaluation_id, report, status = item
+                    conn.execute(
+                        "UPDATE evaluations SET report = ?, report_status = ? WHERE id = ?",
+                        (report, status, evaluation_id),
+                    )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _insert(conn, evaluation_id, created_at, site_geojson, result, dataset_version) -> None:
+        site_bounds = geojson_bounds(site_geojson)
+        bounds = site_bounds or (None, None, None, None)
+        report = result.get("report")
+        is_compliant = result["rule_results"].get("is_compliant")
+        cursor = conn.execute(
+            "INSERT INTO evaluations (id, created_at, is_compliant, dataset_version, min_x, min_y, max_x, max_y, "
+            "site_geojson, geo_metrics, rule_results, constraints, nearest_settlements, report, report_status, map_data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                evaluation_id,
+                created_at,
+                None if is_compliant is None else bool(is_compliant),
+                dataset_version,
+                *bounds,
+                _dumps(site_geojson),
+                _dumps(result["geo_metrics"]),
+                _dumps(result["rule_results"]),
+                _dumps(result.get("constraints")),
+                _dumps(result.get("nearest_settlements")),
+                report,
+                "done" if report is not None else "pending",
+                _dumps(result.get("map_data")),
+            ),
+        )
+        if site_bounds is not None:
+            min_x, min_y, max_x, max_y = site_bounds
+            conn.execute(
+                "INSERT INTO evaluations_bbox (rowid, min_x, max_x, min_y, max_y) VALUES (?, ?, ?, ?, ?)",
+                (cursor.lastrowid, min_x, max_x, min_y, max_y),
+            )
+
+    # --- Reading ---
+
+    @staticmethod
+    def _summary(row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "created_at": row["created_at"],
+            "is_compliant": None if row["is_compliant"] is None else bool(row["is_compliant"]),
+            "report_status": row["report_status"],
+            "bbox": None if row["min_x"] is None else [row["min_x"], row["min_y"], row["max_x"], row["max_y"]],
+            "geo_metrics": json.loads(row["geo_metrics"]),
+            "rule_results": json.loads(row["rule_results"]),
+        }
+
+    def get(self, evaluation_id: str) -> dict | None:
+        """The complete stored evaluation, or None."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM evaluations WHERE id = ?", (evaluation_id,)).fetchone()
+        if row is None:
+            return None
+        evaluation = self._summary(row)
+        evaluation.update(
+            dataset_version=row["dataset_version"],
+            site_geojson=json.loads(row["site_geojson"]),
+            constraints=json.loads(row["constraints"]) if row["constraints"] else None,
+            nearest_settlements=json.loads(row["nearest_settlements"]) if row["nearest_settlements"] else None,
+            report=row["report"],
+            map_data=json.loads(row["map_data"]) if row["map_data"] else None,
+        )
+        return evaluation
+
+    def _cursor_rowid(self, evaluation_id: str | None) -> int | None:
+        """Row id of a pagination cursor; raises KeyError for an unknown evaluation."""
+        if evaluation_id is None:
+            return None
+        with self._connection() as conn:
+            row = conn.execute("SELECT rowid FROM evaluations WHERE id = ?", (evaluation_id,)).fetchone()
+        if row is None:
+            raise KeyError(evaluation_id)
+        return row[0]
+
+    def _iter_query(self, where: str, params: list, before: str | None, limit: int) -> Iterator[dict]:
+        # Resolved eagerly so an unknown cursor raises here and not once streaming started.
+        before_rowid = self._cursor_rowid(before)
+        if before_rowid is not None:
+            where += (" AND " if where else "") + "evaluations.rowid < ?"
+            params = [*params, before_rowid]
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM evaluations {'WHERE ' + where if where else ''} ORDER BY evaluations.rowid DESC LIMIT ?"
+        return self._iter_rows(sql, [*params, limit])
+
+    def _iter_rows(self, sql: str, params: list) -> Iterator[dict]:
+        with self._connection() as conn:
+            cursor = conn.execute(sql, params)
+            try:
+                while rows := cursor.fetchmany(FETCH_SIZE):
+                    for row in rows:
+                        yield self._summary(row)
+            finally:
+                cursor.close()
+
+    def iter_evaluations(self, limit: int = 100, before: str | None = None) -> Iterator[dict]:
+        """Summaries, newest first. Pass the id of the last summary as before to get the next page."""
+        return self._iter_query("", [], before, limit)
+
+    def iter_in_area(
+            self,
+            bbox: tuple[float, float, float, float],
+            limit: int = 100,
+            before: str | None = None,
+    ) -> Iterator[dict]:
+        """Summaries of evaluations whose site bbox intersects bbox (WGS84), newest first."""
+        min_x, min_y, max_x, max_y = bbox
+        where = (
+            "evaluations.rowid IN (SELECT rowid FROM evaluations_bbox "
+            "WHERE min_x <= ? AND max_x >= ? AND min_y <= ? AND max_y >= ?)"
+        )
+        return self._iter_query(where, [max_x, min_x, max_y, min_y], before, limit)
@@ -2,15 +2,36 @@ import streamlit as st
 import requests
 import json
 import folium
+from folium.plugins import VectorGridProtobuf
 from streamlit_folium import st_folium
 BACKEND_URL = "http://localhost:8000"
 
+# Reference layers served as vector tiles by /api/tiles, with their overlay name and style.
+REFERENCE_TILE_LAYERS = {
+    "protected_areas": ("Alle Schutzgebiete", {"fill": True, "fillColor": "#2ca02c", "color": "#2ca02c", "weight": 1, "fillOpacity": 0.15}),
+    "settlements": ("Alle Siedlungen", {"fill": True, "fillColor": "#ff7f0e", "color": "#ff7f0e", "weight": 1, "fillOpacity": 0.3}),
+}
 
-def create_folium_map(map_data, metrics):
+
+def add_reference_tiles(m):
+    """Adds the complete reference layers as vector tile overlays (rendered by the backend, not per request)."""
+    for layer, (name, style) in REFERENCE_TILE_LAYERS.items():
+        VectorGridProtobuf(
+            f"{BACKEND_URL}/api/tiles/{layer}/{{z}}/{{x}}/{{y}}.mvt",
+            name,
+            {"vectorTileLayerStyles": {layer: style}, "interactive": False},
+            show=False,
+        ).add_to(m)
+
+
+def create_folium_map(map_data, metrics, show_reference_tiles=True):
     """Generates a Folium map with styled GeoJSON layers and dynamic zoom."""
     m = folium.Map(location=[51.1657, 10.4515], zoom_start=6)
     all_bounds = []
 
+    if show_reference_tiles:
+        add_reference_tiles(m)
+
     # Protected Areas
     if map_data.get("protected_areas"):
         pa_layer = folium.GeoJson(
@@ -128,15 +149,41 @@ def create_folium_map(map_data, metrics):
     return m
 
 
+def stream_report(job_id):
+    """Yields report text deltas from the backend's server-sent event stream."""
+    with requests.get(f"{BACKEND_URL}/api/reports/{job_id}/stream", stream=True, timeout=120) as resp:
+        resp.raise_for_status()
+        event = "message"
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+            elif line.startswith("data:"):
+                payload = json.loads(line.split(":", 1)[1])
+                if event == "message":
+                    yield payload["delta"]
+                elif event == "failed":
+                    yield f"\n\n*Bericht konnte nicht erstellt werden: {payload['error']}*"
+                elif payload.get("fallback"):
+                    yield "\n\n*KI-Bericht nicht verfügbar, automatisch erstellter Bericht:*\n\n"
+                    yield payload["report"]
+
+
 st.title("WindGPT - Standortprüfung")
 uploaded_file = st.file_uploader("Standortdatei (GeoJSON)", type=["geojson"])
+report_mode = st.radio(
+    "Berichtsmodus",
+    options=["llm", "template"],
+    format_func=lambda mode: "KI-Bericht" if mode == "llm" else "Vorlage (offline)",
+    horizontal=True,
+)
 
 if st.button("Standort bewerten"):
     if uploaded_file is not None:
         try:
             geojson_data = json.load(uploaded_file)
             payload = {
-                "site_geojson": geojson_data
+                "site_geojson": geojson_data,
+                "report_mode": report_mode,
             }
             with st.spinner("Analysiere Standort"):
                 resp = requests.post(
@@ -156,7 +203,10 @@ if st.button("Standort bewerten"):
                 else:
                     st.warning("Keine Kartendaten vom Backend empfangen.")
 
-                st.write(data["report"])
+                if data.get("report"):
+                    st.write(data["report"])
+                elif data.get("report_job_id"):
+                    st.write_stream(stream_report(data["report_job_id"]))
 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -1,7 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import contextvars
 import geopandas as gpd
-from shapely.geometry import LineString
-from shapely.ops import nearest_points
-import json
+import numpy as np
+import pandas as pd
+import shapely
+
+from app.core.metrics import stage
+from app.geo.crs import to_crs
 
 # EPSG:25832 is the standard ETRS89 / UTM zone 32N projection for Germany (meters).
 GERMANY_CRS = "EPSG:25832"
@@ -9,36 +15,121 @@ GERMANY_CRS = "EPSG:25832"
 # EPSG:4326 is standard WGS 84 Latitude/Longitude required by web maps.
 WEB_MAP_CRS = "EPSG:4326"
 
-def _to_web_json(gdf: gpd.GeoDataFrame) -> dict | None:
-    """Converts a GeoDataFrame to standard Web Mercator JSON."""
+# Map data covers the site and every feature it shows, plus this margin.
+MAP_VIEWPORT_MARGIN_M = 1000
+
+# Reference geometries are simplified to about one pixel of a map this wide.
+MAP_WIDTH_PX = 1024
+
+# Grid in degrees that web map coordinates are rounded to (about 0.1 m).
+MAP_COORDINATE_PRECISION = 1e-6
+
+
+def map_viewport(site_geo, reach_m: float) -> tuple[float, float, float, float]:
+    """Bounds (in the CRS of site_geo) of the map around site_geo showing everything within reach_m."""
+    min_x, min_y, max_x, max_y = site_geo.bounds
+    margin = reach_m + MAP_VIEWPORT_MARGIN_M
+    return min_x - margin, min_y - margin, max_x + margin, max_y + margin
+
+
+def _to_web_json(
+        gdf: gpd.GeoDataFrame,
+        viewport: tuple[float, float, float, float] | None = None,
+        tolerance_m: float = 0.0,
+) -> dict | None:
+    """
+    Converts a GeoDataFrame (in a metric CRS) to a GeoJSON dict in WEB_MAP_CRS. Geometries are
+    clipped to viewport, simplified with tolerance_m and rounded to MAP_COORDINATE_PRECISION,
+    so large protected areas do not blow up the response.
+    """
     if gdf.empty:
         return None
-    return json.loads(gdf.to_crs(WEB_MAP_CRS).to_json())
+    geometries = np.asarray(gdf.geometry.values)
+    if viewport is not None:
+        geometries = shapely.clip_by_rect(geometries, *viewport)
+    if tolerance_m:
+        geometries = shapely.simplify(geometries, tolerance_m, preserve_topology=True)
+
+    web = to_crs(gpd.GeoDataFrame(gdf.drop(columns=gdf.geometry.name), geometry=geometries, crs=gdf.crs), WEB_MAP_CRS)
+    web.geometry = shapely.set_precision(np.asarray(web.geometry.values), MAP_COORDINATE_PRECISION)
+    web = web[~web.geometry.is_empty]
+    if web.empty:
+        return None
+    return web.to_geo_dict(drop_id=True)
+
+
+def _map_data(site_gdf, site_geo, nearest_settlements, distance_lines, relevant_protected_area) -> dict:
+    """Lean GeoJSON layers for the frontend map, clipped to the area between the site and what it shows."""
+    reach_m = 0.0
+    if not nearest_settlements.empty:
+        reach_m = float(nearest_settlements["distance_m"].max())
+    if not relevant_protected_area.empty:
+        areas = np.asarray(relevant_protected_area.geometry.values)
+        reach_m = max(reach_m, float(shapely.distance(site_geo, areas).max()))
+
+    viewport = map_viewport(site_geo, reach_m)
+    tolerance_m = (viewport[2] - viewport[0]) / MAP_WIDTH_PX
+    return {
+        "site": _to_web_json(site_gdf),
+        "nearest_settlement": _to_web_json(nearest_settlements, viewport, tolerance_m),
+        "distance_line": _to_web_json(distance_lines),
+        "protected_areas": _to_web_json(relevant_protected_area, viewport, tolerance_m),
+    }
+
+
+# Number of nearest settlements reported per site (more if several are tied with the last one).
+NEAREST_K = 3
+
+
+def nearest_features(site_geo, gdf: gpd.GeoDataFrame, k: int = NEAREST_K) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Positions and exact distances of the k features nearest to site_geo, sorted by distance.
+    Features tied with the k-th are included too. Candidates come from a dwithin query grown
+    from the nearest distance until it holds k features; their distances are then computed in
+    one vectorized shapely.distance call. Nothing is found for a missing or empty site_geo.
+    """
+    if gdf.empty or site_geo is None or site_geo.is_empty:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+
+    geometries = np.asarray(gdf.geometry.values)
+    _, nearest_distance = gdf.sindex.nearest(site_geo, return_all=False, return_distance=True)
+    radius = float(nearest_distance[0])
+    while True:
+        candidates = gdf.sindex.query(site_geo, predicate="dwithin", distance=radius)
+        if len(candidates) >= min(k, len(gdf)):
+            break
+        radius = max(radius * 2, 1.0)
 
+    distances = shapely.distance(site_geo, geometries[candidates])
+    order = np.lexsort((candidates, distances))
+    candidates, distances = candidates[order], distances[order]
+    keep = distances <= distances[min(k, len(distances)) - 1]
+    return candidates[keep], distances[keep]
 
-def _get_nearest_settlement(site_geo, site_gs: gpd.GeoSeries, settlements_gdf: gpd.GeoDataFrame):
-    """Finds the nearest settlement and generates a distance line."""
-    if settlements_gdf.empty:
-        return None, gpd.GeoDataFrame(crs=GERMANY_CRS), gpd.GeoDataFrame(crs=GERMANY_CRS)
 
+def _none_if_missing(value):
+    return None if value is None or pd.isna(value) else value
 
-    _, right_idx = settlements_gdf.sindex.nearest(site_gs, return_all=False)
-    nearest_settlement = settlements_gdf.iloc[right_idx]
 
-    min_distance = float(nearest_settlement.distance(site_geo).iloc[0])
+def _get_nearest_settlement(site_geo, settlements_gdf: gpd.GeoDataFrame, k: int = NEAREST_K):
+    """Finds the k nearest settlements and their distance lines (all computed in one vectorized call)."""
+    positions, distances = nearest_features(site_geo, settlements_gdf, k)
+    if not len(positions):
+        no_lines = gpd.GeoDataFrame({"distance_m": []}, geometry=[], crs=settlements_gdf.crs)
+        return None, settlements_gdf.iloc[:0].assign(distance_m=np.empty(0)), no_lines
 
-    # Create connecting line
-    nearest_geom = nearest_settlement.geometry.iloc[0]
-    pt1, pt2 = nearest_points(site_geo, nearest_geom)
-    distance_line_gdf = gpd.GeoDataFrame(geometry=[LineString([pt1, pt2])], crs=GERMANY_CRS)
+    nearest_settlements = settlements_gdf.iloc[positions].assign(distance_m=distances)
 
-    return min_distance, nearest_settlement, distance_line_gdf
+    lines = shapely.shortest_line(site_geo, np.asarray(nearest_settlements.geometry.values))
+    distance_lines_gdf = gpd.GeoDataFrame({"distance_m": distances}, geometry=lines, crs=settlements_gdf.crs)
+
+    return float(distances[0]), nearest_settlements, distance_lines_gdf
 
 
 def _get_protected_area_status(site_geo, site_gs: gpd.GeoSeries, protected_areas_gdf: gpd.GeoDataFrame):
     """Checks for overlapping protected areas, or finds the nearest one."""
     if protected_areas_gdf.empty:
-        return False, gpd.GeoDataFrame(crs=GERMANY_CRS)
+        return False, protected_areas_gdf
 
 
     intersecting_indices = protected_areas_gdf.sindex.query(site_geo, predicate="intersects")
@@ -50,44 +141,363 @@ def _get_protected_area_status(site_geo, site_gs: gpd.GeoSeries, protected_areas
     _, right_idx = protected_areas_gdf.sindex.nearest(site_gs, return_all=False)
     return False, protected_areas_gdf.iloc[right_idx]
 
-def analyze_site(site_gdf: gpd.GeoDataFrame, settlements_gdf: gpd.GeoDataFrame, protected_areas_gdf: gpd.GeoDataFrame) -> dict:
-    """Main function to analyze a site against settlements and protected areas."""
-    if site_gdf.empty:
-        return {"metrics": {}, "map_data": {}}
-    site_gdf = site_gdf.to_crs(GERMANY_CRS)
-    site_geo = site_gdf.union_all()
-    site_gs = gpd.GeoSeries([site_geo], crs=GERMANY_CRS)
+@dataclass(frozen=True)
+class ConstraintLayer:
+    """
+    A constraint checked around every site: nearest distance, overlap and all features within buffer_m.
+    source names the reference layer (file) it is read from; types optionally restricts it to some
+    values of the source's 'type' column, e.g. one protected-area category.
+    """
+    name: str
+    source: str
+    buffer_m: float
+    types: tuple[str, ...] | None = None
 
 
-    min_distance, nearest_settlement, distance_line = _get_nearest_settlement(
-        site_geo, site_gs, settlements_gdf
-    )
+# Constraint layers evaluated by analyze_site when their source layer is available.
+CONSTRAINT_LAYERS: dict[str, ConstraintLayer] = {}
+
+# Features listed per constraint layer in the result (the count covers all of them).
+MAX_FEATURES_PER_CONSTRAINT = 20
+
+# Shared pool: shapely 2 releases the GIL in its vectorized operations, so layers run in parallel.
+_constraint_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="constraints")
+
+
+def register_constraint_layer(
+        name: str,
+        source: str | None = None,
+        buffer_m: float = 0.0,
+        types: tuple[str, ...] | list[str] | None = None,
+) -> ConstraintLayer:
+    """Adds (or replaces) a constraint layer in the registry."""
+    layer = ConstraintLayer(name=name, source=source or name, buffer_m=buffer_m, types=tuple(types) if types else None)
+    CONSTRAINT_LAYERS[name] = layer
+    return layer
+
+
+register_constraint_layer("roads", buffer_m=100)
+register_constraint_layer("railways", buffer_m=100)
+register_constraint_layer("power_lines", buffer_m=150)
+register_constraint_layer("airports", buffer_m=5000)
+register_constraint_layer("water_bodies", buffer_m=50)
+register_constraint_layer("bird_protection_areas", "protected_areas", buffer_m=1200, types=["Vogelschutzgebiete"])
+register_constraint_layer("nature_reserves", "protected_areas", buffer_m=500, types=["Naturschutzgebiete"])
+register_constraint_layer("national_parks", "protected_areas", buffer_m=1000, types=["Nationalparke"])
+
+
+def _column_values(gdf: gpd.GeoDataFrame, column: str) -> np.ndarray:
+    """Column as an object array with None for missing values (or all None if the column is absent)."""
+    if column not in gdf.columns:
+        return np.full(len(gdf), None, dtype=object)
+    values = gdf[column].to_numpy(dtype=object, copy=True)
+    values[pd.isna(values)] = None
+    return values
+
+
+def nearest_distance(site_geo, gdf: gpd.GeoDataFrame, types=None, start_radius_m: float = 1000.0) -> float | None:
+    """
+    Distance from site_geo to the nearest feature of gdf, or to the nearest one whose 'type' is in
+    types. None if gdf holds no such feature or site_geo is missing or empty.
+    """
+    if gdf.empty or site_geo is None or site_geo.is_empty:
+        return None
+    if types is None:
+        _, nearest_distances = gdf.sindex.nearest(site_geo, return_distance=True, return_all=False)
+        return float(nearest_distances[0])
+
+    # Only some types count: search outwards until a matching feature is found.
+    geometries = np.asarray(gdf.geometry.values)
+    matches = np.isin(gdf["type"].to_numpy(dtype=object), list(types))
+    min_x, min_y, max_x, max_y = gdf.total_bounds
+    max_radius = np.hypot(max_x - min_x, max_y - min_y) + site_geo.distance(shapely.box(min_x, min_y, max_x, max_y))
+    radius = start_radius_m
+    while radius <= 2 * max_radius:
+        candidates = gdf.sindex.query(site_geo, predicate="dwithin", distance=radius)
+        candidates = candidates[matches[candidates]]
+        if len(candidates):
+            return float(shapely.distance(site_geo, geometries[candidates]).min())
+        radius *= 2
+    return None
+
+
+def _evaluate_constraint(site_geo, layer: ConstraintLayer, source_gdf: gpd.GeoDataFrame) -> dict:
+    """Nearest distance, overlap and features within the buffer for one constraint layer."""
+    with stage(f"constraint_{layer.name}"):
+        return _evaluate_constraint_layer(site_geo, layer, source_gdf)
+
+
+def _evaluate_constraint_layer(site_geo, layer: ConstraintLayer, source_gdf: gpd.GeoDataFrame) -> dict:
+    result = {"nearest_distance_m": None, "overlaps": False, "within_buffer_count": 0, "within_buffer": []}
+    if source_gdf.empty:
+        return result
 
-    overlaps_protected_area, relevant_protected_area = _get_protected_area_status(
-        site_geo, site_gs, protected_areas_gdf
+    geometries = np.asarray(source_gdf.geometry.values)
+    types = source_gdf["type"].to_numpy() if layer.types else None
+
+    def matching(idx: np.ndarray) -> np.ndarray:
+        return idx if types is None else idx[np.isin(types[idx], layer.types)]
+
+    within = matching(source_gdf.sindex.query(site_geo, predicate="dwithin", distance=layer.buffer_m))
+    distances = shapely.distance(site_geo, geometries[within])
+
+    if len(within):
+        nearest = float(distances.min())
+    else:
+        nearest = nearest_distance(site_geo, source_gdf, layer.types, start_radius_m=max(layer.buffer_m, 1000.0) * 2)
+
+    order = np.argsort(distances, kind="stable")[:MAX_FEATURES_PER_CONSTRAINT]
+    names = _column_values(source_gdf, "name")
+    feature_types = _column_values(source_gdf, "type")
+    result.update(
+        nearest_distance_m=nearest,
+        overlaps=bool(len(within)) and bool((distances == 0).any()),
+        within_buffer_count=int(len(within)),
+        within_buffer=[
+            {
+                "name": names[within[i]],
+                "type": feature_types[within[i]],
+                "distance_m": float(distances[i]),
+            }
+            for i in order
+        ],
     )
+    return result
+
+
+def analyze_constraints(
+        site_geo,
+        sources: dict[str, gpd.GeoDataFrame],
+        layers: list[ConstraintLayer] | None = None,
+) -> dict[str, dict]:
+    """
+    Evaluates every constraint layer whose source is in sources, concurrently in a thread pool.
+    Returns the per-layer result keyed by layer name. Each layer runs in a copy of the caller's
+    context, so its stage timing ends up in the request's Server-Timing header.
+    """
+    layers = [layer for layer in (layers or CONSTRAINT_LAYERS.values()) if layer.source in sources]
+    futures = {
+        layer.name: _constraint_pool.submit(
+            contextvars.copy_context().run, _evaluate_constraint, site_geo, layer, sources[layer.source]
+        )
+        for layer in layers
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+
+def constraint_metrics(constraints: dict[str, dict]) -> dict:
+    """Flat per-layer metrics usable by the rule engine (e.g. a buffer rule on roads_within_buffer_count)."""
+    metrics = {}
+    for name, result in constraints.items():
+        metrics[f"distance_to_{name}_m"] = result["nearest_distance_m"]
+        metrics[f"overlaps_{name}"] = result["overlaps"]
+        metrics[f"{name}_within_buffer_count"] = result["within_buffer_count"]
+    return metrics
 
-    settlement_name = nearest_settlement.iloc[0]["name"] if not nearest_settlement.empty else None
-    settlement_type = nearest_settlement.iloc[0]["type"] if not nearest_settlement.empty else None
+
+def analyze_site(
+        site_gdf: gpd.GeoDataFrame,
+        settlements_gdf: gpd.GeoDataFrame,
+        protected_areas_gdf: gpd.GeoDataFrame,
+        constraint_sources: dict[str, gpd.GeoDataFrame] | None = None,
+        nearest_k: int = NEAREST_K,
+        include_map_data: bool = True,
+        crs: str = GERMANY_CRS,
+        typed_distances: dict[str, frozenset[str]] | None = None,
+) -> dict:
+    """
+    Main function to analyze a site against settlements and protected areas.
+    The nearest_k nearest settlements (with ties) are listed under "nearest_settlements".
+    typed_distances (metric key -> settlement types, see RuleSet.typed_distances) adds the
+    distance to the nearest settlement of those types under each key.
+    If constraint_sources (source name -> layer) is given, the registered constraint layers are
+    evaluated as well; their details are returned under "constraints" and flat metrics are added.
+    With include_map_data=False the (comparatively expensive) "map_data" layers are left out.
+    Distances are measured in crs, a metric CRS for the site (see app.geo.crs.site_crs); all
+    reference layers must already be in it.
+    """
+    # Missing and empty geometries are skipped; a site without any is not analyzed.
+    site_gdf = site_gdf[~(site_gdf.geometry.isna() | site_gdf.geometry.is_empty)]
+    if site_gdf.empty:
+        return {"metrics": {}, "map_data": {}} if include_map_data else {"metrics": {}}
+    with stage("site_to_crs"):
+        site_gdf = to_crs(site_gdf, crs)
+        site_geo = site_gdf.union_all()
+        site_gs = gpd.GeoSeries([site_geo], crs=site_gdf.crs)
+
+    with stage("nearest_settlement"):
+        min_distance, nearest_settlements, distance_lines = _get_nearest_settlement(
+            site_geo, settlements_gdf, nearest_k
+        )
+
+    with stage("protected_areas"):
+        overlaps_protected_area, relevant_protected_area = _get_protected_area_status(
+            site_geo, site_gs, protected_areas_gdf
+        )
+
+        typed_settlement_distances = {
+            key: nearest_distance(site_geo, settlements_gdf, types) for key, types in (typed_distances or {}).items()
+        }
+
+    settlement_name = nearest_settlements.iloc[0]["name"] if not nearest_settlements.empty else None
+    settlement_type = nearest_settlements.iloc[0]["type"] if not nearest_settlements.empty else None
 
     if not relevant_protected_area.empty:
         protected_area_names = ", ".join(relevant_protected_area["name"].dropna().astype(str).unique()) or None
         protected_area_types = ", ".join(relevant_protected_area["type"].dropna().astype(str).unique()) or None
     else:
         protected_area_names, protected_area_types = None, None
-    return {
+
+    with stage("constraints"):
+        constraints = analyze_constraints(site_geo, constraint_sources) if constraint_sources else {}
+
+    result = {
         "metrics": {
             "distance_to_settlements_m": min_distance,
             "overlaps_protected_area": overlaps_protected_area,
             "nearest_settlement_name": settlement_name,
             "nearest_settlement_type": settlement_type,
+            **typed_settlement_distances,
             "protected_area_name": protected_area_names,
             "protected_area_type": protected_area_types,
+            **constraint_metrics(constraints),
         },
-        "map_data": {
-            "site": _to_web_json(site_gdf),
-            "nearest_settlement": _to_web_json(nearest_settlement),
-            "distance_line": _to_web_json(distance_line),
-            "protected_areas": _to_web_json(relevant_protected_area)
-        }
+        "constraints": constraints,
+        "crs": crs,
+        "nearest_settlements": [
+            {"name": _none_if_missing(row.get("name")), "type": _none_if_missing(row.get("type")), "distance_m": row["distance_m"]}
+            for row in nearest_settlements.drop(columns="geometry").to_dict("records")
+        ],
     }
+    if include_map_data:
+        with stage("map_data"):
+            result["map_data"] = _map_data(
+                site_gdf, site_geo, nearest_settlements, distance_lines, relevant_protected_area
+            )
+    return result
+
+
+def constraint_metrics_batch(
+        sites: gpd.GeoSeries,
+        sources: dict[str, gpd.GeoDataFrame],
+        layers: list[ConstraintLayer] | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    constraint_metrics for many sites (one per row of sites), computed with one dwithin and one
+    nearest query per constraint layer whose source is in sources.
+    """
+    n_sites = len(sites)
+    site_geometries = np.asarray(sites.values)
+    metrics = {}
+    for layer in (layer for layer in (layers or CONSTRAINT_LAYERS.values()) if layer.source in sources):
+        source_gdf = sources[layer.source]
+        if layer.types:
+            source_gdf = source_gdf[source_gdf["type"].isin(list(layer.types))]
+        nearest = np.full(n_sites, np.nan)
+        overlaps = np.zeros(n_sites, dtype=bool)
+        counts = np.zeros(n_sites, dtype=np.int64)
+        if n_sites and not source_gdf.empty:
+            (site_idx, _), distances = source_gdf.sindex.nearest(sites, return_all=False, return_distance=True)
+            nearest[site_idx] = distances
+            site_idx, feature_idx = source_gdf.sindex.query(sites, predicate="dwithin", distance=layer.buffer_m)
+            counts = np.bincount(site_idx, minlength=n_sites)
+            touching = shapely.distance(
+                site_geometries[site_idx], np.asarray(source_gdf.geometry.values)[feature_idx]
+            ) == 0
+            overlaps[site_idx[touching]] = True
+        metrics[f"distance_to_{layer.name}_m"] = nearest
+        metrics[f"overlaps_{layer.name}"] = overlaps
+        metrics[f"{layer.name}_within_buffer_count"] = counts
+    return metrics
+
+
+def _join_unique_per_site(site_idx: np.ndarray, values: np.ndarray, n_sites: int) -> np.ndarray:
+    """Joins the distinct non-null values per site into a comma-separated string (None if there are none)."""
+    joined = np.full(n_sites, None, dtype=object)
+    pairs = pd.DataFrame({"site": site_idx, "value": values}).dropna()
+    if pairs.empty:
+        return joined
+    pairs["value"] = pairs["value"].astype(str)
+    pairs = pairs.drop_duplicates()
+    grouped = pairs.groupby("site", sort=False)["value"].agg(", ".join)
+    joined[grouped.index.to_numpy()] = grouped.to_numpy()
+    return joined
+
+
+def analyze_sites_batch(
+        sites_gdf: gpd.GeoDataFrame,
+        settlements_gdf: gpd.GeoDataFrame,
+        protected_areas_gdf: gpd.GeoDataFrame,
+        constraint_sources: dict[str, gpd.GeoDataFrame] | None = None,
+        crs: str = GERMANY_CRS,
+        typed_distances: dict[str, frozenset[str]] | None = None,
+) -> pd.DataFrame:
+    """
+    Analyzes many independent sites (one per row) at once. Uses a single vectorized
+    nearest/intersects query per reference layer instead of one query per site.
+    Returns one row of metrics per site, with the same keys as analyze_site (including the
+    constraint metrics for constraint_sources). As there, the reference layers must be in crs.
+    """
+    sites = to_crs(sites_gdf.geometry, crs).reset_index(drop=True)
+    n_sites = len(sites)
+
+    distances = np.full(n_sites, np.nan)
+    settlement_names = np.full(n_sites, None, dtype=object)
+    settlement_types = np.full(n_sites, None, dtype=object)
+    overlaps = np.zeros(n_sites, dtype=bool)
+    protected_area_names = np.full(n_sites, None, dtype=object)
+    protected_area_types = np.full(n_sites, None, dtype=object)
+
+    if n_sites and not settlements_gdf.empty:
+        (site_idx, settlement_idx), nearest_distances = settlements_gdf.sindex.nearest(
+            sites, return_all=False, return_distance=True
+        )
+        distances[site_idx] = nearest_distances
+        settlement_names[site_idx] = settlements_gdf["name"].to_numpy()[settlement_idx]
+        settlement_types[site_idx] = settlements_gdf["type"].to_numpy()[settlement_idx]
+
+    typed_settlement_distances = {}
+    for key, types in (typed_distances or {}).items():
+        typed_settlement_distances[key] = np.full(n_sites, np.nan)
+        if n_sites and not settlements_gdf.empty:
+            # A tree over just the matching settlements answers all sites in one query.
+            matching = settlements_gdf[settlements_gdf["type"].isin(list(types))]
+            if not matching.empty:
+                (site_idx, _), nearest_distances = matching.sindex.nearest(
+                    sites, return_all=False, return_distance=True
+                )
+                typed_settlement_distances[key][site_idx] = nearest_distances
+
+    if n_sites and not protected_areas_gdf.empty:
+        site_idx, area_idx = protected_areas_gdf.sindex.query(sites, predicate="intersects")
+        overlaps[site_idx] = True
+
+        # Like analyze_site, sites without an overlap report their nearest protected area instead.
+        free_sites = np.flatnonzero(~overlaps)
+        if len(free_sites):
+            free_idx, nearest_area_idx = protected_areas_gdf.sindex.nearest(
+                sites.iloc[free_sites], return_all=False
+            )
+            site_idx = np.concatenate([site_idx, free_sites[free_idx]])
+            area_idx = np.concatenate([area_idx, nearest_area_idx])
+
+        protected_area_names = _join_unique_per_site(
+            site_idx, protected_areas_gdf["name"].to_numpy()[area_idx], n_sites
+        )
+        protected_area_types = _join_unique_per_site(
+            site_idx, protected_areas_gdf["type"].to_numpy()[area_idx], n_sites
+        )
+
+    return pd.DataFrame(
+        {
+            "distance_to_settlements_m": distances,
+            "overlaps_protected_area": overlaps,
+            "nearest_settlement_name": settlement_names,
+            "nearest_settlement_type": settlement_types,
+            **typed_settlement_distances,
+            "protected_area_name": protected_area_names,
+            "protected_area_type": protected_area_types,
+            **(constraint_metrics_batch(sites, constraint_sources) if constraint_sources else {}),
+        },
+        index=sites_gdf.index,
+    )
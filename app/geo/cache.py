@@ -0,0 +1,72 @@
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+
+import geopandas as gpd
+import shapely
+
+from app.geo.analysis import GERMANY_CRS
+from app.geo.crs import to_crs
+
+
+def site_cache_key(site_gdf: gpd.GeoDataFrame) -> str:
+    """Hash of the normalized WKB of the (unioned) site geometry in GERMANY_CRS."""
+    site_geo = shapely.normalize(to_crs(site_gdf, GERMANY_CRS).union_all())
+    return hashlib.sha256(shapely.to_wkb(site_geo, output_dimension=2)).hexdigest()
+
+
+class AnalysisCache:
+    """
+    LRU cache for analyze_site results, bounded by the approximate JSON size of the entries.
+    Entries are keyed by reference dataset version and site key, so after a switch to a new version
+    requests still pinned to the old one keep hitting it, and its entries age out like any other.
+    Cached results are shared between requests and must not be mutated.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[dict, int]] = OrderedDict()
+        self._size = 0
+        self._version: str | None = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str, dataset_version: str) -> dict | None:
+        with self._lock:
+            self._version = dataset_version
+            entry = self._entries.get((dataset_version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((dataset_version, key))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, dataset_version: str, result: dict) -> None:
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            entry_key = (dataset_version, key)
+            if entry_key in self._entries:
+                self._size -= self._entries.pop(entry_key)[1]
+            self._entries[entry_key] = (result, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def stats(self) -> dict:
+        with self._lock:
+            versions = {version for version, _ in self._entries}
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "dataset_version": self._version,
+            "dataset_versions": len(versions),
+        }
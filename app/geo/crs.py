@@ -0,0 +1,85 @@
+from functools import lru_cache
+
+import geopandas as gpd
+from geopandas.array import from_shapely
+import numpy as np
+import pyproj
+import shapely
+
+# ETRS89 / UTM (EPSG:258zz) is used for these zones in Europe, WGS 84 / UTM (EPSG:326zz/327zz) elsewhere.
+ETRS89_UTM_ZONES = range(28, 39)
+ETRS89_MIN_LAT, ETRS89_MAX_LAT = 34.0, 84.0
+
+# Distances in neighbouring UTM zones differ by well under 2% across Europe. Windows read in one zone
+# for an analysis in another are grown by this factor (about the square of that) so they stay complete.
+REPROJECTION_SCALE_MARGIN = 1.05
+
+
+@lru_cache(maxsize=64)
+def get_crs(crs) -> pyproj.CRS:
+    return pyproj.CRS.from_user_input(crs)
+
+
+@lru_cache(maxsize=128)
+def get_transformer(source, target) -> pyproj.Transformer:
+    """Transformer between two CRS (x/y order), created once per pair and shared between threads."""
+    return pyproj.Transformer.from_crs(get_crs(source), get_crs(target), always_xy=True)
+
+
+def utm_crs(lon, lat) -> np.ndarray:
+    """
+    UTM CRS codes for WGS84 coordinates (arrays), including the widened zone 32V over southern Norway.
+    Inside Europe the ETRS89 variant is used, so sites in Germany west of 12°E get GERMANY_CRS.
+    """
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    zone = np.clip(np.floor((np.nan_to_num(lon) + 180) / 6).astype(int) + 1, 1, 60)
+    zone = np.where((lat >= 56) & (lat < 64) & (lon >= 3) & (lon < 12), 32, zone)
+    etrs89 = np.isin(zone, ETRS89_UTM_ZONES) & (lat >= ETRS89_MIN_LAT) & (lat <= ETRS89_MAX_LAT)
+    epsg = np.where(etrs89, 25800, np.where(lat >= 0, 32600, 32700)) + zone
+    return np.char.add("EPSG:", epsg.astype(str)).astype(object)
+
+
+def site_crs(geometries, crs: str) -> np.ndarray:
+    """Metric CRS code (UTM zone of the centroid) for each geometry given in crs; empty geometries keep crs."""
+    centroids = shapely.centroid(np.asarray(geometries))
+    centroids[shapely.is_empty(centroids)] = None
+    lon, lat = get_transformer(crs, "EPSG:4326").transform(shapely.get_x(centroids), shapely.get_y(centroids))
+    codes = utm_crs(lon, lat)
+    codes[~(np.isfinite(lon) & np.isfinite(lat))] = crs
+    return codes
+
+
+def bounds_crs(bounds, crs: str, samples: int = 16) -> list[str]:
+    """
+    Metric CRS codes (see site_crs) of the sites within bounds (in crs), from a lattice of samples x
+    samples points; the most common first.
+    """
+    xs = np.linspace(bounds[0], bounds[2], samples)
+    ys = np.linspace(bounds[1], bounds[3], samples)
+    codes = site_crs(shapely.points(*(axis.ravel() for axis in np.meshgrid(xs, ys))), crs).astype(str)
+    values, counts = np.unique(codes, return_counts=True)
+    return values[np.argsort(-counts, kind="stable")].tolist()
+
+
+def transform_geometries(geometries, source, target) -> np.ndarray:
+    """Geometries (array) reprojected from source to target with the cached transformer."""
+    transformer = get_transformer(source, target)
+    return shapely.transform(np.asarray(geometries), transformer.transform, interleaved=False)
+
+
+def to_crs(gdf: gpd.GeoDataFrame | gpd.GeoSeries, crs) -> gpd.GeoDataFrame | gpd.GeoSeries:
+    """
+    Like gdf.to_crs(crs), but with the cached transformer instead of resolving both CRS again on
+    every call. Returns gdf itself if it already is in crs.
+    """
+    if gdf.crs is None:
+        raise ValueError("Cannot transform naive geometries. Please set a crs on the object first.")
+    target = get_crs(crs)
+    if gdf.crs == target:
+        return gdf
+    geometries = from_shapely(transform_geometries(gdf.geometry.values, gdf.crs, crs), crs=target)
+    if isinstance(gdf, gpd.GeoSeries):
+        return gpd.GeoSeries(geometries, index=gdf.index, name=gdf.name)
+    projected = gdf.copy(deep=False)
+    projected[gdf.geometry.name] = geometries
+    return projected
@@ -0,0 +1,207 @@
+from dataclasses import dataclass
+import math
+import time
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+# Minimum distance between two turbines (roughly five rotor diameters of a current onshore turbine).
+DEFAULT_TURBINE_SPACING_M = 500.0
+
+# Time the placement search may take; it keeps restarting with new lattices until then.
+LAYOUT_TIME_BUDGET_S = 2.0
+
+# Lattice angles (degrees) tried first; later restarts use random angles and offsets.
+LATTICE_ANGLES = (0.0, 30.0, 15.0, 45.0)
+
+MAX_RESTARTS = 256
+
+# Segments per quarter circle of the exclusion buffers. The polygonal buffer lies inside the true one,
+# so it is grown until its edges are at least the distance away (see buildable_area).
+BUFFER_QUAD_SEGS = 8
+
+# Candidate points per turbine spacing step for the greedy fill, and the cap on their total number.
+FILL_STEPS_PER_SPACING = 4
+MAX_CANDIDATES = 200_000
+
+
+@dataclass(frozen=True)
+class ExclusionZone:
+    """
+    Features no turbine may stand within distance_m of (0: only not on them), optionally only those
+    whose 'type' is one of types.
+    """
+    features: gpd.GeoDataFrame
+    distance_m: float = 0.0
+    types: tuple[str, ...] | None = None
+
+
+@dataclass
+class TurbineLayout:
+    """Turbine positions (in the metric CRS of the parcel) placed in the buildable part of a parcel."""
+    parcel: shapely.Geometry
+    buildable_area: shapely.Geometry
+    positions: np.ndarray  # (n, 2) x/y
+    nearest_turbine_m: np.ndarray
+    spacing_m: float
+    restarts: int
+    elapsed_s: float
+
+
+def buildable_area(parcel, exclusions: list[ExclusionZone]):
+    """
+    Parcel minus every exclusion zone (features buffered by their distance). Features are clipped to
+    the parcel bbox grown by the distance before buffering, which leaves the buffer inside the parcel
+    unchanged but keeps large polygons cheap.
+    """
+    # A polygon with quad_segs segments per quarter inscribed in a circle of radius r has its edges
+    # r * cos(pi / (4 * quad_segs)) from the center.
+    grow = 1 / math.cos(math.pi / (4 * BUFFER_QUAD_SEGS))
+    min_x, min_y, max_x, max_y = parcel.bounds
+    pieces = []
+    for zone in exclusions:
+        gdf, distance = zone.features, zone.distance_m
+        if gdf.empty:
+            continue
+        if distance > 0:
+            idx = gdf.sindex.query(parcel, predicate="dwithin", distance=distance)
+        else:
+            idx = gdf.sindex.query(parcel, predicate="intersects")
+        if zone.types is not None:
+            idx = idx[np.isin(gdf["type"].to_numpy()[idx], zone.types)]
+        if not len(idx):
+            continue
+        margin = distance * grow + 1.0
+        geometries = shapely.clip_by_rect(
+            np.asarray(gdf.geometry.values)[idx], min_x - margin, min_y - margin, max_x + margin, max_y + margin
+        )
+        if distance > 0:
+            geometries = shapely.buffer(geometries, distance * grow, quad_segs=BUFFER_QUAD_SEGS)
+        pieces.append(geometries)
+
+    if not pieces:
+        return parcel
+    return shapely.difference(parcel, shapely.union_all(np.concatenate(pieces)))
+
+
+def _lattice(area, spacing: float, angle_deg: float, offset: tuple[float, float]) -> np.ndarray:
+    """Points of a hexagonal lattice (neighbours exactly spacing apart) rotated by angle inside area."""
+    min_x, min_y, max_x, max_y = area.bounds
+    cx, cy = (min_x + max_x) / 2, (min_y + max_y) / 2
+    radius = math.hypot(max_x - min_x, max_y - min_y) / 2 + spacing
+    row_step = spacing * math.sqrt(3) / 2
+    n_cols, n_rows = int(radius / spacing) + 1, int(radius / row_step) + 1
+
+    rows, cols = np.mgrid[-n_rows:n_rows + 1, -n_cols:n_cols + 1]
+    u = (cols + 0.5 * (rows % 2) + offset[0]) * spacing
+    v = (rows + offset[1]) * row_step
+    angle = math.radians(angle_deg)
+    x = cx + u * math.cos(angle) - v * math.sin(angle)
+    y = cy + u * math.sin(angle) + v * math.cos(angle)
+    inside = shapely.contains_xy(area, x, y)
+    return np.column_stack([x[inside], y[inside]])
+
+
+def _fill_candidates(area, spacing: float) -> np.ndarray:
+    """Fine grid points inside area, nearest to its boundary first (edges fit the most turbines)."""
+    min_x, min_y, max_x, max_y = area.bounds
+    step = max(spacing / FILL_STEPS_PER_SPACING, math.sqrt((max_x - min_x) * (max_y - min_y) / MAX_CANDIDATES))
+    x, y = np.meshgrid(np.arange(min_x + step / 2, max_x, step), np.arange(min_y + step / 2, max_y, step))
+    inside = shapely.contains_xy(area, x, y)
+    points = np.column_stack([x[inside], y[inside]])
+    boundary_distance = shapely.distance(area.boundary, shapely.points(points))
+    return points[np.argsort(boundary_distance, kind="stable")]
+
+
+def _greedy(candidates: np.ndarray, spacing: float, max_turbines: int | None) -> np.ndarray:
+    """Accepts candidates in order if they keep spacing to all accepted ones (grid hash, cell = spacing)."""
+    min_sq = spacing ** 2
+    cells: dict[tuple[int, int], list[tuple[float, float]]] = {}
+    accepted = []
+    for x, y in candidates:
+        i, j = int(x // spacing), int(y // spacing)
+        if any(
+            (x - px) ** 2 + (y - py) ** 2 < min_sq
+            for di in (-1, 0, 1) for dj in (-1, 0, 1)
+            for px, py in cells.get((i + di, j + dj), ())
+        ):
+            continue
+        cells.setdefault((i, j), []).append((x, y))
+        accepted.append((x, y))
+        if max_turbines is not None and len(accepted) >= max_turbines:
+            break
+    return np.array(accepted, dtype=float).reshape(-1, 2)
+
+
+def place_turbines(
+        area,
+        spacing_m: float,
+        time_budget_s: float = LAYOUT_TIME_BUDGET_S,
+        max_turbines: int | None = None,
+        seed: int = 0,
+) -> tuple[np.ndarray, int]:
+    """
+    Places as many points as possible in area with pairwise distance >= spacing_m. Each restart seeds
+    a hexagonal lattice (densest packing in the open) at another angle/offset and then greedily fills
+    the gaps along the edges from a fine candidate grid; the best layout found within the time budget
+    is returned with the number of restarts.
+    """
+    if area.is_empty or area.area == 0:
+        return np.empty((0, 2)), 0
+    min_x, min_y, max_x, max_y = area.bounds
+    if (max_x - min_x + spacing_m) * (max_y - min_y + spacing_m) / spacing_m ** 2 > MAX_CANDIDATES:
+        raise ValueError(f"The parcel is too large for a turbine spacing of {spacing_m} m.")
+
+    started = time.perf_counter()
+    shapely.prepare(area)
+    fill = _fill_candidates(area, spacing_m)
+    rng = np.random.default_rng(seed)
+
+    best, restarts = np.empty((0, 2)), 0
+    while restarts < MAX_RESTARTS and (restarts == 0 or time.perf_counter() - started < time_budget_s):
+        if restarts < len(LATTICE_ANGLES):
+            angle, offset = LATTICE_ANGLES[restarts], (0.0, 0.0)
+        else:
+            angle, offset = rng.uniform(0, 60), tuple(rng.uniform(0, 1, 2))
+        # Slightly wider than spacing_m so that rounding never puts lattice neighbours below it.
+        lattice = _lattice(area, spacing_m * (1 + 1e-9), angle, offset)
+        layout = _greedy(np.concatenate([lattice, fill]), spacing_m, max_turbines)
+        if len(layout) > len(best):
+            best = layout
+        restarts += 1
+        if max_turbines is not None and len(best) >= max_turbines:
+            break
+    return best, restarts
+
+
+def optimize_layout(
+        parcel,
+        exclusions: list[ExclusionZone],
+        spacing_m: float = DEFAULT_TURBINE_SPACING_M,
+        time_budget_s: float = LAYOUT_TIME_BUDGET_S,
+        max_turbines: int | None = None,
+) -> TurbineLayout:
+    """Buildable area of a parcel (metric CRS) and the largest turbine layout found in it within the time budget."""
+    started = time.perf_counter()
+    area = buildable_area(parcel, exclusions)
+    remaining_s = max(time_budget_s - (time.perf_counter() - started), 0.0)
+    positions, restarts = place_turbines(area, spacing_m, remaining_s, max_turbines)
+
+    nearest = np.full(len(positions), np.nan)
+    if len(positions) > 1:
+        points = shapely.points(positions)
+        (idx, _), distances = shapely.STRtree(points).query_nearest(
+            points, exclusive=True, return_distance=True, all_matches=False
+        )
+        nearest[idx] = distances
+
+    return TurbineLayout(
+        parcel=parcel,
+        buildable_area=area,
+        positions=positions,
+        nearest_turbine_m=nearest,
+        spacing_m=spacing_m,
+        restarts=restarts,
+        elapsed_s=time.perf_counter() - started,
+    )
@@ -0,0 +1,175 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from app.geo.analysis import GERMANY_CRS
+from app.geo.window import WindowSource
+
+# Children per node of the packed R-tree.
+NODE_SIZE = 16
+
+# Attribute columns kept in the packed layer.
+PACKED_COLUMNS = ("name", "type")
+
+FORMAT_VERSION = 1
+
+
+def _pack_strings(values) -> tuple[np.ndarray, np.ndarray]:
+    """UTF-8 bytes of all strings back to back and their offsets (missing values are empty)."""
+    chunks, offsets = [], [0]
+    for value in values:
+        data = b"" if value is None else str(value).encode("utf-8")
+        chunks.append(data)
+        offsets.append(offsets[-1] + len(data))
+    return np.frombuffer(b"".join(chunks), dtype=np.uint8), np.array(offsets, dtype=np.int64)
+
+
+def _build_tree(bounds: np.ndarray, node_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Packed R-tree over item bounds that are already in tree order. Returns the bounds of all
+    levels stacked (leaves first, root last) and the start offset of every level.
+    """
+    levels = [bounds]
+    while len(levels[-1]) > 1:
+        child = levels[-1]
+        n_nodes = -(-len(child) // node_size)
+        padded = np.full((n_nodes * node_size, 4), np.nan)
+        padded[:len(child)] = child
+        padded = padded.reshape(n_nodes, node_size, 4)
+        levels.append(np.column_stack([
+            np.nanmin(padded[:, :, 0], axis=1), np.nanmin(padded[:, :, 1], axis=1),
+            np.nanmax(padded[:, :, 2], axis=1), np.nanmax(padded[:, :, 3], axis=1),
+        ]))
+    offsets = np.cumsum([0] + [len(level) for level in levels])
+    return np.concatenate(levels), offsets
+
+
+def pack_layer(gdf: gpd.GeoDataFrame, directory: Path, node_size: int = NODE_SIZE) -> None:
+    """
+    Writes a layer as flat arrays that worker processes can memory-map: WKB blobs with offsets,
+    feature bounds, a packed R-tree (features sorted along a Hilbert curve) and the attributes.
+    The directory is written to a temporary sibling first and renamed, so readers never see a partial one.
+    """
+    gdf = gdf.to_crs(GERMANY_CRS) if gdf.crs is not None else gdf.set_crs(GERMANY_CRS)
+    gdf = gdf[~gdf.geometry.is_empty & gdf.geometry.notna()]
+    if not gdf.empty:
+        gdf = gdf.iloc[np.argsort(gdf.geometry.hilbert_distance().to_numpy(), kind="stable")]
+    geometries = np.asarray(gdf.geometry.values)
+
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{directory.name}-", dir=directory.parent))
+    try:
+        wkb = shapely.to_wkb(geometries, output_dimension=2)
+        lengths = np.fromiter((len(blob) for blob in wkb), dtype=np.int64, count=len(wkb))
+        np.save(tmp / "wkb_offsets.npy", np.concatenate([[0], np.cumsum(lengths)]))
+        np.save(tmp / "wkb.npy", np.frombuffer(b"".join(wkb), dtype=np.uint8))
+
+        bounds = shapely.bounds(geometries).reshape(-1, 4) if len(geometries) else np.empty((0, 4))
+        tree_bounds, level_offsets = _build_tree(bounds, node_size) if len(bounds) else (bounds, np.array([0, 0]))
+        np.save(tmp / "tree_bounds.npy", tree_bounds)
+        np.save(tmp / "level_offsets.npy", level_offsets)
+
+        for column in PACKED_COLUMNS:
+            values = [None] * len(gdf)
+            if column in gdf.columns:
+                values = gdf[column].astype(object).where(gdf[column].notna(), None).tolist()
+            data, offsets = _pack_strings(values)
+            np.save(tmp / f"{column}.npy", data)
+            np.save(tmp / f"{column}_offsets.npy", offsets)
+            np.save(tmp / f"{column}_missing.npy", np.array([value is None for value in values], dtype=bool))
+
+        (tmp / "meta.json").write_text(json.dumps({
+            "format": FORMAT_VERSION, "crs": GERMANY_CRS, "count": len(gdf), "node_size": node_size,
+        }))
+        try:
+            os.replace(tmp, directory)
+        except OSError:
+            # Another worker packed the same file first; its copy is identical.
+            if not (directory / "meta.json").exists():
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def packed_directory(packed_dir: Path, name: str, source_path: Path) -> Path:
+    """Directory of the packed copy of a layer file; the name changes whenever the file does."""
+    stat = source_path.stat()
+    signature = f"{source_path.name}:{stat.st_mtime_ns}:{stat.st_size}:{FORMAT_VERSION}"
+    return packed_dir / f"{name}-{hashlib.sha256(signature.encode()).hexdigest()[:12]}"
+
+
+class PackedLayer(WindowSource):
+    """
+    Read-only view of a packed layer. All arrays are memory-mapped, so worker processes share
+    one copy through the page cache; only the features of a queried window are decoded.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / "meta.json").read_text())
+        self.count = meta["count"]
+        self.node_size = meta["node_size"]
+        self.crs = meta["crs"]
+
+        def load(name: str) -> np.ndarray:
+            return np.load(self.directory / f"{name}.npy", mmap_mode="r")
+
+        self._wkb, self._wkb_offsets = load("wkb"), load("wkb_offsets")
+        self._tree_bounds, self._level_offsets = load("tree_bounds"), np.asarray(load("level_offsets"))
+        self._columns = {
+            column: (load(column), load(f"{column}_offsets"), load(f"{column}_missing")) for column in PACKED_COLUMNS
+        }
+        if self.count:
+            self.total_bounds = tuple(float(v) for v in self._tree_bounds[-1])
+        else:
+            self.total_bounds = (0.0, 0.0, 0.0, 0.0)
+
+    def query(self, bounds) -> np.ndarray:
+        """Sorted positions of the features whose bbox intersects bounds, by a level-wise tree descent."""
+        if not self.count:
+            return np.empty(0, dtype=np.int64)
+        min_x, min_y, max_x, max_y = bounds
+        level_offsets = self._level_offsets
+        nodes = np.array([0], dtype=np.int64)  # the top level is the root alone
+
+        for level in reversed(range(len(level_offsets) - 1)):
+            node_bounds = self._tree_bounds[level_offsets[level] + nodes]
+            nodes = nodes[
+                (node_bounds[:, 0] <= max_x) & (node_bounds[:, 2] >= min_x)
+                & (node_bounds[:, 1] <= max_y) & (node_bounds[:, 3] >= min_y)
+            ]
+            if level > 0:
+                children = (nodes[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+                nodes = children[children < level_offsets[level] - level_offsets[level - 1]]
+        return np.sort(nodes)
+
+    def _strings(self, column: str, positions: np.ndarray) -> list[str | None]:
+        data, offsets, missing = self._columns[column]
+        return [
+            None if missing[i] else bytes(data[offsets[i]:offsets[i + 1]]).decode("utf-8")
+            for i in positions
+        ]
+
+    def read(self, positions: np.ndarray) -> gpd.GeoDataFrame:
+        """Decodes the given features into a GeoDataFrame indexed by their position."""
+        offsets = self._wkb_offsets
+        blobs = [bytes(self._wkb[offsets[i]:offsets[i + 1]]) for i in positions]
+        return gpd.GeoDataFrame(
+            {column: self._strings(column, positions) for column in PACKED_COLUMNS},
+            geometry=shapely.from_wkb(np.array(blobs, dtype=object)) if blobs else [],
+            index=np.asarray(positions, dtype=np.int64),
+            crs=self.crs,
+        )
+
+    def read_window(self, bounds) -> tuple[gpd.GeoDataFrame, tuple[float, float, float, float]]:
+        return self.read(self.query(bounds)), tuple(bounds)
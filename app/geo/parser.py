@@ -2,6 +2,7 @@
 from pathlib import Path
 import json
 import geopandas as gpd
+import pandas as pd
 
 def load_geojson(path: str | Path) -> dict:
     """Loads a filepath into a geojson dictionary."""
@@ -11,4 +12,42 @@ def load_geojson(path: str | Path) -> dict:
 
 def load_geodataframe(path: str | Path):
     """Loads a file (GeoJSON or GPKG) into a GeoPandas DataFrame"""
-    return gpd.read_file(path)
\ No newline at end of file
+    return gpd.read_file(path)
+
+def load_geodataframe_bbox(path: str | Path, bbox: tuple[float, float, float, float]) -> gpd.GeoDataFrame:
+    """
+    Loads only the features whose bounding box intersects bbox (given in the file's CRS),
+    using the GPKG R-tree / FlatGeobuf index. The index holds the feature ids.
+    """
+    return gpd.read_file(path, bbox=bbox, engine="pyogrio", fid_as_index=True)
+
+def features_to_geodataframe(features: list[dict], crs: str = "EPSG:4326") -> gpd.GeoDataFrame:
+    """GeoDataFrame of GeoJSON features (or raw geometries); keeps each feature's id in an 'id' column."""
+    features = [f if f.get("type") == "Feature" else {"type": "Feature", "geometry": f, "properties": {}} for f in features]
+    gdf = gpd.GeoDataFrame.from_features(features, crs=crs)
+    gdf["id"] = pd.Series([f.get("id") for f in features], index=gdf.index, dtype=object)
+    return gdf
+
+def iter_geoparquet_chunks(source, chunk_size: int):
+    """
+    Reads a GeoParquet file (path or binary file object) in record batches of chunk_size rows,
+    yielding a GeoDataFrame with the primary geometry and the 'id' column (if any) per batch.
+    """
+    import pyarrow.parquet as pq
+    import shapely
+
+    parquet_file = pq.ParquetFile(source)
+    geo = json.loads((parquet_file.schema_arrow.metadata or {}).get(b"geo", b"{}"))
+    geometry_column = geo.get("primary_column", "geometry")
+    column_meta = geo.get("columns", {}).get(geometry_column, {})
+    if column_meta.get("encoding", "WKB").upper() != "WKB":
+        raise ValueError(f"Unsupported GeoParquet geometry encoding '{column_meta['encoding']}'.")
+    # A missing crs means OGC:CRS84 (lon/lat) per the GeoParquet spec.
+    crs = column_meta.get("crs") or "OGC:CRS84"
+    columns = [geometry_column] + (["id"] if "id" in parquet_file.schema_arrow.names else [])
+
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        ids = batch.column("id").to_pylist() if "id" in columns else [None] * batch.num_rows
+        data = {"id": pd.Series(ids, dtype=object)}
+        geometry = shapely.from_wkb(batch.column(geometry_column).to_numpy(zero_copy_only=False))
+        yield gpd.GeoDataFrame(data, geometry=geometry, crs=crs)
@@ -0,0 +1,227 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import io
+import math
+import multiprocessing
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from app.geo.analysis import GERMANY_CRS
+from app.geo.parser import load_geodataframe
+
+# Number of grid rows handed to one worker task.
+TILE_ROWS = 64
+
+# Upper bound on grid size to keep a single request from exhausting memory.
+MAX_GRID_CELLS = 50_000_000
+
+# Reference layer files a pool worker has loaded, identified by (path, mtime, size) each, and their trees.
+_worker_trees: dict[tuple, dict[str, shapely.STRtree]] = {}
+
+
+@dataclass
+class SuitabilityGrid:
+    """Per-cell suitability rasters. Row 0 is the northern edge, origin is the top-left corner."""
+    distance_to_settlements_m: np.ndarray
+    in_protected_area: np.ndarray
+    compliant: np.ndarray
+    origin: tuple[float, float]
+    cell_size: float
+    crs: str = GERMANY_CRS
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.compliant.shape
+
+
+def _build_trees(settlements_wkb: np.ndarray, protected_areas_wkb: np.ndarray) -> dict[str, shapely.STRtree]:
+    return {
+        "settlements": shapely.STRtree(shapely.from_wkb(settlements_wkb)),
+        "protected_areas": shapely.STRtree(shapely.from_wkb(protected_areas_wkb)),
+    }
+
+
+def create_raster_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for compute_suitability_grid, shared by all requests. Workers are spawned rather
+    than forked, as the server process runs threads.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _file_key(path: Path) -> tuple[str, int, int]:
+    stat = path.stat()
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+def _load_wkb(path: Path) -> np.ndarray:
+    gdf = load_geodataframe(path)
+    geometries = gdf.geometry if gdf.crs is None else gdf.geometry.to_crs(GERMANY_CRS)
+    return shapely.to_wkb(geometries.values)
+
+
+def _worker_trees_for(layer_files: tuple) -> dict[str, shapely.STRtree]:
+    """Trees of the layer files in a pool worker, read when a file version is first seen there."""
+    trees = _worker_trees.get(layer_files)
+    if trees is None:
+        (settlements_path, *_), (protected_areas_path, *_) = layer_files
+        trees = _build_trees(_load_wkb(Path(settlements_path)), _load_wkb(Path(protected_areas_path)))
+        _worker_trees.clear()
+        _worker_trees[layer_files] = trees
+    return trees
+
+
+def _compute_tile(
+        row_start: int,
+        row_stop: int,
+        n_cols: int,
+        origin: tuple[float, float],
+        cell_size: float,
+        trees: dict[str, shapely.STRtree] | None = None,
+        layer_files: tuple | None = None,
+) -> tuple[int, np.ndarray, np.ndarray]:
+    """
+    Computes settlement distances and protected-area flags for the cell centers of a band of rows,
+    against trees or, in a pool worker, the trees of layer_files.
+    """
+    trees = trees or _worker_trees_for(layer_files)
+    min_x, max_y = origin
+    cols = np.arange(n_cols)
+    rows = np.arange(row_start, row_stop)
+    xs = min_x + (cols + 0.5) * cell_size
+    ys = max_y - (rows + 0.5) * cell_size
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    points = shapely.points(grid_x.ravel(), grid_y.ravel())
+
+    distances = np.full(len(points), np.inf)
+    settlements_tree = trees["settlements"]
+    if len(settlements_tree):
+        (point_idx, _), nearest = settlements_tree.query_nearest(
+            points, return_distance=True, all_matches=False
+        )
+        distances[point_idx] = nearest
+
+    in_protected_area = np.zeros(len(points), dtype=bool)
+    protected_areas_tree = trees["protected_areas"]
+    if len(protected_areas_tree):
+        point_idx, _ = protected_areas_tree.query(points, predicate="intersects")
+        in_protected_area[point_idx] = True
+
+    shape = (row_stop - row_start, n_cols)
+    return row_start, distances.reshape(shape), in_protected_area.reshape(shape)
+
+
+def compute_suitability_grid(
+        bbox: tuple[float, float, float, float],
+        cell_size: float,
+        settlements_gdf: gpd.GeoDataFrame,
+        protected_areas_gdf: gpd.GeoDataFrame,
+        min_distance_to_settlements_m: float,
+        no_build_in_protected_area: bool = True,
+        pool: Executor | None = None,
+        layer_files: tuple[Path, Path] | None = None,
+) -> SuitabilityGrid:
+    """
+    Rasterizes settlement distance and protected-area membership over a bbox (in GERMANY_CRS).
+    The grid is split into bands of TILE_ROWS rows. With a pool (see create_raster_pool) and the
+    files of the two layers, the bands are computed by the pool workers, which read the layers from
+    the files once per file version instead of being sent the geometries with every grid.
+    """
+    min_x, min_y, max_x, max_y = bbox
+    if cell_size <= 0 or max_x <= min_x or max_y <= min_y:
+        raise ValueError("bbox must have a positive extent and cell_size must be positive.")
+
+    n_cols = math.ceil((max_x - min_x) / cell_size)
+    n_rows = math.ceil((max_y - min_y) / cell_size)
+    if n_cols * n_rows > MAX_GRID_CELLS:
+        raise ValueError(f"Grid of {n_rows}x{n_cols} cells exceeds the limit of {MAX_GRID_CELLS} cells.")
+
+    origin = (min_x, max_y)
+    distances = np.empty((n_rows, n_cols), dtype=np.float32)
+    in_protected_area = np.empty((n_rows, n_cols), dtype=bool)
+
+    bands = [(start, min(start + TILE_ROWS, n_rows)) for start in range(0, n_rows, TILE_ROWS)]
+
+    if pool is not None and layer_files is not None:
+        file_keys = tuple(_file_key(Path(path)) for path in layer_files)
+        futures = [
+            pool.submit(_compute_tile, start, stop, n_cols, origin, cell_size, layer_files=file_keys)
+            for start, stop in bands
+        ]
+        try:
+            for future in futures:
+                row_start, tile_distances, tile_flags = future.result()
+                distances[row_start:row_start + len(tile_distances)] = tile_distances
+                in_protected_area[row_start:row_start + len(tile_flags)] = tile_flags
+        finally:
+            for future in futures:
+                future.cancel()
+    else:
+        settlements_wkb = shapely.to_wkb(settlements_gdf.geometry.to_crs(GERMANY_CRS).values)
+        protected_areas_wkb = shapely.to_wkb(protected_areas_gdf.geometry.to_crs(GERMANY_CRS).values)
+        trees = _build_trees(settlements_wkb, protected_areas_wkb)
+        for start, stop in bands:
+            _, distances[start:stop], in_protected_area[start:stop] = _compute_tile(
+                start, stop, n_cols, origin, cell_size, trees
+            )
+
+    compliant = distances >= min_distance_to_settlements_m
+    if no_build_in_protected_area:
+        compliant &= ~in_protected_area
+
+    return SuitabilityGrid(
+        distance_to_settlements_m=distances,
+        in_protected_area=in_protected_area,
+        compliant=compliant,
+        origin=origin,
+        cell_size=cell_size,
+    )
+
+
+def grid_to_npz(grid: SuitabilityGrid) -> bytes:
+    """Serializes the grid as a compressed .npz archive including its georeference."""
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        distance_to_settlements_m=grid.distance_to_settlements_m,
+        in_protected_area=grid.in_protected_area,
+        compliant=grid.compliant,
+        origin=np.array(grid.origin),
+        cell_size=np.array(grid.cell_size),
+        crs=np.array(grid.crs),
+    )
+    return buffer.getvalue()
+
+
+def grid_to_geotiff(grid: SuitabilityGrid) -> bytes:
+    """
+    Serializes the grid as a 3-band GeoTIFF (distance, protected flag, compliance).
+    Requires rasterio, which is not a core dependency.
+    """
+    import rasterio
+    from rasterio.io import MemoryFile
+    from rasterio.transform import from_origin
+
+    n_rows, n_cols = grid.shape
+    transform = from_origin(grid.origin[0], grid.origin[1], grid.cell_size, grid.cell_size)
+    with MemoryFile() as memfile:
+        with memfile.open(
+                driver="GTiff",
+                height=n_rows,
+                width=n_cols,
+                count=3,
+                dtype=rasterio.float32,
+                crs=grid.crs,
+                transform=transform,
+                compress="deflate",
+        ) as dataset:
+            dataset.write(grid.distance_to_settlements_m, 1)
+            dataset.write(grid.in_protected_area.astype(np.float32), 2)
+            dataset.write(grid.compliant.astype(np.float32), 3)
+            dataset.set_band_description(1, "distance_to_settlements_m")
+            dataset.set_band_description(2, "in_protected_area")
+            dataset.set_band_description(3, "compliant")
+        return memfile.read()
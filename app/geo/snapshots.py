@@ -0,0 +1,166 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from app.geo.analysis import GERMANY_CRS
+
+# Pointer file naming the active snapshot directory.
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+# Older snapshots kept next to the current one, so workers still reading them are not disturbed.
+KEEP_SNAPSHOTS = 3
+
+# Attribute columns that take part in the feature hash.
+HASHED_COLUMNS = ("type", "name")
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """An immutable, versioned set of reference layers (one FlatGeobuf per layer) with its manifest."""
+    version: str
+    directory: Path
+    manifest: dict
+
+    def layer_paths(self) -> dict[str, Path]:
+        return {name: self.directory / layer["file"] for name, layer in self.manifest["layers"].items()}
+
+
+def feature_hashes(gdf: gpd.GeoDataFrame) -> np.ndarray:
+    """Sorted 64-bit hashes of the features (normalized WKB plus the hashed attributes); equal features hash equal."""
+    wkb = shapely.to_wkb(shapely.normalize(np.asarray(gdf.geometry.values)), output_dimension=2)
+    columns = [gdf[c].astype(object).where(gdf[c].notna(), None).tolist() for c in HASHED_COLUMNS if c in gdf.columns]
+    hashes = np.empty(len(gdf), dtype=np.uint64)
+    for i, blob in enumerate(wkb):
+        digest = hashlib.blake2b(blob or b"", digest_size=8)
+        for values in columns:
+            digest.update(b"\0" + str(values[i]).encode("utf-8"))
+        hashes[i] = int.from_bytes(digest.digest(), "little")
+    return np.sort(hashes)
+
+
+def layer_diff(old_hashes: np.ndarray | None, new_hashes: np.ndarray) -> dict:
+    """Counts of added, removed and unchanged features between two sorted hash arrays (duplicates counted once)."""
+    if old_hashes is None:
+        return {"added": int(len(new_hashes)), "removed": 0, "unchanged": 0}
+    unchanged = len(np.intersect1d(old_hashes, new_hashes, assume_unique=False))
+    return {
+        "added": int(len(np.unique(new_hashes)) - unchanged),
+        "removed": int(len(np.unique(old_hashes)) - unchanged),
+        "unchanged": int(unchanged),
+    }
+
+
+def current_snapshot(snapshots_dir: Path) -> Snapshot | None:
+    """The snapshot CURRENT points to, or None if no snapshot was published yet."""
+    try:
+        version = (Path(snapshots_dir) / CURRENT_FILE).read_text(encoding="utf-8").strip()
+        directory = Path(snapshots_dir) / version
+        manifest = json.loads((directory / MANIFEST_FILE).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    return Snapshot(version=version, directory=directory, manifest=manifest)
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _write_current(snapshots_dir: Path, version: str) -> None:
+    """Switches CURRENT with a rename, so readers see either the old or the new version."""
+    fd, tmp = tempfile.mkstemp(prefix=f".{CURRENT_FILE}-", dir=snapshots_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(tmp, snapshots_dir / CURRENT_FILE)
+
+
+def _prune(snapshots_dir: Path, current: str, keep: int) -> None:
+    """Deletes all but the newest keep snapshots (by their manifest's created_at), never the current one."""
+    created = {}
+    for directory in snapshots_dir.iterdir():
+        if directory.is_dir() and (directory / MANIFEST_FILE).exists():
+            created[directory] = json.loads((directory / MANIFEST_FILE).read_text(encoding="utf-8"))["created_at"]
+    for directory in sorted(created, key=created.get)[:-keep]:
+        if directory.name != current:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def write_snapshot(
+        layers: dict[str, gpd.GeoDataFrame],
+        snapshots_dir: Path,
+        keep: int = KEEP_SNAPSHOTS,
+) -> tuple[Snapshot, bool]:
+    """
+    Publishes the layers as a new snapshot if any of them changed since the current one. Layers are
+    compared by their feature hashes; unchanged layers are hard-linked from the previous snapshot
+    instead of being written again. The manifest records per-layer feature counts and the diff
+    against the previous snapshot. The directory is renamed into place before CURRENT is switched.
+    Returns the current snapshot and whether a new one was written.
+    """
+    snapshots_dir = Path(snapshots_dir)
+    snapshots_dir.mkdir(parents=True, exist_ok=True)
+    previous = current_snapshot(snapshots_dir)
+    previous_layers = previous.manifest["layers"] if previous else {}
+
+    hashes = {name: feature_hashes(gdf) for name, gdf in layers.items()}
+    content_hashes = {name: hashlib.sha256(h.tobytes()).hexdigest()[:16] for name, h in hashes.items()}
+    unchanged = {
+        name for name in layers
+        if name in previous_layers and previous_layers[name]["content_hash"] == content_hashes[name]
+    }
+    if previous is not None and unchanged == set(layers) == set(previous_layers):
+        return previous, False
+
+    created_at = datetime.now(timezone.utc)
+    dataset_hash = hashlib.sha256("|".join(f"{n}:{content_hashes[n]}" for n in sorted(layers)).encode()).hexdigest()
+    version = f"{created_at:%Y%m%dT%H%M%SZ}-{dataset_hash[:8]}"
+
+    tmp = Path(tempfile.mkdtemp(prefix=f".{version}-", dir=snapshots_dir))
+    try:
+        manifest_layers = {}
+        for name, gdf in layers.items():
+            file_name = f"{name}.fgb"
+            old_hashes = None
+            if name in previous_layers:
+                old_hashes = np.load(previous.directory / f"{name}.hashes.npy")
+            if name in unchanged:
+                _link_or_copy(previous.directory / file_name, tmp / file_name)
+                _link_or_copy(previous.directory / f"{name}.hashes.npy", tmp / f"{name}.hashes.npy")
+            else:
+                gdf = gdf.to_crs(GERMANY_CRS) if gdf.crs is not None else gdf.set_crs(GERMANY_CRS)
+                gdf.to_file(tmp / file_name, driver="FlatGeobuf", engine="pyogrio", SPATIAL_INDEX="YES")
+                np.save(tmp / f"{name}.hashes.npy", hashes[name])
+            manifest_layers[name] = {
+                "file": file_name,
+                "count": len(gdf),
+                "content_hash": content_hashes[name],
+                "diff": layer_diff(old_hashes, hashes[name]),
+            }
+
+        manifest = {
+            "version": version,
+            "created_at": created_at.isoformat(),
+            "previous_version": previous.version if previous else None,
+            "layers": manifest_layers,
+        }
+        (tmp / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, snapshots_dir / version)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    _write_current(snapshots_dir, version)
+    _prune(snapshots_dir, version, keep)
+    return Snapshot(version=version, directory=snapshots_dir / version, manifest=manifest), True
@@ -0,0 +1,463 @@
+from dataclasses import dataclass
+from pathlib import Path
+import copy
+import hashlib
+import logging
+import shutil
+import threading
+
+import geopandas as gpd
+import numpy as np
+
+from app.geo.analysis import CONSTRAINT_LAYERS, GERMANY_CRS
+from app.geo.crs import REPROJECTION_SCALE_MARGIN, bounds_crs, to_crs
+from app.geo.packed import PackedLayer, pack_layer, packed_directory
+from app.geo.parser import load_geodataframe
+from app.geo.snapshots import Snapshot, current_snapshot
+from app.geo.window import INITIAL_SEARCH_RADIUS_M, WindowedLayer
+
+logger = logging.getLogger(__name__)
+
+PROCESSED_DIR = Path(__file__).parents[2] / "data" / "processed"
+PACKED_DIR = PROCESSED_DIR / "packed"
+SNAPSHOTS_DIR = PROCESSED_DIR / "snapshots"
+
+# Layers kept projected to another zone than the store's; the oldest projection is dropped beyond that.
+MAX_PROJECTED_LAYERS = 8
+
+REFERENCE_LAYER_PATHS = {
+    "settlements": PROCESSED_DIR / "settlements.gpkg",
+    "protected_areas": PROCESSED_DIR / "protected_areas.gpkg",
+}
+
+# Sources of the additional constraint layers (see analysis.CONSTRAINT_LAYERS); they are used when present.
+CONSTRAINT_SOURCE_PATHS = {
+    name: PROCESSED_DIR / f"{name}.gpkg"
+    for name in ("roads", "railways", "power_lines", "airports", "water_bodies")
+}
+
+
+def resolve_layer_path(path: Path) -> Path:
+    """
+    Prefers the Hilbert-sorted FlatGeobuf written by the preprocessing build stage over the GPKG,
+    as long as it is not older than the GPKG.
+    """
+    fgb_path = path.with_suffix(".fgb")
+    if fgb_path.exists() and (not path.exists() or fgb_path.stat().st_mtime_ns >= path.stat().st_mtime_ns):
+        return fgb_path
+    return path
+
+
+def _file_signature(path: Path) -> tuple[int, int]:
+    """Cheap change marker for a file: (mtime in ns, size in bytes)."""
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _snapshot_version(snapshot: Snapshot | None) -> str | None:
+    return snapshot.version if snapshot is not None else None
+
+
+@dataclass(frozen=True)
+class ReferenceLayer:
+    name: str
+    path: Path
+    signature: tuple[int, int]
+    gdf: gpd.GeoDataFrame
+
+
+class ReferenceLayerStore:
+    """
+    Keeps the processed reference layers in memory, projected to GERMANY_CRS
+    and with their spatial index built. A layer is reloaded transparently
+    when its file on disk changes.
+
+    With snapshots_dir, the layers of the snapshot published there (see app.geo.snapshots) replace
+    the plain files, and refresh() switches to a newer snapshot once it is fully loaded. Requests
+    should work on pinned() views, which keep the layers of the version they started with.
+
+    Sites are analyzed in the UTM zone they lie in (see app.geo.crs); the layer accessors take that
+    crs and return the layers in it, projected once per zone (None: the store's crs). load_all()
+    projects the layers to analysis_crs up front, or with "auto" to every zone the data covers.
+    """
+
+    # Per-layer caches; views share them, a snapshot switch starts with new empty ones.
+    _cache_names = ("_layers", "_projected")
+
+    def __init__(
+            self,
+            paths: dict[str, Path] | None = None,
+            crs: str = GERMANY_CRS,
+            optional_paths: dict[str, Path] | None = None,
+            snapshots_dir: Path | None = None,
+            analysis_crs: str = "auto",
+    ):
+        required = dict(paths or REFERENCE_LAYER_PATHS)
+        optional = dict(CONSTRAINT_SOURCE_PATHS if optional_paths is None else optional_paths)
+        self._file_paths = {**optional, **required}
+        self.optional_names = set(optional) - set(required)
+        self.crs = crs
+        self.analysis_crs = analysis_crs
+        self.snapshots_dir = snapshots_dir
+        self._lock = threading.Lock()
+        self._activate(current_snapshot(snapshots_dir) if snapshots_dir is not None else None)
+
+    def _activate(self, snapshot: Snapshot | None) -> None:
+        self.snapshot = snapshot
+        self.paths = {**self._file_paths, **(snapshot.layer_paths() if snapshot else {})}
+        for name in self._cache_names:
+            setattr(self, name, {})
+
+    def pinned(self) -> "ReferenceLayerStore":
+        """
+        A view of the current version that a later refresh() does not change. It shares the caches,
+        so what a view loads or projects is kept for the store and every other view of that version;
+        refresh() swaps in new caches and leaves the old ones to the views still pinned to them.
+        """
+        with self._lock:
+            return copy.copy(self)
+
+    def refresh(self) -> bool:
+        """
+        Switches to the snapshot CURRENT now points to, if it changed. The new layers are loaded
+        before the switch, so requests never wait for them and in-flight ones keep the old layers.
+        """
+        if self.snapshots_dir is None:
+            return False
+        snapshot = current_snapshot(self.snapshots_dir)
+        if _snapshot_version(snapshot) == _snapshot_version(self.snapshot):
+            return False
+
+        staged = copy.copy(self)
+        staged._activate(snapshot)
+        staged.load_all()
+        with self._lock:
+            self.__dict__.update(staged.__dict__)
+        logger.info("Switched reference layers to snapshot %s", _snapshot_version(snapshot))
+        return True
+
+    def load_all(self) -> None:
+        """
+        Loads every layer whose file exists and projects it to the analysis zones, so no request waits
+        for that while holding the lock. Missing files are loaded on first access.
+        """
+        for name, path in self.paths.items():
+            if self.available(name):
+                self.get(name)
+            else:
+                self._log_missing(name, path)
+        self._project_to_zones()
+
+    def _project_to_zones(self) -> None:
+        """Projects the loaded layers (required ones first) to up to MAX_PROJECTED_LAYERS zone/layer pairs."""
+        loaded = [layer.gdf for layer in self._layers.values() if not layer.gdf.empty]
+        if self.analysis_crs != "auto":
+            zones = [self.analysis_crs]
+        elif loaded:
+            bounds = np.array([gdf.total_bounds for gdf in loaded])
+            zones = bounds_crs((*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)), self.crs)
+        else:
+            zones = []
+        names = sorted(self._layers, key=lambda name: name in self.optional_names)
+        pairs = [(name, zone) for zone in zones if zone != self.crs for name in names]
+        if len(pairs) > MAX_PROJECTED_LAYERS:
+            logger.info("Projecting %d of %d layer/zone pairs up front", MAX_PROJECTED_LAYERS, len(pairs))
+        for name, zone in pairs[:MAX_PROJECTED_LAYERS]:
+            self.get_projected(name, zone)
+
+    def available(self, name: str) -> bool:
+        return name in self.paths and resolve_layer_path(self.paths[name]).exists()
+
+    def _log_missing(self, name: str, path: Path) -> None:
+        if name in self.optional_names:
+            logger.info("Optional constraint layer %s not found at %s, skipping it", name, path)
+        else:
+            logger.warning("Reference layer %s not found at %s", name, path)
+
+    def version(self) -> str:
+        """
+        Dataset version: the snapshot version, or a short hash over the file signatures of the layers
+        that are not part of a snapshot (changes whenever such a file is regenerated), or both.
+        """
+        snapshot_layers = self.snapshot.manifest["layers"] if self.snapshot else {}
+        parts = []
+        for name, path in sorted(self.paths.items()):
+            if name in snapshot_layers:
+                continue
+            path = resolve_layer_path(path)
+            signature = _file_signature(path) if path.exists() else None
+            parts.append(f"{name}:{path.suffix}:{signature}")
+        files_hash = hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+        if self.snapshot is None:
+            return files_hash
+        if not any(self.available(name) for name in self.paths if name not in snapshot_layers):
+            return self.snapshot.version
+        return f"{self.snapshot.version}+{files_hash}"
+
+    def get(self, name: str) -> gpd.GeoDataFrame:
+        """Returns the layer, reloading it first if the file changed since the last load."""
+        path = resolve_layer_path(self.paths[name])
+        signature = _file_signature(path)
+        layer = self._layers.get(name)
+
+        if layer is None or layer.path != path or layer.signature != signature:
+            with self._lock:
+                layer = self._layers.get(name)
+                if layer is None or layer.path != path or layer.signature != signature:
+                    layer = self._load(name, path, signature)
+                    self._layers[name] = layer
+
+        return layer.gdf
+
+    def get_projected(self, name: str, crs: str | None = None) -> gpd.GeoDataFrame:
+        """The layer in crs with its spatial index, projected once per file version and crs."""
+        gdf = self.get(name)
+        if crs is None or crs == self.crs:
+            return gdf
+        entry = self._projected.get((name, crs))
+
+        if entry is None or entry[0] is not gdf:
+            with self._lock:
+                entry = self._projected.get((name, crs))
+                if entry is None or entry[0] is not gdf:
+                    logger.info("Projecting reference layer %s to %s", name, crs)
+                    projected = to_crs(gdf, crs)
+                    _ = projected.sindex
+                    entry = (gdf, projected)
+                    self._projected.pop((name, crs), None)
+                    if len(self._projected) >= MAX_PROJECTED_LAYERS:
+                        del self._projected[next(iter(self._projected))]
+                    self._projected[(name, crs)] = entry
+
+        return entry[1]
+
+    def _load(self, name: str, path: Path, signature: tuple[int, int]) -> ReferenceLayer:
+        logger.info("Loading reference layer %s from %s", name, path)
+        gdf = load_geodataframe(path)
+        if gdf.crs is None:
+            gdf = gdf.set_crs(self.crs)
+        elif gdf.crs != self.crs:
+            gdf = gdf.to_crs(self.crs)
+
+        # Build the STRtree now instead of on the first request that needs it.
+        _ = gdf.sindex
+        return ReferenceLayer(name=name, path=path, signature=signature, gdf=gdf)
+
+    def layers_for_site(
+            self, site_geo, crs: str | None = None, settlement_types=()
+    ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        """
+        Settlements and protected areas in crs to analyze site_geo (in the store's crs) against
+        (the full layers here). The settlements hold the nearest one of each of settlement_types
+        (sets of types, see RuleSet.typed_distances) too.
+        """
+        return self.get_projected("settlements", crs), self.get_projected("protected_areas", crs)
+
+    def layers_for_sites(
+            self, geometries, crs: str | None = None, settlement_types=()
+    ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        """layers_for_site for a batch of sites (array of geometries in the store's crs) analyzed together."""
+        return self.get_projected("settlements", crs), self.get_projected("protected_areas", crs)
+
+    def layers_for_bbox(self, bounds) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        """
+        Settlements and protected areas (in the store's crs) to rasterize bounds against: the nearest
+        settlement of every point and every protected area intersecting bounds.
+        """
+        return self.get("settlements"), self.get("protected_areas")
+
+    def _constraint_source_names(self) -> list[str]:
+        sources = {layer.source for layer in CONSTRAINT_LAYERS.values()}
+        return [name for name in sorted(sources) if self.available(name)]
+
+    def constraint_sources(self, site_geo, crs: str | None = None) -> dict[str, gpd.GeoDataFrame]:
+        """Every available source layer of a registered constraint layer, for analyze_site's constraint_sources."""
+        return {name: self._source_for_site(name, site_geo, crs) for name in self._constraint_source_names()}
+
+    def constraint_sources_for_sites(self, geometries, crs: str | None = None) -> dict[str, gpd.GeoDataFrame]:
+        """constraint_sources for a batch of sites (array of geometries in the store's crs), see layers_for_sites."""
+        return {name: self._source_for_sites(name, geometries, crs) for name in self._constraint_source_names()}
+
+    def _source_for_site(self, name: str, site_geo, crs: str | None) -> gpd.GeoDataFrame:
+        return self.get_projected(name, crs)
+
+    def _source_for_sites(self, name: str, geometries, crs: str | None) -> gpd.GeoDataFrame:
+        return self.get_projected(name, crs)
+
+    def features_near(self, name: str, site_geo, distance_m: float, crs: str | None = None) -> gpd.GeoDataFrame:
+        """A layer in crs containing at least every feature within distance_m of site_geo (the full layer here)."""
+        return self.get_projected(name, crs)
+
+
+class WindowedReferenceStore(ReferenceLayerStore):
+    """
+    Low-memory variant of the store for small workers. Instead of holding the layers in memory,
+    layers_for_site reads only a window around the site through the file's spatial index, grown
+    until it provably contains the nearest feature, so analyze_site returns identical results.
+    Batches and rasters read one window covering all their sites (layers_for_sites, layers_for_bbox);
+    get() still reads a whole layer, without keeping it.
+    """
+
+    _cache_names = ("_layers", "_projected", "_windowed")
+
+    def __init__(
+            self,
+            paths: dict[str, Path] | None = None,
+            crs: str = GERMANY_CRS,
+            tile_size_m: float = 10_000,
+            max_tiles: int = 64,
+            optional_paths: dict[str, Path] | None = None,
+            snapshots_dir: Path | None = None,
+    ):
+        self.tile_size_m = tile_size_m
+        self.max_tiles = max_tiles
+        super().__init__(paths, crs, optional_paths, snapshots_dir)
+
+    def load_all(self) -> None:
+        for name, path in self.paths.items():
+            if self.available(name):
+                self.windowed_layer(name)
+            else:
+                self._log_missing(name, path)
+
+    def get(self, name: str) -> gpd.GeoDataFrame:
+        path = resolve_layer_path(self.paths[name])
+        return self._load(name, path, _file_signature(path)).gdf
+
+    def get_projected(self, name: str, crs: str | None = None) -> gpd.GeoDataFrame:
+        gdf = self.get(name)
+        return gdf if crs is None or crs == self.crs else to_crs(gdf, crs)
+
+    def windowed_layer(self, name: str) -> WindowedLayer:
+        """Returns the tile reader for a layer, replacing it (and its tiles) when the file changed."""
+        path = resolve_layer_path(self.paths[name])
+        signature = _file_signature(path)
+        entry = self._windowed.get(name)
+
+        if entry is None or entry[0] != path or entry[1] != signature:
+            with self._lock:
+                entry = self._windowed.get(name)
+                if entry is None or entry[0] != path or entry[1] != signature:
+                    entry = (path, signature, WindowedLayer(path, self.tile_size_m, self.max_tiles))
+                    self._windowed[name] = entry
+
+        return entry[2]
+
+    def _window(
+            self, name: str, site_geo, crs: str | None, radius_m: float = INITIAL_SEARCH_RADIUS_M, type_sets=()
+    ):
+        """
+        Nearest window of a layer around site_geo, in crs; grown when distances are measured in another
+        zone, and until it holds the nearest feature of each set of types in type_sets.
+        """
+        layer = self.windowed_layer(name)
+        scale_margin = 1.0 if crs is None or crs == self.crs else REPROJECTION_SCALE_MARGIN
+        # All windows are the site bbox grown by some radius, so the largest contains the others.
+        window = max(
+            (
+                layer.nearest_window(site_geo, radius_m, scale_margin=scale_margin, types=types)
+                for types in [None, *type_sets]
+            ),
+            key=len,
+        )
+        return window if scale_margin == 1.0 else to_crs(window, crs)
+
+    def layers_for_site(
+            self, site_geo, crs: str | None = None, settlement_types=()
+    ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        return (
+            self._window("settlements", site_geo, crs, type_sets=settlement_types),
+            self._window("protected_areas", site_geo, crs),
+        )
+
+    def layers_for_sites(
+            self, geometries, crs: str | None = None, settlement_types=()
+    ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        scale_margin = 1.0 if crs is None or crs == self.crs else REPROJECTION_SCALE_MARGIN
+        settlements = self.windowed_layer("settlements")
+        # All windows are the bbox of the sites grown by some radius, so the largest contains the others.
+        settlements_window = max(
+            (
+                settlements.covering_window(geometries, scale_margin=scale_margin, types=types)
+                for types in [None, *settlement_types]
+            ),
+            key=len,
+        )
+        protected_areas_window = self.windowed_layer("protected_areas").covering_window(
+            geometries, scale_margin=scale_margin
+        )
+        if scale_margin == 1.0:
+            return settlements_window, protected_areas_window
+        return to_crs(settlements_window, crs), to_crs(protected_areas_window, crs)
+
+    def layers_for_bbox(self, bounds) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        protected_areas, _ = self.windowed_layer("protected_areas").read_window(bounds)
+        return self.windowed_layer("settlements").area_window(bounds), protected_areas
+
+    @staticmethod
+    def _constraint_radius(name: str) -> float:
+        # The window must cover the largest buffer; the nearest distance of a type-filtered
+        # constraint is only found if a matching feature lies inside the window.
+        return max(
+            [INITIAL_SEARCH_RADIUS_M] + [layer.buffer_m for layer in CONSTRAINT_LAYERS.values() if layer.source == name]
+        )
+
+    def _source_for_site(self, name: str, site_geo, crs: str | None) -> gpd.GeoDataFrame:
+        return self._window(name, site_geo, crs, self._constraint_radius(name))
+
+    def _source_for_sites(self, name: str, geometries, crs: str | None) -> gpd.GeoDataFrame:
+        scale_margin = 1.0 if crs is None or crs == self.crs else REPROJECTION_SCALE_MARGIN
+        window = self.windowed_layer(name).covering_window(
+            geometries, self._constraint_radius(name), scale_margin=scale_margin
+        )
+        return window if scale_margin == 1.0 else to_crs(window, crs)
+
+    def features_near(self, name: str, site_geo, distance_m: float, crs: str | None = None) -> gpd.GeoDataFrame:
+        # The first window read already covers the site bbox grown by the radius.
+        return self._window(name, site_geo, crs, max(distance_m, 1.0))
+
+
+class SharedReferenceStore(WindowedReferenceStore):
+    """
+    Store for running several worker processes. Each layer is packed once into flat arrays under
+    PACKED_DIR (see app.geo.packed) that every worker memory-maps read-only, so the geometry and its
+    R-tree live once in the OS page cache however many workers there are. layers_for_site decodes
+    only the window around the site, exactly like the windowed store.
+    """
+
+    def __init__(
+            self,
+            paths: dict[str, Path] | None = None,
+            crs: str = GERMANY_CRS,
+            packed_dir: Path = PACKED_DIR,
+            optional_paths: dict[str, Path] | None = None,
+            snapshots_dir: Path | None = None,
+    ):
+        self.packed_dir = Path(packed_dir)
+        super().__init__(paths, crs, optional_paths=optional_paths, snapshots_dir=snapshots_dir)
+
+    def windowed_layer(self, name: str) -> PackedLayer:
+        """Returns the mapped packed layer, packing the file first if no worker has done so yet."""
+        path = resolve_layer_path(self.paths[name])
+        signature = _file_signature(path)
+        entry = self._windowed.get(name)
+
+        if entry is None or entry[0] != path or entry[1] != signature:
+            with self._lock:
+                entry = self._windowed.get(name)
+                if entry is None or entry[0] != path or entry[1] != signature:
+                    directory = packed_directory(self.packed_dir, name, path)
+                    if not (directory / "meta.json").exists():
+                        logger.info("Packing reference layer %s into %s", name, directory)
+                        pack_layer(self._load(name, path, signature).gdf, directory)
+                        self._remove_stale_packs(name, directory)
+                    entry = (path, signature, PackedLayer(directory))
+                    self._windowed[name] = entry
+
+        return entry[2]
+
+    def _remove_stale_packs(self, name: str, current: Path) -> None:
+        """Deletes packs of older versions of the file; workers still mapping them keep their open files."""
+        for directory in self.packed_dir.glob(f"{name}-*"):
+            if directory != current:
+                shutil.rmtree(directory, ignore_errors=True)
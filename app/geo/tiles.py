@@ -0,0 +1,367 @@
+from pathlib import Path
+import logging
+import math
+import sqlite3
+import threading
+
+import geopandas as gpd
+import numpy as np
+import pyogrio
+import shapely
+
+from app.geo.analysis import GERMANY_CRS
+from app.geo.crs import get_transformer, to_crs
+from app.geo.parser import load_geodataframe, load_geodataframe_bbox
+from app.geo.store import PROCESSED_DIR, REFERENCE_LAYER_PATHS, resolve_layer_path
+
+logger = logging.getLogger(__name__)
+
+TILES_DIR = PROCESSED_DIR / "tiles"
+
+# Web Mercator (EPSG:3857) is the tiling scheme of Leaflet/folium.
+TILE_CRS = "EPSG:3857"
+WORLD_HALF_SIZE = 20037508.342789244
+
+# Integer coordinate range of one tile and the buffer around it (in tile units) that features are clipped to.
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Zooms at which a layer is served; below the minimum a tile would hold too many features to be useful.
+TILE_ZOOM_RANGES = {
+    "settlements": (10, 16),
+    "protected_areas": (6, 16),
+}
+
+# The preprocessing step seeds all non-empty tiles up to this zoom; deeper tiles are cached on first request.
+TILE_SEED_MAX_ZOOM = 12
+
+TILE_PROPERTIES = ("name", "type")
+
+# MVT geometry types and commands (Mapbox Vector Tile specification 2.1).
+_POINT, _LINESTRING, _POLYGON = 1, 2, 3
+_MOVE_TO, _LINE_TO, _CLOSE_PATH = 1, 2, 7
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Bounds of an XYZ tile in TILE_CRS."""
+    size = 2 * WORLD_HALF_SIZE / 2 ** z
+    min_x = -WORLD_HALF_SIZE + x * size
+    max_y = WORLD_HALF_SIZE - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def tiles_for_bounds(bounds, z: int) -> list[tuple[int, int]]:
+    """XYZ tiles at zoom z intersecting bounds (in TILE_CRS)."""
+    size = 2 * WORLD_HALF_SIZE / 2 ** z
+    n = 2 ** z
+
+    def clamp(value: float) -> int:
+        return min(max(int(math.floor(value)), 0), n - 1)
+
+    x0, x1 = clamp((bounds[0] + WORLD_HALF_SIZE) / size), clamp((bounds[2] + WORLD_HALF_SIZE) / size)
+    y0, y1 = clamp((WORLD_HALF_SIZE - bounds[3]) / size), clamp((WORLD_HALF_SIZE - bounds[1]) / size)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+# --- Protocol buffer encoding (just what vector_tile.proto needs) ---
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field_varint(field: int, value: int) -> bytes:
+    return _varint(field << 3) + _varint(value)
+
+
+def _field_bytes(field: int, value: bytes) -> bytes:
+    return _varint(field << 3 | 2) + _varint(len(value)) + value
+
+
+def _field_packed(field: int, values: list[int]) -> bytes:
+    return _field_bytes(field, b"".join(_varint(v) for v in values))
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _encode_value(value) -> bytes:
+    if isinstance(value, (bool, np.bool_)):
+        return _field_varint(7, int(value))
+    if isinstance(value, (int, np.integer)):
+        return _field_varint(6, _zigzag(int(value)))
+    if isinstance(value, (float, np.floating)):
+        return _varint(3 << 3 | 1) + np.float64(value).tobytes()
+    return _field_bytes(1, str(value).encode("utf-8"))
+
+
+# --- Geometry encoding ---
+
+def _command(command_id: int, count: int) -> int:
+    return command_id & 0x7 | count << 3
+
+
+class _GeometryEncoder:
+    """Encodes geometry commands with coordinates relative to the previous cursor position."""
+
+    def __init__(self):
+        self.commands: list[int] = []
+        self._cursor = (0, 0)
+
+    def _deltas(self, coords: list[list[int]]) -> list[int]:
+        out = []
+        for x, y in coords:
+            out += [_zigzag(x - self._cursor[0]), _zigzag(y - self._cursor[1])]
+            self._cursor = (x, y)
+        return out
+
+    def points(self, coords: list[list[int]]) -> None:
+        self.commands += [_command(_MOVE_TO, len(coords))] + self._deltas(coords)
+
+    def line(self, coords: list[list[int]], closed: bool = False) -> None:
+        self.commands += [_command(_MOVE_TO, 1)] + self._deltas(coords[:1])
+        self.commands += [_command(_LINE_TO, len(coords) - 1)] + self._deltas(coords[1:])
+        if closed:
+            self.commands.append(_command(_CLOSE_PATH, 1))
+
+
+def _coords(geometry) -> list[list[int]]:
+    return shapely.get_coordinates(geometry).astype(np.int64).tolist()
+
+
+def encode_geometry(geometry) -> tuple[int, list[int]] | None:
+    """
+    MVT geometry type and command integers for a geometry already in integer tile coordinates
+    (y pointing down). Returns None if nothing drawable is left.
+    """
+    parts = shapely.get_parts(geometry)
+    dimension = max((shapely.get_dimensions(part) for part in parts), default=-1)
+    parts = [part for part in parts if shapely.get_dimensions(part) == dimension]
+    encoder = _GeometryEncoder()
+
+    if dimension == 0:
+        encoder.points([xy for part in parts for xy in _coords(part)])
+        return _POINT, encoder.commands
+
+    if dimension == 1:
+        for part in parts:
+            coords = _coords(part)
+            if len(coords) >= 2:
+                encoder.line(coords)
+        return (_LINESTRING, encoder.commands) if encoder.commands else None
+
+    if dimension == 2:
+        for part in parts:
+            # The exterior ring must have a positive area in tile coordinates, interiors a negative one.
+            part = shapely.orient_polygons(part, exterior_cw=False)
+            for ring in [part.exterior, *part.interiors]:
+                coords = _coords(ring)[:-1]
+                if len(coords) >= 3:
+                    encoder.line(coords, closed=True)
+        return (_POLYGON, encoder.commands) if encoder.commands else None
+
+    return None
+
+
+def encode_layer(name: str, geometries: np.ndarray, properties: list[dict]) -> bytes:
+    """Encodes one MVT layer (version 2) from geometries in tile coordinates."""
+    keys: dict[str, int] = {}
+    values: dict[tuple[type, object], int] = {}
+    features = []
+
+    for feature_id, (geometry, props) in enumerate(zip(geometries, properties), start=1):
+        encoded = encode_geometry(geometry)
+        if encoded is None:
+            continue
+        geometry_type, commands = encoded
+
+        tags = []
+        for key, value in props.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+
+        feature = _field_varint(1, feature_id)
+        if tags:
+            feature += _field_packed(2, tags)
+        feature += _field_varint(3, geometry_type) + _field_packed(4, commands)
+        features.append(feature)
+
+    if not features:
+        return b""
+
+    layer = _field_bytes(1, name.encode("utf-8"))
+    layer += b"".join(_field_bytes(2, feature) for feature in features)
+    layer += b"".join(_field_bytes(3, key.encode("utf-8")) for key in keys)
+    layer += b"".join(_field_bytes(4, _encode_value(value)) for _, value in values)
+    layer += _field_varint(5, TILE_EXTENT) + _field_varint(15, 2)
+    return _field_bytes(3, layer)
+
+
+def buffered_tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Bounds of an XYZ tile in TILE_CRS grown by TILE_BUFFER, the area its features are clipped to."""
+    min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+    buffer = TILE_BUFFER * (max_x - min_x) / TILE_EXTENT
+    return min_x - buffer, min_y - buffer, max_x + buffer, max_y + buffer
+
+
+def render_tile(name: str, gdf: gpd.GeoDataFrame, z: int, x: int, y: int) -> bytes:
+    """
+    Renders one tile of a layer (in TILE_CRS, with spatial index). Features are clipped to the
+    buffered tile and simplified to one tile unit, so detail shrinks with the zoom level.
+    """
+    min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+    unit = (max_x - min_x) / TILE_EXTENT
+    clip_box = buffered_tile_bounds(z, x, y)
+
+    idx = np.sort(gdf.sindex.query(shapely.box(*clip_box)))
+    if not len(idx):
+        return b""
+
+    geometries = np.asarray(gdf.geometry.values)[idx]
+    geometries = shapely.simplify(shapely.clip_by_rect(geometries, *clip_box), unit, preserve_topology=True)
+    # To integer tile coordinates, y pointing down.
+    geometries = shapely.transform(
+        geometries, lambda coords: np.column_stack([(coords[:, 0] - min_x) / unit, (max_y - coords[:, 1]) / unit])
+    )
+    geometries = shapely.set_precision(geometries, 1.0)
+    keep = ~shapely.is_empty(geometries)
+    if not keep.any():
+        return b""
+
+    properties = gdf.iloc[idx[keep]][[column for column in TILE_PROPERTIES if column in gdf.columns]]
+    properties = properties.astype(object).where(properties.notna(), None)
+    return encode_layer(name, geometries[keep], properties.to_dict("records"))
+
+
+class VectorTileStore:
+    """
+    Serves MVT tiles of the reference layers from one MBTiles file per layer. Missing tiles are
+    rendered and stored on first request from just the features in the tile, read through the
+    layer file's spatial index, so no copy of the layers is held; a cache whose source file
+    changed is emptied first.
+    """
+
+    def __init__(self, paths: dict[str, Path] | None = None, tiles_dir: Path = TILES_DIR):
+        self.paths = dict(paths or REFERENCE_LAYER_PATHS)
+        self.tiles_dir = Path(tiles_dir)
+        self._connections: dict[str, sqlite3.Connection] = {}
+        self._signatures: dict[str, str] = {}
+        self._source_crs: dict[str, tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def layers(self) -> list[str]:
+        return [name for name in self.paths if name in TILE_ZOOM_RANGES]
+
+    def _source_signature(self, name: str) -> str:
+        path = resolve_layer_path(self.paths[name])
+        stat = path.stat()
+        return f"{path.name}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def _connection(self, name: str, signature: str) -> sqlite3.Connection:
+        """Opens (and if necessary creates or invalidates) the MBTiles file of a layer. Call with the lock held."""
+        conn = self._connections.get(name)
+        if conn is None:
+            self.tiles_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.tiles_dir / f"{name}.mbtiles", check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+                "tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))"
+            )
+            self._connections[name] = conn
+            row = conn.execute("SELECT value FROM metadata WHERE name = 'source_signature'").fetchone()
+            self._signatures[name] = row[0] if row else None
+
+        if self._signatures[name] != signature:
+            logger.info("Source of tile layer %s changed, clearing its tile cache", name)
+            min_zoom, max_zoom = TILE_ZOOM_RANGES[name]
+            with conn:
+                conn.execute("BEGIN")
+                conn.execute("DELETE FROM tiles")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                    [("name", name), ("format", "pbf"), ("minzoom", str(min_zoom)),
+                     ("maxzoom", str(max_zoom)), ("source_signature", signature)],
+                )
+            self._signatures[name] = signature
+        return conn
+
+    def _load_layer(self, name: str) -> gpd.GeoDataFrame:
+        """The whole layer in TILE_CRS with its spatial index, for seeding."""
+        gdf = to_crs(load_geodataframe(resolve_layer_path(self.paths[name])), TILE_CRS)
+        _ = gdf.sindex
+        return gdf
+
+    def _tile_window(self, name: str, signature: str, z: int, x: int, y: int) -> gpd.GeoDataFrame:
+        """The features of a layer that may show up in a tile (in TILE_CRS), read through the file's spatial index."""
+        path = resolve_layer_path(self.paths[name])
+        cached = self._source_crs.get(name)
+        if cached is None or cached[0] != signature:
+            # Files without a CRS are in GERMANY_CRS, like in the reference store.
+            cached = (signature, pyogrio.read_info(path)["crs"] or GERMANY_CRS)
+            self._source_crs[name] = cached
+        source_crs = cached[1]
+
+        bounds = get_transformer(TILE_CRS, source_crs).transform_bounds(*buffered_tile_bounds(z, x, y), densify_pts=21)
+        window = load_geodataframe_bbox(path, bounds)
+        if window.crs is None:
+            window = window.set_crs(source_crs)
+        return to_crs(window, TILE_CRS)
+
+    def get_tile(self, name: str, z: int, x: int, y: int) -> bytes:
+        """Tile bytes for XYZ coordinates (empty outside the layer's zoom range or data)."""
+        if name not in self.layers():
+            raise KeyError(name)
+        min_zoom, max_zoom = TILE_ZOOM_RANGES[name]
+        if not min_zoom <= z <= max_zoom or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return b""
+
+        signature = self._source_signature(name)
+        tile_row = 2 ** z - 1 - y  # MBTiles rows count from the south (TMS)
+        with self._lock:
+            conn = self._connection(name, signature)
+            row = conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, tile_row),
+            ).fetchone()
+            if row is not None:
+                return row[0]
+
+        data = render_tile(name, self._tile_window(name, signature, z, x, y), z, x, y)
+        with self._lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                (z, x, tile_row, data),
+            )
+        return data
+
+    def seed(self, name: str, max_zoom: int = TILE_SEED_MAX_ZOOM) -> int:
+        """Renders and stores every non-empty tile of a layer from its minimum zoom up to max_zoom."""
+        signature = self._source_signature(name)
+        min_zoom = TILE_ZOOM_RANGES[name][0]
+        count = 0
+        with self._lock:
+            conn = self._connection(name, signature)
+            gdf = self._load_layer(name)
+            for z in range(min_zoom, min(max_zoom, TILE_ZOOM_RANGES[name][1]) + 1):
+                rows = []
+                for x, y in tiles_for_bounds(gdf.total_bounds, z):
+                    data = render_tile(name, gdf, z, x, y)
+                    if data:
+                        rows.append((z, x, 2 ** z - 1 - y, data))
+                with conn:
+                    conn.execute("BEGIN")
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                count += len(rows)
+        return count
@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from pathlib import Path
+import math
+import threading
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyogrio
+import shapely
+
+from app.geo.analysis import GERMANY_CRS
+from app.geo.parser import load_geodataframe_bbox
+
+# Start radius around the site bbox in which the nearest feature is searched; doubled until found.
+INITIAL_SEARCH_RADIUS_M = 5_000
+
+
+def _expand(bounds, radius: float) -> tuple[float, float, float, float]:
+    min_x, min_y, max_x, max_y = bounds
+    return min_x - radius, min_y - radius, max_x + radius, max_y + radius
+
+
+def _covers(outer, inner) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+def _matching(window: gpd.GeoDataFrame, types) -> gpd.GeoDataFrame:
+    """The features of a window whose 'type' is one of types (all of them if types is None)."""
+    if types is None or window.empty:
+        return window
+    return window[window["type"].isin(list(types))]
+
+
+# Points per side of the lattice area_window samples the nearest distances on.
+AREA_SAMPLES = 32
+
+
+class WindowSource:
+    """Base of layers that read the features whose bbox intersects given bounds (read_window)."""
+
+    total_bounds: tuple[float, float, float, float]
+
+    def read_window(self, bounds) -> tuple[gpd.GeoDataFrame, tuple[float, float, float, float]]:
+        """Features whose bbox intersects bounds, and bounds that are known to be complete (containing bounds)."""
+        raise NotImplementedError
+
+    def nearest_window(
+            self,
+            site_geo,
+            initial_radius_m: float = INITIAL_SEARCH_RADIUS_M,
+            scale_margin: float = 1.0,
+            types=None,
+    ) -> gpd.GeoDataFrame:
+        """
+        Smallest window (grown by doubling the search radius) that provably contains the feature
+        nearest to site_geo and every feature intersecting it. Any feature within distance d of the
+        site has a bbox intersecting the site bbox expanded by d, so once the nearest candidate in a
+        window lies within the radius, no feature outside the window can be closer.
+        With types, the window must contain the nearest feature whose 'type' is one of them.
+        With scale_margin > 1 the final radius is grown by that factor, so the window stays complete
+        for distances measured in another projection whose scale differs by up to its square root.
+        A missing or empty site_geo (no bounds) gets an empty window.
+        """
+        if site_geo is None or site_geo.is_empty or not np.isfinite(site_geo.bounds).all():
+            return gpd.GeoDataFrame(geometry=[], crs=GERMANY_CRS)
+        radius = initial_radius_m
+        while True:
+            window, read_bounds = self.read_window(_expand(site_geo.bounds, radius))
+            if _covers(read_bounds, self.total_bounds):
+                return window
+            candidates = _matching(window, types)
+            if not candidates.empty and candidates.distance(site_geo).min() <= radius:
+                break
+            radius *= 2
+        if scale_margin > 1:
+            window, _ = self.read_window(_expand(site_geo.bounds, radius * scale_margin))
+        return window
+
+    def covering_window(
+            self,
+            geometries,
+            initial_radius_m: float = INITIAL_SEARCH_RADIUS_M,
+            scale_margin: float = 1.0,
+            types=None,
+    ) -> gpd.GeoDataFrame:
+        """
+        nearest_window for many sites at once: one window around all of them that provably contains
+        the nearest feature (of types) of every site and every feature intersecting one. The window
+        is complete for site i once its bbox grown by the distance d_i to the nearest candidate
+        (times scale_margin) lies within the bounds read, as any closer feature intersects that box.
+        """
+        geometries = np.asarray(geometries)
+        geometries = geometries[~shapely.is_empty(geometries) & ~shapely.is_missing(geometries)]
+        if not len(geometries):
+            return gpd.GeoDataFrame(geometry=[], crs=GERMANY_CRS)
+        site_bounds = shapely.bounds(geometries)
+        bounds = (*site_bounds[:, :2].min(axis=0), *site_bounds[:, 2:].max(axis=0))
+
+        radius = initial_radius_m
+        while True:
+            window, read_bounds = self.read_window(_expand(bounds, radius))
+            if _covers(read_bounds, self.total_bounds):
+                return window
+            candidates = _matching(window, types)
+            if not candidates.empty:
+                (site_idx, _), distances = candidates.sindex.nearest(
+                    geometries, return_all=False, return_distance=True
+                )
+                reach = np.zeros(len(geometries))
+                reach[site_idx] = distances * scale_margin
+                if (
+                        (site_bounds[:, 0] - reach >= read_bounds[0]).all()
+                        and (site_bounds[:, 1] - reach >= read_bounds[1]).all()
+                        and (site_bounds[:, 2] + reach <= read_bounds[2]).all()
+                        and (site_bounds[:, 3] + reach <= read_bounds[3]).all()
+                ):
+                    return window
+            radius *= 2
+
+    def area_window(self, bounds, initial_radius_m: float = INITIAL_SEARCH_RADIUS_M) -> gpd.GeoDataFrame:
+        """
+        Window holding the nearest feature of every point in bounds. The nearest distances are
+        measured on a lattice of AREA_SAMPLES² points; any point lies within half a lattice diagonal h
+        of one, so its nearest feature is at most the largest sampled distance plus h away.
+        """
+        xs = np.linspace(bounds[0], bounds[2], AREA_SAMPLES)
+        ys = np.linspace(bounds[1], bounds[3], AREA_SAMPLES)
+        samples = shapely.points(*(axis.ravel() for axis in np.meshgrid(xs, ys)))
+        window = self.covering_window(samples, initial_radius_m)
+        if window.empty:
+            return window
+        _, distances = window.sindex.nearest(samples, return_all=False, return_distance=True)
+        half_diagonal = math.hypot(xs[1] - xs[0], ys[1] - ys[0]) / 2
+        window, _ = self.read_window(_expand(bounds, float(distances.max()) + half_diagonal))
+        return window
+
+
+class WindowedLayer(WindowSource):
+    """
+    Reads a reference layer in square tiles of tile_size_m on demand instead of holding it in memory.
+    The most recently used max_tiles tiles are kept. The file must be in GERMANY_CRS, as written
+    by scripts/preprocess_all_data.py.
+    """
+
+    def __init__(self, path: Path, tile_size_m: float = 10_000, max_tiles: int = 64):
+        self.path = path
+        self.tile_size_m = tile_size_m
+        self.max_tiles = max_tiles
+        info = pyogrio.read_info(path, force_total_bounds=True)
+        if info["crs"] is not None and gpd.GeoSeries([], crs=info["crs"]).crs != GERMANY_CRS:
+            raise ValueError(f"{path} must be in {GERMANY_CRS} for windowed loading, found {info['crs']}.")
+        self.total_bounds = tuple(info["total_bounds"])
+        self._tiles: OrderedDict[tuple[int, int], gpd.GeoDataFrame] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tile(self, tx: int, ty: int) -> gpd.GeoDataFrame:
+        with self._lock:
+            tile = self._tiles.get((tx, ty))
+            if tile is not None:
+                self._tiles.move_to_end((tx, ty))
+                return tile
+
+        size = self.tile_size_m
+        tile = load_geodataframe_bbox(self.path, (tx * size, ty * size, (tx + 1) * size, (ty + 1) * size))
+        if tile.crs is None:
+            tile = tile.set_crs(GERMANY_CRS)
+
+        with self._lock:
+            self._tiles[(tx, ty)] = tile
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def read_window(self, bounds) -> tuple[gpd.GeoDataFrame, tuple[float, float, float, float]]:
+        """
+        Returns every feature whose bbox intersects bounds (deduplicated across tiles) and the
+        bounds of the tiles actually read, which contain the requested bounds.
+        """
+        size = self.tile_size_m
+        tx0, ty0 = math.floor(bounds[0] / size), math.floor(bounds[1] / size)
+        tx1, ty1 = math.floor(bounds[2] / size), math.floor(bounds[3] / size)
+
+        # Windows larger than the tile cache are read in one go and not cached.
+        if (tx1 - tx0 + 1) * (ty1 - ty0 + 1) > self.max_tiles:
+            window = load_geodataframe_bbox(self.path, bounds)
+            if window.crs is None:
+                window = window.set_crs(GERMANY_CRS)
+            return window, tuple(bounds)
+
+        tiles = [self._tile(tx, ty) for tx in range(tx0, tx1 + 1) for ty in range(ty0, ty1 + 1)]
+        tiles = [tile for tile in tiles if not tile.empty]
+
+        read_bounds = (tx0 * size, ty0 * size, (tx1 + 1) * size, (ty1 + 1) * size)
+        if not tiles:
+            return gpd.GeoDataFrame(geometry=[], crs=GERMANY_CRS), read_bounds
+        window = pd.concat(tiles)
+        # features crossing tile borders are returned by every tile they touch
+        window = window[~window.index.duplicated()]
+        return gpd.GeoDataFrame(window, crs=GERMANY_CRS), read_bounds
@@ -1,10 +1,47 @@
-from app.core.config import settings
-from openai import OpenAI
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator
+import asyncio
 
-client = OpenAI(api_key=settings.openai_api_key)
+from app.core.config import get_settings
+from app.core.metrics import record_llm_usage, stage
+from app.llm.cache import ReportCache, report_cache_key
 
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
-def generate_report(geo_metrics: dict, rule_results: dict) -> str:
+# Bump whenever the prompts change so cached reports are not reused.
+PROMPT_VERSION = "1"
+
+
+def _client_options() -> dict:
+    settings = get_settings()
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set; LLM reports are unavailable.")
+    return {"api_key": settings.openai_api_key, "base_url": settings.openai_base_url}
+
+
+# The openai package is slow to import, so the clients are built on first use.
+@lru_cache(maxsize=1)
+def get_client() -> "OpenAI":
+    from openai import OpenAI
+
+    return OpenAI(**_client_options(), timeout=get_settings().llm_timeout_s)
+
+
+@lru_cache(maxsize=1)
+def get_async_client() -> "AsyncOpenAI":
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(**_client_options())
+
+
+@lru_cache(maxsize=1)
+def _llm_semaphore() -> asyncio.Semaphore:
+    """Limits the number of report completions in flight across all requests."""
+    return asyncio.Semaphore(get_settings().llm_max_concurrency)
+
+
+def _build_messages(geo_metrics: dict, rule_results: dict) -> list[dict]:
     system_prompt = (
         "Du bist der analytische Kern einer professionellen Geodaten-App für Windenergie. "
         "Deine Aufgabe ist es, komplexe Geo-Metriken in eine scannbare, moderne und präzise "
@@ -32,15 +69,64 @@ def generate_report(geo_metrics: dict, rule_results: dict) -> str:
         "Vermeide Floskeln und komm direkt zum Punkt.]"
     )
 
-    response = client.responses.create(
-        model="gpt-4.1-mini",
-        input=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        max_output_tokens=2000,
-    )
-    print(response)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def cache_key(geo_metrics: dict, rule_results: dict) -> str:
+    return report_cache_key(geo_metrics, rule_results, get_settings().llm_model, PROMPT_VERSION)
+
+
+def generate_report(geo_metrics: dict, rule_results: dict, cache: ReportCache | None = None) -> str:
+    if cache is not None:
+        key = cache_key(geo_metrics, rule_results)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    settings = get_settings()
+    with stage("llm"):
+        response = get_client().responses.create(
+            model=settings.llm_model,
+            input=_build_messages(geo_metrics, rule_results),
+            max_output_tokens=settings.llm_max_output_tokens,
+        )
+    record_llm_usage(settings.llm_model, response.usage)
 
     text = response.output_text
+    if cache is not None:
+        cache.set(key, text)
     return text
+
+
+async def stream_report(
+        geo_metrics: dict,
+        rule_results: dict,
+        llm_client: "AsyncOpenAI | None" = None,
+) -> AsyncIterator[str]:
+    """Streams the report text as it is generated. Waits for a free slot if too many completions are in flight."""
+    settings = get_settings()
+    llm_client = llm_client or get_async_client()
+    async with _llm_semaphore():
+        with stage("llm_stream"):
+            stream = await llm_client.responses.create(
+                model=settings.llm_model,
+                input=_build_messages(geo_metrics, rule_results),
+                max_output_tokens=settings.llm_max_output_tokens,
+                stream=True,
+            )
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type == "response.completed":
+                    record_llm_usage(settings.llm_model, event.response.usage)
+
+
+async def generate_report_async(
+        geo_metrics: dict,
+        rule_results: dict,
+        llm_client: "AsyncOpenAI | None" = None,
+) -> str:
+    return "".join([chunk async for chunk in stream_report(geo_metrics, rule_results, llm_client)])
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+
+from app.core.config import get_settings
+
+
+def _round_floats(value, precision: float):
+    """Rounds every float (distances) to a multiple of precision so near-identical sites share a key."""
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        return round(round(value / precision) * precision, 6)
+    if isinstance(value, dict):
+        return {k: _round_floats(v, precision) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_round_floats(v, precision) for v in value]
+    return value
+
+
+def report_cache_key(
+        geo_metrics: dict,
+        rule_results: dict,
+        model: str,
+        prompt_version: str,
+        precision: float | None = None,
+) -> str:
+    """Canonical SHA-256 over everything that determines the report text."""
+    precision = precision or get_settings().report_cache_distance_precision_m
+    canonical = json.dumps(
+        {
+            "geo_metrics": _round_floats(geo_metrics, precision),
+            "rule_results": _round_floats(rule_results, precision),
+            "model": model,
+            "prompt_version": prompt_version,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """Base class of the report cache backends. Subclasses implement _get and _set."""
+
+    def __init__(self, ttl_s: float | None = None):
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str | None:
+        report = self._get(key)
+        if report is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return report
+
+    def set(self, key: str, report: str) -> None:
+        self._set(key, report)
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__, "hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_s is not None and time.time() - created_at > self.ttl_s
+
+    def _get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    def _set(self, key: str, report: str) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryReportCache(ReportCache):
+    """In-process LRU cache with a time-to-live per entry."""
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float | None = None):
+        super().__init__(ttl_s)
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0]):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _set(self, key: str, report: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), report)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteReportCache(ReportCache):
+    """Persistent cache in a SQLite file, shared by all workers on the machine."""
+
+    def __init__(self, path: str | Path, ttl_s: float | None = None):
+        super().__init__(ttl_s)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, created_at REAL NOT NULL, report TEXT NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT created_at, report FROM reports WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[0]):
+                self._conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+                return None
+            return row[1]
+
+    def _set(self, key: str, report: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (key, created_at, report) VALUES (?, ?, ?)",
+                (key, time.time(), report),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+
+def create_report_cache() -> ReportCache | None:
+    """Builds the cache backend selected by settings.report_cache_backend ('memory', 'sqlite' or 'none')."""
+    settings = get_settings()
+    ttl_s = settings.report_cache_ttl_s
+    if settings.report_cache_backend == "memory":
+        return MemoryReportCache(max_entries=settings.report_cache_max_entries, ttl_s=ttl_s)
+    if settings.report_cache_backend == "sqlite":
+        return SQLiteReportCache(settings.report_cache_path, ttl_s=ttl_s)
+    return None
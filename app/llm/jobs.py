@@ -0,0 +1,159 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, Callable
+import asyncio
+import logging
+import uuid
+
+from app.core.config import get_settings
+from app.llm.agent import cache_key, stream_report
+from app.llm.cache import ReportCache
+from app.llm.template import render_template_report
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs beyond this number are forgotten, oldest first.
+MAX_JOBS = 1000
+
+
+@dataclass
+class ReportJob:
+    id: str
+    status: str = "pending"  # pending | running | done | failed
+    chunks: list[str] = field(default_factory=list)
+    error: str | None = None
+    # True if the LLM failed and the report was rendered from the template instead
+    fallback: bool = False
+    _changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def report(self) -> str | None:
+        return "".join(self.chunks) if self.status == "done" else None
+
+    async def _update(self, **changes) -> None:
+        async with self._changed:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self._changed.notify_all()
+
+    async def _append(self, chunk: str) -> None:
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def iter_chunks(self) -> AsyncIterator[str]:
+        """
+        Yields the report chunks produced so far and then new ones until the job finishes.
+        Stops early if the report is replaced by the template fallback; read job.report then.
+        """
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.chunks) > sent or self.finished)
+                if self.fallback:
+                    return
+                new_chunks = self.chunks[sent:]
+                finished = self.finished
+            for chunk in new_chunks:
+                yield chunk
+            sent += len(new_chunks)
+            if finished:
+                return
+
+
+class ReportJobRegistry:
+    """Runs report generation in the background and keeps the jobs for polling/streaming."""
+
+    def __init__(
+            self,
+            llm_client: "AsyncOpenAI | None" = None,
+            cache: ReportCache | None = None,
+            fallback_to_template: bool = True,
+            max_jobs: int = MAX_JOBS,
+    ):
+        self.llm_client = llm_client
+        self.cache = cache
+        self.fallback_to_template = fallback_to_template
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, ReportJob] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(
+            self,
+            geo_metrics: dict,
+            rule_results: dict,
+            on_done: Callable[[ReportJob], None] | None = None,
+    ) -> ReportJob:
+        """
+        Starts generating a report on the running event loop and returns its job without waiting for it.
+        The cache is looked up first (in a worker thread, as the SQLite backend blocks); on a hit the
+        returned job is already done. on_done is called with the job once it finished.
+        """
+        job = ReportJob(id=uuid.uuid4().hex)
+        self._jobs[job.id] = job
+        self._evict()
+
+        key = None
+        if self.cache is not None:
+            key = cache_key(geo_metrics, rule_results)
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                job.chunks.append(cached)
+                job.status = "done"
+                if on_done is not None:
+                    on_done(job)
+                return job
+
+        task = asyncio.create_task(self._run(job, geo_metrics, rule_results, key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if on_done is not None:
+            # Not called for jobs cancelled at shutdown
+            task.add_done_callback(lambda _: on_done(job) if job.finished else None)
+        return job
+
+    def get(self, job_id: str) -> ReportJob | None:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: ReportJob, geo_metrics: dict, rule_results: dict, key: str | None) -> None:
+        await job._update(status="running")
+        try:
+            async with asyncio.timeout(get_settings().llm_timeout_s):
+                async for chunk in stream_report(geo_metrics, rule_results, self.llm_client):
+                    await job._append(chunk)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if not self.fallback_to_template:
+                logger.exception("Report job %s failed", job.id)
+                await job._update(status="failed", error=error)
+                return
+            logger.warning("Report job %s failed (%s), using template report", job.id, error)
+            await job._update(
+                status="done",
+                error=error,
+                fallback=True,
+                chunks=[render_template_report(geo_metrics, rule_results)],
+            )
+        else:
+            await job._update(status="done")
+            if key is not None:
+                await asyncio.to_thread(self.cache.set, key, job.report)
+
+    def _evict(self) -> None:
+        while len(self._jobs) > self.max_jobs:
+            oldest_id = next((job_id for job_id, job in self._jobs.items() if job.finished), None)
+            if oldest_id is None:
+                return
+            del self._jobs[oldest_id]
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,105 @@
+from jinja2 import Environment, StrictUndefined
+
+from app.rules.engine import get_rule_set
+
+# Same three-section layout the LLM is asked for in agent._build_messages.
+REPORT_TEMPLATE = """\
+### 1. Standort & Eckdaten
+   - **Ort:** {{ settlement_name or "Unbekannt" }}{% if settlement_type %} ({{ settlement_type }}){% endif %}
+
+   - **Abstand zur Siedlung:** {{ distance }} (Soll: {{ min_distance }})
+   - **Schutzgebiet:** {% if overlaps -%}
+     Standort liegt in **{{ area_name or "unbenanntem Gebiet" }}**{% if area_type %} ({{ area_type }}){% endif %}
+   {%- elif area_name -%}
+     Keine Überschneidung; nächstes Gebiet: {{ area_name }}{% if area_type %} ({{ area_type }}){% endif %}
+   {%- else -%}
+     Keine Schutzgebiete im Umfeld bekannt
+   {%- endif %}
+
+
+### 2. Prüfungsergebnisse
+{% if not distance_known %}
+Im Datenbestand wurde keine Siedlung gefunden; der **Mindestabstand** von {{ min_distance }} konnte nicht geprüft werden.
+{% elif distance_ok %}
+Der **Mindestabstand** von {{ min_distance }} zur nächsten Siedlung wird mit {{ distance }} eingehalten.
+{% else %}
+Der **Mindestabstand** von {{ min_distance }} zur nächsten Siedlung wird mit {{ distance }} unterschritten.
+{% endif %}
+
+{% if overlaps %}
+Der Standort überschneidet sich mit einem **Schutzgebiet** ({{ area_type or "Typ unbekannt" }}). \
+{% if protected_area_finding %}Eine Bebauung ist nach dem Regelwerk ausgeschlossen.{% else %}Das Regelwerk schließt diesen Gebietstyp nicht aus.{% endif %}
+
+{% else %}
+Es liegt keine Überschneidung mit einem **Schutzgebiet** vor.
+{% endif %}
+{% if other_findings %}
+
+{% for finding in other_findings %}
+- {{ finding }}
+{% endfor %}
+{% endif %}
+
+### 3. Gutachterliches Fazit
+{% if is_compliant %}
+Der Standort ist nach Abstands- und Schutzgebietsprüfung grundsätzlich geeignet.
+{% elif is_compliant is none %}
+Die Eignung kann nicht abschließend beurteilt werden; nicht prüfbar: {{ not_evaluated | join(" ") }}
+{% else %}
+Der Standort ist derzeit nicht geeignet: {{ findings | join(" ") }}
+{% endif %}
+"""
+
+_environment = Environment(
+    undefined=StrictUndefined,
+    autoescape=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True,
+)
+_template = _environment.from_string(REPORT_TEMPLATE)
+
+
+def _format_distance(distance_m: float | None) -> str:
+    if distance_m is None:
+        return "unbekannt"
+    return f"{distance_m:,.0f} m".replace(",", ".")
+
+
+def _is_violation(violation: dict, rule: str, metric: str) -> bool:
+    """Whether a violation (see Rule.describe) is of the given rule kind on metric, without a type filter."""
+    return violation["rule"] == rule and violation["metric"] == metric and violation["types"] is None
+
+
+def render_template_report(geo_metrics: dict, rule_results: dict) -> str:
+    """Deterministic report with the same Markdown layout as the LLM report, without any network call."""
+    min_distance = get_rule_set().min_distance("distance_to_settlements_m")
+    distance = geo_metrics.get("distance_to_settlements_m")
+    overlaps = bool(geo_metrics.get("overlaps_protected_area"))
+    findings = rule_results.get("findings", [])
+    violations = rule_results.get("violations", [])
+    distance_findings = [
+        v["message"] for v in violations if _is_violation(v, "min_distance", "distance_to_settlements_m")
+    ]
+    # Any forbidden overlap rule on the protected areas, including those limited to some area types
+    protected_area_findings = [
+        v["message"] for v in violations
+        if v["rule"] == "forbidden_overlap" and v["metric"] == "overlaps_protected_area"
+    ]
+
+    return _template.render(
+        settlement_name=geo_metrics.get("nearest_settlement_name"),
+        settlement_type=geo_metrics.get("nearest_settlement_type"),
+        distance=_format_distance(distance),
+        min_distance=_format_distance(min_distance),
+        distance_known=distance is not None,
+        distance_ok=not distance_findings,
+        overlaps=overlaps,
+        area_name=geo_metrics.get("protected_area_name"),
+        area_type=geo_metrics.get("protected_area_type"),
+        protected_area_finding=bool(protected_area_findings),
+        other_findings=[f for f in findings if f not in protected_area_findings and f not in distance_findings],
+        findings=findings,
+        not_evaluated=rule_results.get("not_evaluated", []),
+        is_compliant=rule_results.get("is_compliant", not findings),
+    )
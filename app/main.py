@@ -1,11 +1,113 @@
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import threading
 
 from fastapi import FastAPI
+from app.api.cors import TileCORSMiddleware
 from app.api.routes import router as api_router
+from app.api.timing import timing_middleware
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _start_services(app: FastAPI) -> None:
+    """
+    Imports the geo stack, loads the reference layers and creates the services the routes use.
+    Runs in a background thread so the server (and /health) is up immediately; /ready turns
+    200 once this has finished.
+    """
+    from app.db.evaluations import EvaluationStore
+    from app.geo.cache import AnalysisCache
+    from app.geo.raster import create_raster_pool
+    from app.geo.store import SNAPSHOTS_DIR, ReferenceLayerStore, SharedReferenceStore, WindowedReferenceStore
+    from app.geo.tiles import VectorTileStore
+    from app.llm.cache import create_report_cache
+    from app.llm.jobs import ReportJobRegistry
+
+    settings = get_settings()
+    if settings.reference_loading == "windowed":
+        store = WindowedReferenceStore(
+            tile_size_m=settings.reference_tile_size_m,
+            max_tiles=settings.reference_max_tiles,
+            snapshots_dir=SNAPSHOTS_DIR,
+        )
+    elif settings.reference_loading == "shared":
+        store = SharedReferenceStore(snapshots_dir=SNAPSHOTS_DIR)
+    else:
+        store = ReferenceLayerStore(snapshots_dir=SNAPSHOTS_DIR, analysis_crs=settings.analysis_crs)
+    store.load_all()
+    app.state.reference_store = store
+    app.state.tile_store = VectorTileStore(paths=dict(store.paths))
+    app.state.analysis_cache = AnalysisCache(max_bytes=settings.analysis_cache_max_bytes)
+    app.state.report_jobs = ReportJobRegistry(
+        cache=create_report_cache(),
+        fallback_to_template=settings.llm_fallback_to_template,
+    )
+    if settings.suitability_workers > 1:
+        app.state.raster_pool = create_raster_pool(settings.suitability_workers)
+    if settings.evaluation_store_enabled:
+        app.state.evaluation_store = EvaluationStore(
+            settings.evaluation_store_path, pool_size=settings.evaluation_store_pool_size
+        )
+
+
+async def _poll_snapshots(app: FastAPI, interval_s: float) -> None:
+    """Switches the reference store (and the tile layers) to a newly published snapshot."""
+    while True:
+        await asyncio.sleep(interval_s)
+        store = getattr(app.state, "reference_store", None)
+        if store is None:
+            continue
+        try:
+            if await asyncio.to_thread(store.refresh):
+                app.state.tile_store.paths = dict(store.paths)
+        except Exception:
+            logger.exception("Switching to the new reference snapshot failed, keeping the current one")
+
+
+def _warm_up(app: FastAPI) -> None:
+    try:
+        _start_services(app)
+    except Exception as e:
+        logger.exception("Startup failed")
+        app.state.startup_error = str(e) or type(e).__name__
+    finally:
+        app.state.ready.set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = threading.Event()
+    app.state.startup_error = None
+    # Services of an earlier run of the app (e.g. in tests) must not be served while warming up.
+    for name in ("reference_store", "tile_store", "analysis_cache", "report_jobs", "evaluation_store", "raster_pool"):
+        setattr(app.state, name, None)
+    warm_up = asyncio.create_task(asyncio.to_thread(_warm_up, app))
+    app.state.warm_up = warm_up
+    poll_s = get_settings().snapshot_poll_s
+    poller = asyncio.create_task(_poll_snapshots(app, poll_s)) if poll_s > 0 else None
+    yield
+    if poller is not None:
+        poller.cancel()
+    await warm_up
+    report_jobs = getattr(app.state, "report_jobs", None)
+    if report_jobs is not None:
+        await report_jobs.shutdown()
+    if app.state.evaluation_store is not None:
+        app.state.evaluation_store.close()
+    if app.state.raster_pool is not None:
+        app.state.raster_pool.shutdown(cancel_futures=True)
+
 
 app = FastAPI(
     title="WindGPT",
     version="0.1.0",
-    description="AI-powered site feasibility assessment for wind energy projects using geospatial analysis."
+    description="AI-powered site feasibility assessment for wind energy projects using geospatial analysis.",
+    lifespan=lifespan,
 )
 
+app.middleware("http")(timing_middleware)
+app.add_middleware(TileCORSMiddleware)
 app.include_router(api_router, prefix="/api")
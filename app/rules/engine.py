@@ -1,14 +1,265 @@
+from dataclasses import dataclass
 from pathlib import Path
+import re
+import threading
+
+import numpy as np
+import pandas as pd
 import yaml
 
+from app.core.metrics import stage
+
 RULES_PATH = Path(__file__).parent / "config.yaml"
 
 
-def load_rules() -> dict:
-    with RULES_PATH.open("r", encoding="utf-8") as f:
+def load_rules(path: Path = RULES_PATH) -> dict:
+    with path.open("r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
 
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _split_types(value) -> set[str]:
+    """Metric type fields hold one type or several joined by ', ' (see analyze_site)."""
+    if _is_missing(value):
+        return set()
+    return {part.strip() for part in str(value).split(",")}
+
+
+def typed_metric(metric: str, types) -> str:
+    """Key of a distance metric measured only to features of the given types, e.g. 'distance_to_settlements_m[AX_Gebaeude]'."""
+    return f"{metric}[{', '.join(sorted(types))}]"
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Base class of all compiled rules. A rule whose metric is missing cannot be evaluated; it is
+    neither violated nor satisfied (see is_evaluable).
+    """
+    metric: str
+    message: str
+
+    @property
+    def key(self) -> str:
+        """Key of the value the rule checks in the analysis result."""
+        return self.metric
+
+    @property
+    def kind(self) -> str:
+        """The rule's type in config.yaml, e.g. 'min_distance'."""
+        return RULE_KINDS[type(self)]
+
+    def describe(self) -> dict:
+        """The rule as reported in a violation: its kind, metric, type filter and message."""
+        types = getattr(self, "types", None)
+        return {
+            "rule": self.kind,
+            "metric": self.metric,
+            "types": sorted(types) if types is not None else None,
+            "message": self.message,
+        }
+
+    def is_evaluable(self, geo_metrics: dict) -> bool:
+        return not _is_missing(geo_metrics.get(self.key))
+
+    def is_violated(self, geo_metrics: dict) -> bool:
+        if not self.is_evaluable(geo_metrics):
+            return False
+        return self._violated(geo_metrics[self.key], geo_metrics)
+
+    def evaluable(self, metrics_df: pd.DataFrame) -> np.ndarray:
+        """Vectorized is_evaluable over one row per site."""
+        if self.key not in metrics_df.columns:
+            return np.zeros(len(metrics_df), dtype=bool)
+        return metrics_df[self.key].notna().to_numpy(dtype=bool)
+
+    def violations(self, metrics_df: pd.DataFrame) -> np.ndarray:
+        """Vectorized is_violated over one row per site."""
+        if self.key not in metrics_df.columns:
+            return np.zeros(len(metrics_df), dtype=bool)
+        values = metrics_df[self.key]
+        return (values.notna() & self._violated_batch(values, metrics_df)).to_numpy(dtype=bool)
+
+    def _violated(self, value, geo_metrics: dict) -> bool:
+        raise NotImplementedError
+
+    def _violated_batch(self, values: pd.Series, metrics_df: pd.DataFrame) -> pd.Series:
+        raise NotImplementedError
+
+
+@dataclass(frozen=True)
+class _TypeFilteredRule(Rule):
+    """Rule that only applies when the feature type stored in type_metric is one of types."""
+    types: frozenset[str] | None = None
+    type_metric: str | None = None
+
+    def _applies(self, geo_metrics: dict) -> bool:
+        if self.types is None:
+            return True
+        return bool(_split_types(geo_metrics.get(self.type_metric)) & self.types)
+
+    def _applies_batch(self, metrics_df: pd.DataFrame) -> pd.Series:
+        if self.types is None:
+            return pd.Series(True, index=metrics_df.index)
+        if self.type_metric not in metrics_df.columns:
+            return pd.Series(False, index=metrics_df.index)
+        pattern = r"(?:^|,\s*)(?:" + "|".join(re.escape(t) for t in sorted(self.types)) + r")(?:,|$)"
+        return metrics_df[self.type_metric].astype("string").str.contains(pattern, regex=True).fillna(False).astype(bool)
+
+
+@dataclass(frozen=True)
+class MinDistanceRule(Rule):
+    """
+    Distance metric must be at least min_m. With types, the distance to the nearest feature of one
+    of those types is checked instead (the typed_metric the analysis computes for them).
+    """
+    min_m: float = 0.0
+    types: frozenset[str] | None = None
+
+    @property
+    def key(self) -> str:
+        return self.metric if self.types is None else typed_metric(self.metric, self.types)
+
+    def _violated(self, value, geo_metrics: dict) -> bool:
+        return value < self.min_m
+
+    def _violated_batch(self, values: pd.Series, metrics_df: pd.DataFrame) -> pd.Series:
+        return values.astype(float) < self.min_m
+
+
+@dataclass(frozen=True)
+class ForbiddenOverlapRule(_TypeFilteredRule):
+    """Overlap flag must be false (optionally only for certain protected-area types)."""
+
+    def _violated(self, value, geo_metrics: dict) -> bool:
+        return bool(value) and self._applies(geo_metrics)
+
+    def _violated_batch(self, values: pd.Series, metrics_df: pd.DataFrame) -> pd.Series:
+        return values.astype(bool) & self._applies_batch(metrics_df)
+
+
+@dataclass(frozen=True)
+class BufferRule(Rule):
+    """Number of features within a buffer around the site must not exceed max_count."""
+    max_count: int = 0
+
+    def _violated(self, value, geo_metrics: dict) -> bool:
+        return value > self.max_count
+
+    def _violated_batch(self, values: pd.Series, metrics_df: pd.DataFrame) -> pd.Series:
+        return values.astype(float) > self.max_count
+
+
+@dataclass(frozen=True)
+class MaxSlopeRule(Rule):
+    """Terrain slope must not exceed max_deg."""
+    max_deg: float = 90.0
+
+    def _violated(self, value, geo_metrics: dict) -> bool:
+        return value > self.max_deg
+
+    def _violated_batch(self, values: pd.Series, metrics_df: pd.DataFrame) -> pd.Series:
+        return values.astype(float) > self.max_deg
+
+
+RULE_TYPES: dict[str, type[Rule]] = {
+    "min_distance": MinDistanceRule,
+    "forbidden_overlap": ForbiddenOverlapRule,
+    "buffer": BufferRule,
+    "max_slope": MaxSlopeRule,
+}
+
+RULE_KINDS: dict[type[Rule], str] = {rule_cls: kind for kind, rule_cls in RULE_TYPES.items()}
+
+DEFAULT_METRICS = {
+    "max_slope": "slope_deg",
+}
+
+DEFAULT_TYPE_METRICS = {
+    "overlaps_protected_area": "protected_area_type",
+}
+
+
+def compile_rule(spec: dict) -> Rule:
+    """Turns one entry of the 'rules' list in config.yaml into a rule object."""
+    spec = dict(spec)
+    rule_type = spec.pop("type")
+    if rule_type not in RULE_TYPES:
+        raise ValueError(f"Unknown rule type '{rule_type}'. Expected one of {sorted(RULE_TYPES)}.")
+
+    rule_cls = RULE_TYPES[rule_type]
+    spec.setdefault("metric", DEFAULT_METRICS.get(rule_type))
+    if spec["metric"] is None:
+        raise ValueError(f"Rule of type '{rule_type}' needs a 'metric'.")
+
+    if spec.get("types") is not None:
+        spec["types"] = frozenset(spec["types"])
+        if issubclass(rule_cls, _TypeFilteredRule):
+            spec.setdefault("type_metric", DEFAULT_TYPE_METRICS.get(spec["metric"]))
+
+    # The message may reference the rule's own parameters, e.g. "{min_m} m".
+    spec["message"] = spec["message"].format(**spec)
+    return rule_cls(**spec)
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    rules: tuple[Rule, ...]
+
+    def min_distance(self, metric: str) -> float:
+        """Strictest min_distance threshold for a metric, ignoring type filters (0 if there is none)."""
+        return max(
+            (rule.min_m for rule in self.rules if isinstance(rule, MinDistanceRule) and rule.metric == metric),
+            default=0.0,
+        )
+
+    def typed_distances(self, metric: str) -> dict[str, frozenset[str]]:
+        """Typed distance metrics (key -> types) the min_distance rules on a metric need from the analysis."""
+        return {
+            rule.key: rule.types
+            for rule in self.rules
+            if isinstance(rule, MinDistanceRule) and rule.metric == metric and rule.types is not None
+        }
+
+    def forbids_overlap(self, metric: str) -> bool:
+        """Whether any forbidden_overlap rule (of any type filter) checks the metric."""
+        return any(isinstance(rule, ForbiddenOverlapRule) and rule.metric == metric for rule in self.rules)
+
+    def max_count(self, metric: str) -> int | None:
+        """Strictest max_count of the buffer rules on a metric (None if there is none)."""
+        return min(
+            (rule.max_count for rule in self.rules if isinstance(rule, BufferRule) and rule.metric == metric),
+            default=None,
+        )
+
+
+def compile_rules(config: dict) -> RuleSet:
+    return RuleSet(rules=tuple(compile_rule(spec) for spec in config.get("rules", [])))
+
+
+_cache_lock = threading.Lock()
+_cache: dict[Path, tuple[tuple[int, int], RuleSet]] = {}
+
+
+def get_rule_set(path: Path = RULES_PATH) -> RuleSet:
+    """Returns the compiled rules, re-parsing the config only when the file changed."""
+    stat = path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, compile_rules(load_rules(path)))
+            _cache[path] = cached
+    return cached[1]
+
+
 def evaluate_rules(geo_metrics: dict) -> dict:
     """
     geo_metrics z.B.:
@@ -16,19 +267,52 @@ def evaluate_rules(geo_metrics: dict) -> dict:
         "distance_to_settlements_m": 500,
         "overlaps_protected_area": False
     }
+    findings holds the messages of the violated rules and violations the rules themselves (see
+    Rule.describe). is_compliant is False if a rule is violated, None (unknown) if none is but some
+    rule could not be evaluated because its metric is missing (listed in not_evaluated), and True otherwise.
     """
-    rules = load_rules()
-    findings = []
-
-    if geo_metrics["distance_to_settlements_m"] < rules["min_distance_to_settlements_m"]:
-        findings.append(
-            f"Mindestabstand zu Siedlungen ({rules['min_distance_to_settlements_m']} m) nicht erfüllt."
-        )
-
-    if rules["no_build_in_protected_area"] and geo_metrics["overlaps_protected_area"]:
-        findings.append("Standort liegt in einem Schutzgebiet.")
+    with stage("rules"):
+        rules = get_rule_set().rules
+        violations = [rule.describe() for rule in rules if rule.is_violated(geo_metrics)]
+        not_evaluated = [rule.message for rule in rules if not rule.is_evaluable(geo_metrics)]
+    findings = [violation["message"] for violation in violations]
 
     return {
         "findings": findings,
-        "is_compliant": len(findings) == 0,
+        "violations": violations,
+        "not_evaluated": not_evaluated,
+        "is_compliant": _is_compliant(bool(findings), bool(not_evaluated)),
     }
+
+
+def _is_compliant(violated: bool, unknown: bool) -> bool | None:
+    if violated:
+        return False
+    return None if unknown else True
+
+
+def evaluate_rules_batch(metrics_df: pd.DataFrame) -> pd.DataFrame:
+    """Vectorized evaluate_rules over one row of metrics per site (e.g. from analyze_sites_batch)."""
+    findings = [[] for _ in range(len(metrics_df))]
+    violations = [[] for _ in range(len(metrics_df))]
+    not_evaluated = [[] for _ in range(len(metrics_df))]
+
+    with stage("rules_batch"):
+        for rule in get_rule_set().rules:
+            description = rule.describe()
+            for i in np.flatnonzero(rule.violations(metrics_df)):
+                findings[i].append(rule.message)
+                violations[i].append(description)
+            for i in np.flatnonzero(~rule.evaluable(metrics_df)):
+                not_evaluated[i].append(rule.message)
+
+    compliant = [_is_compliant(bool(f), bool(n)) for f, n in zip(findings, not_evaluated)]
+    return pd.DataFrame(
+        {
+            "findings": findings,
+            "violations": violations,
+            "not_evaluated": not_evaluated,
+            "is_compliant": pd.Series(compliant, index=metrics_df.index, dtype=object),
+        },
+        index=metrics_df.index,
+    )
@@ -1,10 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+from urllib.request import urlopen
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
 import warnings
 
 import geopandas as gpd
 import pandas as pd
+import shapely
 
 RAW_DIR = Path("data/raw")
+STAGING_DIR = RAW_DIR / "staging"
 PROCESSED_DIR = Path("data/processed")
 TARGET_CRS = "EPSG:25832"
 
@@ -12,6 +26,10 @@ BKG_DLM250_WFS_URL = "WFS:https://sgx.geodatenzentrum.de/wfs_dlm250?SERVICE=WFS&
 BFN_SCHUTZGEBIETE_WFS_URL = "https://geodienste.bfn.de/ogc/wfs/schutzgebiet"
 PROTECTED_AREAS_OUTPUT_FILE = "protected_areas.gpkg"
 SETTLEMENTS_OUTPUT_FILE = "settlements.gpkg"
+# Features per WFS GetFeature request (STARTINDEX/COUNT paging)
+WFS_PAGE_SIZE = 10_000
+MAX_WORKERS = 4
+FETCH_RETRIES = 3
 BKG_NAME_COLS = ["nam"]
 BFN_NAME_COLS = ["NAME", "Gebietsname"]
 BKG_TYPE_LABEL_COL= "objart_txt"
@@ -34,54 +52,225 @@ BFN_PROTECTED_AREA_LAYERS = [
 ]
 
 
+def wfs_endpoint(wfs_url: str) -> str:
+    """Strips GDAL's 'WFS:' prefix and any query string from a WFS URL."""
+    url = wfs_url.removeprefix("WFS:")
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+def get_feature_url(endpoint: str, layer: str, **params) -> str:
+    query = {"SERVICE": "WFS", "VERSION": "2.0.0", "REQUEST": "GetFeature", "TYPENAMES": layer}
+    query.update({key.upper(): value for key, value in params.items() if value is not None})
+    return f"{endpoint}?{urlencode(query)}"
+
+
+def fetch_feature_count(endpoint: str, layer: str) -> int | None:
+    """Asks the server for the number of features (RESULTTYPE=hits). None if it doesn't say."""
+    with urlopen(get_feature_url(endpoint, layer, resulttype="hits"), timeout=60) as resp:
+        text = resp.read().decode("utf-8", errors="replace")
+    match = re.search(r'numberMatched="(\d+)"', text)
+    return int(match.group(1)) if match else None
+
+
+def fetch_page(endpoint: str, layer: str, start_index: int | None, count: int | None) -> gpd.GeoDataFrame:
+    """Downloads one page of a layer. Without start_index/count the whole layer is requested."""
+    return gpd.read_file(get_feature_url(endpoint, layer, startindex=start_index, count=count), encoding="utf-8")
+
+
+def page_hash(gdf: gpd.GeoDataFrame) -> str:
+    """Content hash over geometry (WKB) and attributes of a page."""
+    hashed = pd.util.hash_pandas_object(gdf.to_wkb(), index=False)
+    return hashlib.sha256(hashed.to_numpy().tobytes()).hexdigest()
+
+
+def standardize_layer(gdf: gpd.GeoDataFrame, layer: str) -> gpd.GeoDataFrame:
+    if gdf.crs:
+        gdf = gdf.to_crs(TARGET_CRS)
+    else:
+        warnings.warn(f"Layer {layer} has no CRS. Assuming {TARGET_CRS}.")
+        gdf = gdf.set_crs(TARGET_CRS)
+
+    gdf["standardized_type"] = layer.split(":")[-1]
+
+    if BKG_TYPE_LABEL_COL in gdf.columns:
+        gdf["standardized_type"] = gdf[BKG_TYPE_LABEL_COL].fillna(gdf["standardized_type"])
+
+    return gdf
+
+
+class StagingArea:
+    """
+    Checkpoints downloaded pages, plus a JSON manifest with the feature count and first-page hash
+    per WFS layer. Lets an interrupted run resume and an unchanged layer be skipped. Each download
+    of a WFS layer gets its own run id and staging GPKG (one layer per page), so pages of an earlier
+    download can never be mixed into a new one; starting a download deletes the previous GPKGs.
+    Writes are serialized because GPKG is a single SQLite file.
+    """
+
+    def __init__(self, staging_dir: Path, output_filename: str):
+        self.directory = staging_dir / Path(output_filename).stem
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.directory / "manifest.json"
+        self.manifest = json.loads(self.manifest_path.read_text(encoding="utf-8")) if self.manifest_path.exists() else {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _slug(layer: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_]", "_", layer)
+
+    @staticmethod
+    def page_layer_name(page: int) -> str:
+        return f"page_{page:05d}"
+
+    def gpkg_path(self, layer: str) -> Path | None:
+        """Staging GPKG of the current download of a WFS layer (None if there is none)."""
+        run = self.layer_state(layer).get("run")
+        return self.directory / f"{self._slug(layer)}.{run}.gpkg" if run else None
+
+    def layer_state(self, layer: str) -> dict:
+        return self.manifest.get(layer, {})
+
+    def reset_layer(self, layer: str, feature_count: int | None, first_page_hash: str | None, n_pages: int) -> None:
+        with self._lock:
+            for stale in self.directory.glob(f"{self._slug(layer)}.*.gpkg"):
+                stale.unlink()
+            self.manifest[layer] = {
+                "run": uuid.uuid4().hex[:12],
+                "feature_count": feature_count,
+                "first_page_hash": first_page_hash,
+                "n_pages": n_pages,
+                "pages": [],
+            }
+            self._save_manifest()
+
+    def save_page(self, layer: str, page: int, gdf: gpd.GeoDataFrame) -> None:
+        with self._lock:
+            if not gdf.empty:
+                gdf.to_file(self.gpkg_path(layer), layer=self.page_layer_name(page), driver="GPKG", engine="pyogrio")
+            pages = self.manifest[layer]["pages"]
+            if page not in pages:
+                pages.append(page)
+            self._save_manifest()
+
+    def missing_pages(self, layer: str) -> list[int]:
+        state = self.layer_state(layer)
+        return sorted(set(range(state.get("n_pages", 0))) - set(state.get("pages", [])))
+
+    def load_layer(self, layer: str) -> list[gpd.GeoDataFrame]:
+        path = self.gpkg_path(layer)
+        if path is None or not path.exists():
+            return []
+        # Empty pages are recorded in the manifest but have no layer in the GPKG.
+        existing = set(gpd.list_layers(path)["name"])
+        names = [self.page_layer_name(page) for page in sorted(self.layer_state(layer)["pages"])]
+        return [gpd.read_file(path, layer=name) for name in names if name in existing]
+
+    def _save_manifest(self) -> None:
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.manifest, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.manifest_path)
+
+
+def _with_retries(func, *args):
+    for attempt in range(1, FETCH_RETRIES + 1):
+        try:
+            return func(*args)
+        except Exception:
+            if attempt == FETCH_RETRIES:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def _plan_layer(staging: StagingArea, endpoint: str, layer: str, fetch_count, fetch) -> str:
+    """
+    Compares the server's feature count and first page with the manifest. Unchanged layers keep
+    their staged pages (only missing pages are fetched again); changed layers start over.
+    """
+    feature_count = _with_retries(fetch_count, endpoint, layer)
+    paged = feature_count is not None and feature_count > WFS_PAGE_SIZE
+    first_page = _with_retries(fetch, endpoint, layer, 0 if paged else None, WFS_PAGE_SIZE if paged else None)
+    first_page = standardize_layer(first_page, layer)
+    first_hash = page_hash(first_page)
+
+    state = staging.layer_state(layer)
+    if (
+            state.get("run")
+            and state.get("feature_count") == feature_count
+            and state.get("first_page_hash") == first_hash
+    ):
+        return "unchanged" if not staging.missing_pages(layer) else "resumed"
+
+    n_pages = -(-feature_count // WFS_PAGE_SIZE) if paged else 1
+    staging.reset_layer(layer, feature_count, first_hash, n_pages)
+    staging.save_page(layer, 0, first_page)
+    return "changed"
+
+
+def _stage_page(staging: StagingArea, endpoint: str, layer: str, page: int, fetch) -> int:
+    gdf = _with_retries(fetch, endpoint, layer, page * WFS_PAGE_SIZE, WFS_PAGE_SIZE)
+    gdf = standardize_layer(gdf, layer)
+    staging.save_page(layer, page, gdf)
+    return len(gdf)
+
+
 def fetch_and_process_layers(
         wfs_url: str,
         layers: list[str],
         output_filename: str,
         name_candidates: list[str],
+        fetch_count=fetch_feature_count,
+        fetch=fetch_page,
+        max_workers: int = MAX_WORKERS,
 ):
     """
     Generic function to download multiple WFS layers, unify columns, and save to GPKG.
+    Layers and pages are fetched concurrently and checkpointed in a staging GPKG, so a rerun
+    resumes where the last one stopped and skips layers whose content did not change.
+    Returns the optimized layer (see build_optimized_layer), or None if no data was found.
     """
     PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
     out_path = PROCESSED_DIR / output_filename
+    endpoint = wfs_endpoint(wfs_url)
+    staging = StagingArea(STAGING_DIR, output_filename)
+    failed = {}
 
-    dfs = []
     print(f"Processing {len(layers)} layers for {output_filename}...")
 
-    for layer in layers:
-        print(f"  → Fetching {layer} ... ", end="", flush=True)
-        try:
-            gdf = gpd.read_file(wfs_url, layer=layer, encoding="utf-8")
-
-        except Exception as e:
-            print(f"⚠ FAILED: {e}")
-            continue
-
-
-        if gdf.empty:
-            print("empty.")
-            continue
-
-        if gdf.crs:
-            gdf = gdf.to_crs(TARGET_CRS)
-        else:
-            warnings.warn(f"Layer {layer} has no CRS. Assuming {TARGET_CRS}.")
-            gdf = gdf.set_crs(TARGET_CRS)
-
-        gdf["standardized_type"] = layer.split(":")[-1]
-
-        if BKG_TYPE_LABEL_COL in gdf.columns:
-            gdf["standardized_type"] = gdf[BKG_TYPE_LABEL_COL].fillna(gdf["standardized_type"])
-
-        dfs.append(gdf)
-
-
-        print(f"loaded {len(gdf)} features.")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        plans = {pool.submit(_plan_layer, staging, endpoint, layer, fetch_count, fetch): layer for layer in layers}
+        for future in as_completed(plans):
+            layer = plans[future]
+            try:
+                print(f"  → {layer}: {future.result()}, {len(staging.missing_pages(layer))} pages to fetch")
+            except Exception as e:
+                print(f"  ⚠ {layer} FAILED: {e}")
+                failed[layer] = e
+
+        pages = {
+            pool.submit(_stage_page, staging, endpoint, layer, page, fetch): (layer, page)
+            for layer in layers if layer not in failed
+            for page in staging.missing_pages(layer)
+        }
+        for future in as_completed(pages):
+            layer, page = pages[future]
+            try:
+                print(f"  → {layer} page {page}: loaded {future.result()} features.")
+            except Exception as e:
+                print(f"  ⚠ {layer} page {page} FAILED: {e}")
+                failed[layer] = e
+
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} layer(s) failed for {output_filename}: {', '.join(sorted(failed))}. "
+            "Staged pages are kept; rerun to resume."
+        )
+
+    dfs = [gdf for layer in layers for gdf in staging.load_layer(layer) if not gdf.empty]
 
     if not dfs:
         print(f"⚠ No data found for {output_filename}.")
-        return
+        return None
 
     combined_gdf = pd.concat(dfs, ignore_index=True)
 
@@ -102,26 +291,177 @@ def fetch_and_process_layers(
 
 
     combined_gdf.to_file(out_path, driver="GPKG", engine="pyogrio")
-    print(f"✓ Saved {len(combined_gdf)} features to {out_path}\n")
+    print(f"✓ Saved {len(combined_gdf)} features to {out_path}")
 
+    return build_optimized_layer(out_path)
 
-def main():
-    # Process Settlements
-    fetch_and_process_layers(
-        wfs_url=BKG_DLM250_WFS_URL,
-        layers=BKG_SETTLEMENT_LAYERS,
-        output_filename=SETTLEMENTS_OUTPUT_FILE,
-        name_candidates=BKG_NAME_COLS
+
+def deduplicate_and_dissolve(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Drops exact duplicates (same type, name and geometry) and merges overlapping polygons of the
+    same type and name, e.g. the pieces of one area delivered by several BfN layers or pages.
+    The merged result is exploded again so disjoint parts keep small bounding boxes.
+    """
+    gdf = gdf[~gdf.geometry.is_empty & gdf.geometry.notna()].copy()
+    gdf["_wkb"] = shapely.to_wkb(shapely.normalize(gdf.geometry.values))
+    gdf = gdf.drop_duplicates(subset=["type", "name", "_wkb"]).drop(columns="_wkb")
+
+    is_polygon = gdf.geometry.geom_type.isin(["Polygon", "MultiPolygon"])
+    polygons = gdf[is_polygon]
+    if polygons.empty:
+        return gdf
+
+    dissolved = (
+        polygons.dissolve(by=["type", "name"], dropna=False, as_index=False)
+        .explode(index_parts=False)
+        .reset_index(drop=True)
     )
+    return pd.concat([gdf[~is_polygon], dissolved[gdf.columns]], ignore_index=True)
+
+
+def build_optimized_layer(gpkg_path: Path) -> gpd.GeoDataFrame:
+    """
+    Build stage: deduplicates a processed layer, sorts it along a Hilbert curve and writes
+    a FlatGeobuf with packed R-tree index (read by the API in favour of the GPKG) and, if
+    pyarrow is available, a GeoParquet with per-feature bounding boxes. Returns the optimized layer.
+    """
+    gdf = gpd.read_file(gpkg_path, engine="pyogrio")
+    n_raw = len(gdf)
+    gdf = deduplicate_and_dissolve(gdf)
+
+    # Neighbouring features end up next to each other on disk, which keeps bbox reads local.
+    gdf = gdf.iloc[gdf.geometry.hilbert_distance().argsort()].reset_index(drop=True)
+
+    fgb_path = gpkg_path.with_suffix(".fgb")
+    gdf.to_file(fgb_path, driver="FlatGeobuf", engine="pyogrio", SPATIAL_INDEX="YES")
+    print(f"✓ Built {fgb_path} ({n_raw} → {len(gdf)} features)")
+
+    try:
+        gdf.to_parquet(gpkg_path.with_suffix(".parquet"), write_covering_bbox=True)
+    except ImportError:
+        print("  (pyarrow not installed, skipping GeoParquet)")
+    print()
+    return gdf
+
+
+def publish_snapshot(layers: dict[str, gpd.GeoDataFrame]) -> None:
+    """
+    Snapshot stage: publishes the built layers as a new versioned snapshot under
+    data/processed/snapshots if any feature changed. Layers that were not built (e.g. their download
+    failed) keep the version of the current snapshot. Running servers switch to it on their next poll.
+    """
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from app.geo.snapshots import current_snapshot, write_snapshot
+    from app.geo.store import SNAPSHOTS_DIR
+
+    if not layers:
+        print("⚠ No layers built, not publishing a snapshot.")
+        return
+    layers = dict(layers)
+    previous = current_snapshot(SNAPSHOTS_DIR)
+    for name, layer in (previous.manifest["layers"] if previous else {}).items():
+        if name not in layers:
+            print(f"  (keeping {name} from snapshot {previous.version})")
+            layers[name] = gpd.read_file(previous.directory / layer["file"], engine="pyogrio")
+    snapshot, written = write_snapshot(layers, SNAPSHOTS_DIR)
+    if not written:
+        print(f"✓ Reference layers unchanged, keeping snapshot {snapshot.version}")
+        return
+    print(f"✓ Published snapshot {snapshot.version}")
+    for name, layer in snapshot.manifest["layers"].items():
+        diff = layer["diff"]
+        print(f"  → {name}: +{diff['added']} −{diff['removed']} ={diff['unchanged']} ({layer['count']} features)")
+
+
+def seed_vector_tiles(max_zoom: int | None = None) -> None:
+    """Tile stage: pre-renders the MVT tiles served by /api/tiles into data/processed/tiles/*.mbtiles."""
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from app.geo.store import SNAPSHOTS_DIR, ReferenceLayerStore
+    from app.geo.tiles import TILE_SEED_MAX_ZOOM, VectorTileStore
+
+    # The same layer files the API serves: the current snapshot's where one was published.
+    store = VectorTileStore(paths=ReferenceLayerStore(snapshots_dir=SNAPSHOTS_DIR).paths)
+    for name in store.layers():
+        started = time.perf_counter()
+        count = store.seed(name, max_zoom=max_zoom or TILE_SEED_MAX_ZOOM)
+        print(f"✓ Seeded {count} {name} tiles in {time.perf_counter() - started:.1f}s")
+
 
-    # Process Protected Areas
-    fetch_and_process_layers(
-        wfs_url=BFN_SCHUTZGEBIETE_WFS_URL,
-        layers=BFN_PROTECTED_AREA_LAYERS,
-        output_filename=PROTECTED_AREAS_OUTPUT_FILE,
-        name_candidates=BFN_NAME_COLS,
+def pack_shared_layers() -> None:
+    """Pack stage: writes the memory-mapped layers used with REFERENCE_LOADING=shared into data/processed/packed."""
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from app.geo.store import SNAPSHOTS_DIR, SharedReferenceStore
+
+    store = SharedReferenceStore(snapshots_dir=SNAPSHOTS_DIR)
+    store.load_all()
+    print(f"✓ Packed reference layers into {store.packed_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download and build the WindGPT reference layers.")
+    parser.add_argument(
+        "--build-only",
+        action="store_true",
+        help="skip the download and only rebuild the optimized files from the existing GPKGs",
+    )
+    parser.add_argument(
+        "--tiles-only",
+        action="store_true",
+        help="only (re)seed the vector tile cache from the existing processed layers",
     )
+    parser.add_argument("--tiles-max-zoom", type=int, default=None, help="deepest zoom level to pre-render")
+    args = parser.parse_args()
+
+    if args.tiles_only:
+        seed_vector_tiles(args.tiles_max_zoom)
+        return
+
+    if args.build_only:
+        publish_snapshot({
+            Path(filename).stem: build_optimized_layer(PROCESSED_DIR / filename)
+            for filename in (SETTLEMENTS_OUTPUT_FILE, PROTECTED_AREAS_OUTPUT_FILE)
+        })
+        pack_shared_layers()
+        seed_vector_tiles(args.tiles_max_zoom)
+        return
+
+    downloads = {
+        "settlements": dict(
+            wfs_url=BKG_DLM250_WFS_URL,
+            layers=BKG_SETTLEMENT_LAYERS,
+            output_filename=SETTLEMENTS_OUTPUT_FILE,
+            name_candidates=BKG_NAME_COLS,
+        ),
+        "protected_areas": dict(
+            wfs_url=BFN_SCHUTZGEBIETE_WFS_URL,
+            layers=BFN_PROTECTED_AREA_LAYERS,
+            output_filename=PROTECTED_AREAS_OUTPUT_FILE,
+            name_candidates=BFN_NAME_COLS,
+        ),
+    }
+
+    # A failed download does not stop the other one; failures are reported at the end.
+    layers, failed = {}, {}
+    for name, download in downloads.items():
+        try:
+            gdf = fetch_and_process_layers(**download)
+        except Exception as e:
+            print(f"⚠ {name} FAILED: {e}\n")
+            failed[name] = e
+            continue
+        if gdf is not None:
+            layers[name] = gdf
+
+    publish_snapshot(layers)
+    pack_shared_layers()
+    seed_vector_tiles(args.tiles_max_zoom)
+
+    if failed:
+        print(f"⚠ {len(failed)} reference layer(s) failed and kept their previous version:")
+        for name, error in failed.items():
+            print(f"  → {name}: {error}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,157 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point, Polygon, box
+
+from app.geo.analysis import analyze_site, analyze_sites_batch
+from app.rules.engine import compile_rules, evaluate_rules, evaluate_rules_batch
+
+CRS = "EPSG:25832"
+
+
+def _none_if_na(value):
+    return None if pd.isna(value) else value
+
+
+@pytest.fixture
+def settlements():
+    rng = np.random.default_rng(1)
+    xy = rng.uniform(0, 10_000, size=(200, 2))
+    return gpd.GeoDataFrame(
+        {"name": [f"Dorf {i}" for i in range(len(xy))], "type": "AX_Ortslage"},
+        geometry=gpd.points_from_xy(xy[:, 0], xy[:, 1]),
+        crs=CRS,
+    )
+
+
+@pytest.fixture
+def protected_areas():
+    return gpd.GeoDataFrame(
+        {"name": ["NSG Moor", "LSG Heide", None], "type": ["Naturschutzgebiete", "Landschaftsschutzgebiete", "Naturparke"]},
+        geometry=[box(1000, 1000, 3000, 3000), box(2500, 2500, 5000, 5000), box(8000, 0, 10_000, 2000)],
+        crs=CRS,
+    )
+
+
+@pytest.fixture
+def sites():
+    rng = np.random.default_rng(2)
+    xy = rng.uniform(0, 10_000, size=(50, 2))
+    return gpd.GeoDataFrame(geometry=[Point(x, y).buffer(150) for x, y in xy], crs=CRS)
+
+
+def test_batch_matches_single_site_analysis(sites, settlements, protected_areas, monkeypatch):
+    rules = compile_rules({
+        "rules": [
+            {"type": "min_distance", "metric": "distance_to_settlements_m", "min_m": 300, "message": "Zu nah."},
+            {"type": "buffer", "metric": "roads_within_buffer_count", "max_count": 0, "message": "Straße."},
+            {"type": "forbidden_overlap", "metric": "overlaps_nature_reserves", "message": "NSG."},
+        ]
+    })
+    monkeypatch.setattr("app.rules.engine.get_rule_set", lambda: rules)
+    roads = gpd.GeoDataFrame(
+        {"name": ["A1", "B2"], "type": "road"},
+        geometry=[box(0, 4950, 10_000, 4960), box(4980, 0, 4990, 10_000)],
+        crs=CRS,
+    )
+    sources = {"roads": roads, "protected_areas": protected_areas}
+
+    batch = analyze_sites_batch(sites, settlements, protected_areas, sources)
+    batch_rules = evaluate_rules_batch(batch)
+    assert len(batch) == len(sites)
+
+    for i in range(len(sites)):
+        single = analyze_site(sites.iloc[[i]], settlements, protected_areas, sources)["metrics"]
+        row = batch.iloc[i]
+        assert row["distance_to_settlements_m"] == pytest.approx(single["distance_to_settlements_m"])
+        assert row["overlaps_protected_area"] == single["overlaps_protected_area"]
+        for key in ("nearest_settlement_name", "protected_area_name", "protected_area_type"):
+            assert _none_if_na(row[key]) == single[key]
+        for name in ("roads", "nature_reserves", "national_parks"):
+            assert _none_if_na(row[f"distance_to_{name}_m"]) == pytest.approx(single[f"distance_to_{name}_m"])
+            assert row[f"overlaps_{name}"] == single[f"overlaps_{name}"]
+            assert row[f"{name}_within_buffer_count"] == single[f"{name}_within_buffer_count"]
+        assert batch_rules["is_compliant"].iloc[i] is evaluate_rules(single)["is_compliant"]
+    assert {True, False} <= set(batch_rules["is_compliant"])
+
+
+def test_constraint_layers_report_nearest_overlap_and_buffer(settlements, protected_areas):
+    roads = gpd.GeoDataFrame(
+        {"name": ["A1", "B2", "L3"], "type": "road"},
+        geometry=[box(0, 4950, 10_000, 4960), box(4980, 0, 4990, 10_000), box(0, 9000, 10_000, 9010)],
+        crs=CRS,
+    )
+    site = gpd.GeoDataFrame(geometry=[Point(5050, 5050).buffer(10)], crs=CRS)
+    result = analyze_site(
+        site, settlements, protected_areas, {"roads": roads, "protected_areas": protected_areas}
+    )
+
+    roads_result = result["constraints"]["roads"]
+    assert roads_result["nearest_distance_m"] == pytest.approx(50, abs=0.1)
+    assert roads_result["within_buffer_count"] == 2
+    assert [f["name"] for f in roads_result["within_buffer"]] == ["B2", "A1"]
+    assert not roads_result["overlaps"]
+    assert result["metrics"]["roads_within_buffer_count"] == 2
+
+    # Only the Naturschutzgebiet counts for this layer, not the nearer Landschaftsschutzgebiet.
+    reserves = result["constraints"]["nature_reserves"]
+    assert reserves["within_buffer_count"] == 0
+    assert reserves["nearest_distance_m"] == pytest.approx(site.geometry[0].distance(box(1000, 1000, 3000, 3000)))
+    assert "railways" not in result["constraints"]
+
+
+def test_constraint_layer_overlap(settlements, protected_areas):
+    site = gpd.GeoDataFrame(geometry=[Point(2000, 2000).buffer(50)], crs=CRS)
+    result = analyze_site(site, settlements, protected_areas, {"protected_areas": protected_areas})
+    assert result["constraints"]["nature_reserves"]["overlaps"]
+    assert result["metrics"]["overlaps_nature_reserves"]
+    assert result["metrics"]["distance_to_nature_reserves_m"] == 0
+
+
+def test_nearest_settlements_are_exact_sorted_and_keep_ties(protected_areas):
+    settlements = gpd.GeoDataFrame(
+        {"name": ["far", "tie a", "tie b", "near"], "type": "AX_Ortslage"},
+        geometry=[box(-2000, -2000, -1990, -1990), box(1200, 0, 1300, 100), box(0, 1200, 100, 1300), box(700, 700, 800, 800)],
+        crs=CRS,
+    )
+    site = gpd.GeoDataFrame(geometry=[box(500, 500, 600, 600)], crs=CRS)
+    result = analyze_site(site, settlements, protected_areas, nearest_k=2)
+
+    nearest = result["nearest_settlements"]
+    assert [s["name"] for s in nearest] == ["near", "tie a", "tie b"]
+    assert nearest[0]["distance_m"] == pytest.approx(np.hypot(100, 100))
+    assert nearest[1]["distance_m"] == pytest.approx(nearest[2]["distance_m"])
+    assert result["metrics"]["distance_to_settlements_m"] == pytest.approx(nearest[0]["distance_m"])
+    assert len(result["map_data"]["distance_line"]["features"]) == 3
+
+
+def test_map_data_is_clipped_simplified_and_rounded(settlements):
+    # A detailed protected area far larger than the map around the site.
+    big_area = Point(5000, 5000).buffer(40_000, quad_segs=5000)
+    protected_areas = gpd.GeoDataFrame({"name": ["Naturpark"], "type": ["Naturparke"]}, geometry=[big_area], crs=CRS)
+    site = gpd.GeoDataFrame(geometry=[Point(5000, 5000).buffer(100)], crs=CRS)
+
+    map_data = analyze_site(site, settlements, protected_areas)["map_data"]
+    area = map_data["protected_areas"]["features"][0]["geometry"]
+    coordinates = area["coordinates"][0]
+    assert len(coordinates) < 100
+
+    lon, lat = zip(*coordinates)
+    site_lon, site_lat = zip(*map_data["site"]["features"][0]["geometry"]["coordinates"][0])
+    assert max(lon) - min(lon) < 0.2
+    assert all(round(value, 6) == value for value in lon + lat + site_lon + site_lat)
+
+    assert "map_data" not in analyze_site(site, settlements, protected_areas, include_map_data=False)
+
+
+def test_missing_and_empty_site_geometries_are_skipped(settlements, protected_areas):
+    site = gpd.GeoDataFrame(geometry=[None, Polygon(), Point(5000, 5000).buffer(10)], crs=CRS)
+
+    metrics = analyze_site(site, settlements, protected_areas)["metrics"]
+    expected = analyze_site(site.iloc[[2]], settlements, protected_areas)["metrics"]
+    assert metrics == expected
+
+    assert analyze_site(site.iloc[:2], settlements, protected_areas, include_map_data=False) == {"metrics": {}}
+    batch = analyze_sites_batch(site, settlements, protected_areas)
+    assert batch["distance_to_settlements_m"].isna().tolist() == [True, True, False]
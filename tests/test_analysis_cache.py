@@ -0,0 +1,42 @@
+import geopandas as gpd
+from shapely.geometry import Polygon
+
+from app.geo.cache import AnalysisCache, site_cache_key
+
+
+def _site(coords, crs="EPSG:25832"):
+    return gpd.GeoDataFrame(geometry=[Polygon(coords)], crs=crs)
+
+
+def test_site_key_ignores_vertex_order_and_start_point():
+    square = [(0, 0), (0, 100), (100, 100), (100, 0)]
+    key = site_cache_key(_site(square))
+
+    assert site_cache_key(_site(square[::-1])) == key
+    assert site_cache_key(_site(square[2:] + square[:2])) == key
+    assert site_cache_key(_site([(0, 0), (0, 101), (100, 100), (100, 0)])) != key
+
+
+def test_cache_evicts_by_size_and_keys_entries_by_dataset_version():
+    result = {"metrics": {"distance_to_settlements_m": 1.0}, "map_data": {"site": "x" * 100}}
+    cache = AnalysisCache(max_bytes=400)
+    cache.put("a", "v1", result)
+    cache.put("b", "v1", result)
+    assert cache.get("a", "v1") is result
+
+    cache.put("c", "v1", result)
+    assert cache.get("b", "v1") is None
+    assert cache.get("a", "v1") is result
+
+    # A new version misses, but requests pinned to the old one still hit until it is evicted.
+    new_result = {**result, "metrics": {"distance_to_settlements_m": 2.0}}
+    assert cache.get("a", "v2") is None
+    cache.put("a", "v2", new_result)
+    assert cache.get("a", "v2") is new_result
+    assert cache.get("a", "v1") is result
+    assert cache.stats()["dataset_versions"] == 2
+
+    cache.put("d", "v2", new_result)
+    cache.put("e", "v2", new_result)
+    assert cache.get("a", "v1") is None
+    assert cache.stats()["dataset_versions"] == 1
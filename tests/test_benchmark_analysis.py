@@ -0,0 +1,68 @@
+"""
+Latency benchmarks of analyze_site for the example sites against synthetic reference layers.
+Run with `pytest tests/test_benchmark_analysis.py`; the 1M-feature cases with `-m slow`.
+"""
+from functools import lru_cache
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from app.geo.analysis import GERMANY_CRS, analyze_site
+
+pytest.importorskip("pytest_benchmark")
+
+EXAMPLES_DIR = Path(__file__).parents[1] / "data" / "examples"
+EXAMPLE_SITES = ["site", "site2", "site3", "in_settlement"]
+MARGIN_M = 50_000
+
+
+def _load_site(name: str) -> gpd.GeoDataFrame:
+    return gpd.read_file(EXAMPLES_DIR / f"{name}.geojson").to_crs(GERMANY_CRS)
+
+
+@lru_cache(maxsize=1)
+def _layers(n_features: int) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    """Random settlement squares and (ten times fewer, larger) protected areas around the example sites."""
+    bounds = np.array([_load_site(name).total_bounds for name in EXAMPLE_SITES])
+    min_x, min_y = bounds[:, :2].min(axis=0) - MARGIN_M
+    max_x, max_y = bounds[:, 2:].max(axis=0) + MARGIN_M
+    rng = np.random.default_rng(0)
+
+    def squares(n: int, max_size: float) -> np.ndarray:
+        x = rng.uniform(min_x, max_x, n)
+        y = rng.uniform(min_y, max_y, n)
+        size = rng.uniform(10, max_size, n)
+        return shapely.box(x, y, x + size, y + size)
+
+    settlements = gpd.GeoDataFrame(
+        {"name": [f"Siedlung {i}" for i in range(n_features)], "type": "AX_Ortslage"},
+        geometry=squares(n_features, 300),
+        crs=GERMANY_CRS,
+    )
+    n_areas = max(n_features // 10, 1)
+    protected_areas = gpd.GeoDataFrame(
+        {"name": [f"Gebiet {i}" for i in range(n_areas)], "type": "Naturschutzgebiete"},
+        geometry=squares(n_areas, 3000),
+        crs=GERMANY_CRS,
+    )
+    _ = settlements.sindex, protected_areas.sindex
+    return settlements, protected_areas
+
+
+@pytest.mark.parametrize(
+    "n_features",
+    [10_000, 100_000, pytest.param(1_000_000, marks=pytest.mark.slow)],
+)
+@pytest.mark.parametrize("site_name", EXAMPLE_SITES)
+def test_analyze_site_latency(benchmark, n_features, site_name):
+    settlements, protected_areas = _layers(n_features)
+    site = _load_site(site_name)
+    benchmark.group = f"analyze_site {n_features} features"
+
+    result = benchmark(analyze_site, site, settlements, protected_areas)
+
+    assert result["metrics"]["distance_to_settlements_m"] is not None
+    assert result["nearest_settlements"][0]["distance_m"] == result["metrics"]["distance_to_settlements_m"]
@@ -0,0 +1,101 @@
+import geopandas as gpd
+import numpy as np
+import pyproj
+import shapely
+from shapely.geometry import Point
+
+from app.geo.analysis import GERMANY_CRS, analyze_site
+from app.geo.crs import bounds_crs, site_crs, to_crs, utm_crs
+from app.geo.store import ReferenceLayerStore, WindowedReferenceStore
+
+EAST_CRS = "EPSG:25833"
+
+# Görlitz, about 0.2° west of the UTM 33 central meridian and 5.8° east of the UTM 32 one
+SITE_LON_LAT = (14.8, 51.15)
+SETTLEMENT_LON_LAT = (14.83, 51.16)
+
+
+def test_utm_crs_zones():
+    lon = [6.5, 13.5, 21.0, 7.0, -75.0, 10.0]
+    lat = [51.0, 52.0, 52.0, 60.0, 40.0, -30.0]
+
+    assert utm_crs(lon, lat).tolist() == [
+        "EPSG:25832", "EPSG:25833", "EPSG:25834", "EPSG:25832", "EPSG:32618", "EPSG:32732"
+    ]
+
+
+def test_site_crs_and_to_crs():
+    sites = gpd.GeoSeries([Point(9.0, 50.0), Point(14.8, 51.2), shapely.Polygon()], crs="EPSG:4326")
+    projected = to_crs(sites, GERMANY_CRS)
+
+    assert site_crs(projected.values, GERMANY_CRS).tolist() == [GERMANY_CRS, EAST_CRS, GERMANY_CRS]
+    assert projected.crs == GERMANY_CRS
+    assert projected.iloc[:2].geom_equals_exact(sites.to_crs(GERMANY_CRS).iloc[:2], tolerance=1e-6).all()
+    assert to_crs(projected, GERMANY_CRS) is projected
+
+
+def _write_layers(tmp_path) -> dict:
+    settlements = gpd.GeoDataFrame(
+        {"name": ["Dorf"], "type": ["Ortslage"]}, geometry=[Point(SETTLEMENT_LON_LAT)], crs="EPSG:4326"
+    ).to_crs(GERMANY_CRS)
+    protected_areas = gpd.GeoDataFrame(
+        {"name": ["NSG"], "type": ["Naturschutzgebiete"]},
+        geometry=[Point(14.9, 51.3).buffer(0.01)],
+        crs="EPSG:4326",
+    ).to_crs(GERMANY_CRS)
+    paths = {"settlements": tmp_path / "settlements.fgb", "protected_areas": tmp_path / "protected_areas.fgb"}
+    settlements.to_file(paths["settlements"], driver="FlatGeobuf", engine="pyogrio")
+    protected_areas.to_file(paths["protected_areas"], driver="FlatGeobuf", engine="pyogrio")
+    return paths
+
+
+def test_site_zone_measures_distances_more_accurately(tmp_path):
+    paths = _write_layers(tmp_path)
+    site = to_crs(gpd.GeoDataFrame(geometry=[Point(SITE_LON_LAT)], crs="EPSG:4326"), GERMANY_CRS)
+    site_geo = site.union_all()
+    _, _, geodesic = pyproj.Geod(ellps="GRS80").inv(*SITE_LON_LAT, *SETTLEMENT_LON_LAT)
+
+    errors = {}
+    for store in (ReferenceLayerStore(paths, optional_paths={}), WindowedReferenceStore(paths, optional_paths={})):
+        for crs in (GERMANY_CRS, EAST_CRS):
+            settlements, protected_areas = store.layers_for_site(site_geo, crs)
+            assert settlements.crs == crs
+            metrics = analyze_site(site, settlements, protected_areas, crs=crs, include_map_data=False)["metrics"]
+            errors[type(store).__name__, crs] = abs(metrics["distance_to_settlements_m"] - geodesic)
+
+    # Both are off by the UTM scale factor, but zone 32 distorts about four times as much out here.
+    for store_name in ("ReferenceLayerStore", "WindowedReferenceStore"):
+        assert errors[store_name, EAST_CRS] * 3 < errors[store_name, GERMANY_CRS]
+
+
+def test_store_projects_each_layer_once_per_zone(tmp_path):
+    store = ReferenceLayerStore(_write_layers(tmp_path), optional_paths={})
+
+    east = store.get_projected("settlements", EAST_CRS)
+
+    assert store.get_projected("settlements", EAST_CRS) is east
+    assert store.get_projected("settlements", GERMANY_CRS) is store.get("settlements")
+    assert np.allclose(
+        shapely.get_coordinates(east.geometry.values),
+        shapely.get_coordinates(store.get("settlements").to_crs(EAST_CRS).geometry.values),
+    )
+
+
+def test_bounds_crs_lists_the_zones_of_the_area():
+    west, east = to_crs(gpd.GeoSeries([Point(11.0, 50.0), Point(12.5, 51.0)], crs="EPSG:4326"), GERMANY_CRS)
+
+    assert bounds_crs((*west.coords[0], *east.coords[0]), GERMANY_CRS) == [GERMANY_CRS, EAST_CRS]
+    assert bounds_crs((*east.coords[0], *east.coords[0]), GERMANY_CRS) == [EAST_CRS]
+
+
+def test_load_all_projects_the_layers_to_the_covered_zones(tmp_path):
+    paths = _write_layers(tmp_path)
+    store = ReferenceLayerStore(paths, optional_paths={})
+    store.load_all()
+
+    assert set(store._projected) == {("settlements", EAST_CRS), ("protected_areas", EAST_CRS)}
+    assert store.get_projected("settlements", EAST_CRS) is store._projected["settlements", EAST_CRS][1]
+
+    fixed = ReferenceLayerStore(paths, optional_paths={}, analysis_crs=GERMANY_CRS)
+    fixed.load_all()
+    assert fixed._projected == {}
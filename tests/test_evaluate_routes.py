@@ -0,0 +1,127 @@
+import json
+
+import geopandas as gpd
+import pytest
+from fastapi.testclient import TestClient
+from shapely.geometry import Point, box
+
+from app.geo.analysis import GERMANY_CRS
+from app.geo.cache import AnalysisCache
+from app.geo.store import ReferenceLayerStore, SharedReferenceStore, WindowedReferenceStore
+from app.llm.jobs import ReportJobRegistry
+
+
+def _feature(lon: float, lat: float, feature_id=None) -> dict:
+    feature = {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": [lon, lat]}}
+    if feature_id is not None:
+        feature["id"] = feature_id
+    return feature
+
+
+@pytest.fixture(params=["memory", "windowed", "shared"])
+def client(request, tmp_path, monkeypatch):
+    import app.main as main
+
+    settlements = gpd.GeoDataFrame(
+        {"name": ["Dorf"], "type": ["AX_Ortslage"]}, geometry=[Point(10.0, 51.0)], crs="EPSG:4326"
+    ).to_crs(GERMANY_CRS)
+    protected_areas = gpd.GeoDataFrame(
+        {"name": ["NSG Moor"], "type": ["Naturschutzgebiete"]}, geometry=[box(10.19, 50.99, 10.21, 51.01)], crs="EPSG:4326"
+    ).to_crs(GERMANY_CRS)
+    paths = {"settlements": tmp_path / "settlements.gpkg", "protected_areas": tmp_path / "protected_areas.gpkg"}
+    settlements.to_file(paths["settlements"], driver="GPKG", engine="pyogrio")
+    protected_areas.to_file(paths["protected_areas"], driver="GPKG", engine="pyogrio")
+    stores = {
+        "memory": lambda: ReferenceLayerStore(paths, optional_paths={}),
+        "windowed": lambda: WindowedReferenceStore(paths, optional_paths={}),
+        "shared": lambda: SharedReferenceStore(paths, packed_dir=tmp_path / "packed", optional_paths={}),
+    }
+
+    def start_services(app):
+        app.state.reference_store = stores[request.param]()
+        app.state.analysis_cache = AnalysisCache()
+        app.state.report_jobs = ReportJobRegistry()
+
+    monkeypatch.setattr(main, "_start_services", start_services)
+    with TestClient(main.app) as client:
+        main.app.state.ready.wait(5)
+        yield client
+
+
+def test_evaluate_batch_route(client):
+    collection = {"type": "FeatureCollection", "features": [_feature(10.0, 51.02), _feature(10.2, 51.0)]}
+
+    response = client.post(
+        "/api/evaluate/batch",
+        json={"sites_geojson": collection, "include_report": True, "report_mode": "template"},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["dataset_version"]
+    assert [r["site_index"] for r in body["results"]] == [0, 1]
+    near, protected = body["results"]
+    assert set(near) == {"site_index", "geo_metrics", "rule_results", "report"}
+    assert near["geo_metrics"]["distance_to_settlements_m"] == pytest.approx(2225, rel=0.01)
+    assert near["geo_metrics"]["overlaps_protected_area"] is False
+    assert protected["geo_metrics"]["overlaps_protected_area"] is True
+    assert protected["rule_results"]["is_compliant"] is False
+    assert "NSG Moor" in protected["report"]
+
+    assert client.post("/api/evaluate/batch", json={"include_report": True}).status_code == 422
+
+
+def test_evaluate_stream_route_reports_invalid_lines(client):
+    lines = [
+        json.dumps(_feature(10.0, 51.02, "a")),
+        "not json",
+        "[1, 2]",
+        "",
+        json.dumps({"foo": 1}),
+        json.dumps({"type": "Feature", "properties": {}, "geometry": None}),
+        json.dumps(_feature(10.2, 51.0, "b")),
+    ]
+
+    response = client.post(
+        "/api/evaluate/stream",
+        params={"chunk_size": 1},
+        content="\n".join(lines).encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["site_index"] for r in records] == [0, 1, 2, 3, 4, 5]
+    assert records[1]["error"].startswith("Invalid line") and records[2]["error"].startswith("Invalid line")
+    assert records[3]["error"].startswith("Invalid geometry") and records[4]["error"].startswith("Invalid geometry")
+    assert [records[0]["id"], records[5]["id"]] == ["a", "b"]
+    assert set(records[0]) == {"site_index", "id", "dataset_version", "geo_metrics", "rule_results"}
+    assert records[0]["geo_metrics"]["distance_to_settlements_m"] == pytest.approx(2225, rel=0.01)
+    assert records[5]["geo_metrics"]["overlaps_protected_area"] is True
+
+    assert client.post("/api/evaluate/stream", params={"chunk_size": 0}, content=b"").status_code == 422
+
+
+def test_evaluate_route_rejects_sites_without_usable_geometry(client):
+    def evaluate(site_geojson):
+        return client.post("/api/evaluate", json={"site_geojson": site_geojson, "report_mode": "template"})
+
+    null_feature = {"type": "Feature", "properties": {}, "geometry": None}
+    empty_polygon = {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": []}}
+    assert evaluate({"type": "FeatureCollection", "features": [null_feature, empty_polygon]}).status_code == 422
+
+    response = evaluate({"type": "FeatureCollection", "features": [null_feature, _feature(10.0, 51.02)]})
+    assert response.status_code == 200
+    assert response.json()["geo_metrics"]["distance_to_settlements_m"] == pytest.approx(2225, rel=0.01)
+
+
+def test_evaluate_route_with_an_empty_site(client):
+    response = client.post(
+        "/api/evaluate",
+        json={"site_geojson": {"type": "FeatureCollection", "features": []}, "report_mode": "template"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["geo_metrics"] == {}
+    assert response.json()["rule_results"]["is_compliant"] is None
@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.db.evaluations import EvaluationStore, geojson_bounds
+
+
+def _site(lon: float, lat: float) -> dict:
+    ring = [[lon, lat], [lon + 0.01, lat], [lon + 0.01, lat + 0.01], [lon, lat + 0.01], [lon, lat]]
+    return {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+def _result(distance: float) -> dict:
+    return {
+        "geo_metrics": {"distance_to_settlements_m": np.float64(distance), "overlaps_protected_area": np.bool_(False)},
+        "rule_results": {"is_compliant": np.bool_(distance >= 1000), "findings": []},
+        "constraints": {},
+        "nearest_settlements": [],
+        "report": None,
+    }
+
+
+def test_geojson_bounds():
+    assert geojson_bounds(_site(10.0, 50.0)) == (10.0, 50.0, 10.01, 50.01)
+    assert geojson_bounds({"type": "FeatureCollection", "features": []}) is None
+    assert geojson_bounds({"type": "Point"}) is None
+
+
+def test_save_get_and_report_update(tmp_path):
+    store = EvaluationStore(tmp_path / "evaluations.sqlite3", pool_size=2)
+    try:
+        evaluation_id = store.save(_site(10.0, 50.0), _result(1500), dataset_version="v1")
+        store.flush()
+
+        evaluation = store.get(evaluation_id)
+        assert evaluation["is_compliant"] is True
+        assert evaluation["geo_metrics"]["distance_to_settlements_m"] == 1500
+        assert evaluation["geo_metrics"]["overlaps_protected_area"] is False
+        assert evaluation["bbox"] == [10.0, 50.0, 10.01, 50.01]
+        assert evaluation["dataset_version"] == "v1"
+        assert evaluation["report_status"] == "pending"
+
+        store.set_report(evaluation_id, "Bericht", "done")
+        store.flush()
+        assert store.get(evaluation_id)["report"] == "Bericht"
+        assert store.get("missing") is None
+    finally:
+        store.close()
+
+
+def test_list_pagination_and_area_search(tmp_path):
+    store = EvaluationStore(tmp_path / "evaluations.sqlite3", pool_size=2)
+    try:
+        ids = [store.save(_site(10.0 + i, 50.0), _result(500 * i)) for i in range(5)]
+        store.flush()
+
+        first_page = list(store.iter_evaluations(limit=2))
+        assert [e["id"] for e in first_page] == ids[::-1][:2]
+        next_page = list(store.iter_evaluations(limit=10, before=first_page[-1]["id"]))
+        assert [e["id"] for e in next_page] == ids[::-1][2:]
+
+        found = list(store.iter_in_area((11.5, 49.0, 13.005, 51.0)))
+        assert [e["id"] for e in found] == [ids[3], ids[2]]
+    finally:
+        store.close()
+
+    # The data survives a restart
+    reopened = EvaluationStore(tmp_path / "evaluations.sqlite3", pool_size=1)
+    try:
+        assert len(list(reopened.iter_evaluations())) == 5
+    finally:
+        reopened.close()
+
+
+def test_evaluation_routes(tmp_path, monkeypatch):
+    import app.main as main
+
+    store = EvaluationStore(tmp_path / "evaluations.sqlite3", pool_size=2)
+    ids = [store.save(_site(10.0 + i, 50.0), _result(500 * i), dataset_version="v1") for i in range(3)]
+    store.flush()
+
+    def start_services(app):
+        app.state.evaluation_store = store
+
+    monkeypatch.setattr(main, "_start_services", start_services)
+    with TestClient(main.app) as client:
+        main.app.state.ready.wait(5)
+
+        response = client.get("/api/evaluations", params={"limit": 2})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        page = [json.loads(line) for line in response.text.splitlines()]
+        assert [e["id"] for e in page] == ids[::-1][:2]
+        assert set(page[0]) == {"id", "created_at", "is_compliant", "report_status", "bbox", "geo_metrics", "rule_results"}
+
+        response = client.get("/api/evaluations", params={"before": page[-1]["id"]})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == ids[:1]
+        assert client.get("/api/evaluations", params={"before": "missing"}).status_code == 400
+
+        response = client.get("/api/evaluations/search", params={"bbox": "10.5,49,11.005,51"})
+        assert response.status_code == 200
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [ids[1]]
+        assert client.get("/api/evaluations/search", params={"bbox": "10,49"}).status_code == 400
+
+        evaluation = client.get(f"/api/evaluations/{ids[2]}").json()
+        assert evaluation["id"] == ids[2] and evaluation["is_compliant"] is True
+        assert evaluation["site_geojson"] == _site(12.0, 50.0)
+        assert evaluation["dataset_version"] == "v1"
+        assert client.get("/api/evaluations/missing").status_code == 404
+
+
+def test_evaluation_routes_without_store(monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "_start_services", lambda app: None)
+    with TestClient(main.app) as client:
+        main.app.state.ready.wait(5)
+        assert client.get("/api/evaluations").status_code == 503
+        assert client.get("/api/evaluations/some-id").status_code == 503
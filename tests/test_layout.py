@@ -0,0 +1,154 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+from fastapi.testclient import TestClient
+from shapely.geometry import Point, box, shape
+
+from app.geo.analysis import GERMANY_CRS
+from app.geo.layout import ExclusionZone, buildable_area, optimize_layout, place_turbines
+from app.geo.store import ReferenceLayerStore
+from app.rules.engine import compile_rules
+
+PARCEL = box(500_000, 5_800_000, 503_000, 5_803_000)
+
+
+def _layer(geometries, types=None) -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame({"type": types or ["x"] * len(geometries)}, geometry=geometries, crs=GERMANY_CRS)
+
+
+def _pairwise_min(positions: np.ndarray) -> float:
+    diff = positions[:, None, :] - positions[None, :, :]
+    distances = np.hypot(diff[..., 0], diff[..., 1])
+    return distances[~np.eye(len(positions), dtype=bool)].min()
+
+
+def test_buildable_area_subtracts_buffers_and_forbidden_areas():
+    settlements = _layer([Point(500_000, 5_800_000).buffer(50), Point(600_000, 5_900_000).buffer(50)])
+    protected = _layer(
+        [box(502_000, 5_802_000, 503_500, 5_803_500), box(500_000, 5_802_500, 500_500, 5_803_000)],
+        types=["Naturschutzgebiete", "Landschaftsschutzgebiete"],
+    )
+
+    area = buildable_area(PARCEL, [
+        ExclusionZone(settlements, 1000),
+        ExclusionZone(protected, 0, types=("Naturschutzgebiete",)),
+    ])
+
+    assert not area.intersects(box(502_001, 5_802_001, 503_000, 5_803_000))
+    assert area.contains(Point(500_250, 5_802_750))  # other protected-area type is allowed
+    # The polygonal buffer never lets a point closer than the distance through
+    boundary = shapely.get_coordinates(area.boundary)
+    assert shapely.distance(settlements.geometry.iloc[0], shapely.points(boundary)).min() >= 1000 - 1e-6
+
+
+def test_place_turbines_keeps_spacing_and_beats_a_square_grid():
+    positions, restarts = place_turbines(PARCEL, 500, time_budget_s=0.2)
+
+    assert restarts >= 1
+    assert shapely.contains_xy(PARCEL, positions[:, 0], positions[:, 1]).all()
+    assert _pairwise_min(positions) >= 500
+    # A square 500 m grid fits 6 x 6 points in the open 3 km square
+    assert len(positions) >= 36
+
+
+def test_optimize_layout_respects_exclusions_and_max_turbines():
+    settlements = _layer([Point(500_000, 5_800_000).buffer(50)])
+
+    layout = optimize_layout(PARCEL, [ExclusionZone(settlements, 1000)], spacing_m=400, time_budget_s=0.2)
+
+    assert len(layout.positions) > 0
+    assert shapely.distance(settlements.geometry.iloc[0], shapely.points(layout.positions)).min() >= 1000
+    assert np.nanmin(layout.nearest_turbine_m) >= 400
+
+    capped = optimize_layout(PARCEL, [], spacing_m=400, time_budget_s=0.2, max_turbines=5)
+    assert len(capped.positions) == 5
+
+
+def test_optimize_layout_without_buildable_area():
+    settlements = _layer([PARCEL.centroid.buffer(10)])
+    layout = optimize_layout(PARCEL, [ExclusionZone(settlements, 5000)], time_budget_s=0.1)
+
+    assert layout.buildable_area.is_empty
+    assert layout.positions.shape == (0, 2)
+
+
+def test_layout_route(tmp_path, monkeypatch):
+    import app.main as main
+
+    paths = {"settlements": tmp_path / "settlements.gpkg", "protected_areas": tmp_path / "protected_areas.gpkg"}
+    settlements = gpd.GeoDataFrame({"name": ["Dorf"], "type": ["AX_Ortslage"]}, geometry=[Point(10.0, 51.0)], crs="EPSG:4326")
+    protected = gpd.GeoDataFrame(
+        {"name": ["NSG"], "type": ["Naturschutzgebiete"]}, geometry=[box(10.04, 51.0, 10.05, 51.03)], crs="EPSG:4326"
+    )
+    settlements.to_crs(GERMANY_CRS).to_file(paths["settlements"], driver="GPKG", engine="pyogrio")
+    protected.to_crs(GERMANY_CRS).to_file(paths["protected_areas"], driver="GPKG", engine="pyogrio")
+
+    def start_services(app):
+        app.state.reference_store = ReferenceLayerStore(paths, optional_paths={})
+
+    monkeypatch.setattr(main, "_start_services", start_services)
+    parcel = {"type": "Polygon", "coordinates": [[[10.0, 51.0], [10.05, 51.0], [10.05, 51.03], [10.0, 51.03], [10.0, 51.0]]]}
+    with TestClient(main.app) as client:
+        main.app.state.ready.wait(5)
+        response = client.post("/api/layout", json={"site_geojson": parcel, "spacing_m": 400, "time_budget_s": 0.5})
+        assert response.status_code == 200
+        result = response.json()
+
+        assert result["analysis_crs"] == GERMANY_CRS
+        assert result["turbine_count"] == len(result["turbines"]) > 0
+        assert 0 < result["buildable_area_m2"] < result["parcel_area_m2"]
+        buildable = shape(result["buildable_area"])
+        for turbine in result["turbines"]:
+            assert set(turbine) == {"index", "lon", "lat", "nearest_turbine_m", "geo_metrics", "rule_results"}
+            assert buildable.buffer(1e-6).contains(Point(turbine["lon"], turbine["lat"]))
+            assert turbine["geo_metrics"]["distance_to_settlements_m"] >= 1000 - 1e-6
+            assert turbine["rule_results"]["is_compliant"] is True
+
+        empty = {"type": "FeatureCollection", "features": []}
+        assert client.post("/api/layout", json={"site_geojson": empty}).status_code == 400
+        assert client.post("/api/layout", json={"site_geojson": parcel, "spacing_m": 0}).status_code == 422
+
+
+def test_layout_route_excludes_only_the_types_a_rule_checks(tmp_path, monkeypatch):
+    import app.main as main
+
+    rules = compile_rules({
+        "rules": [
+            {"type": "min_distance", "metric": "distance_to_settlements_m", "min_m": 800, "types": ["AX_Gebaeude"],
+             "message": "Hof zu nah."},
+            {"type": "forbidden_overlap", "metric": "overlaps_protected_area", "types": ["Naturschutzgebiete"],
+             "message": "NSG."},
+        ]
+    })
+    monkeypatch.setattr("app.rules.engine.get_rule_set", lambda: rules)
+
+    paths = {"settlements": tmp_path / "settlements.gpkg", "protected_areas": tmp_path / "protected_areas.gpkg"}
+    settlements = gpd.GeoDataFrame(
+        {"name": ["Dorf", "Hof"], "type": ["AX_Ortslage", "AX_Gebaeude"]},
+        geometry=[Point(10.01, 51.01), Point(10.05, 51.03)],
+        crs="EPSG:4326",
+    )
+    protected = gpd.GeoDataFrame(
+        {"name": ["NSG", "LSG"], "type": ["Naturschutzgebiete", "Landschaftsschutzgebiete"]},
+        geometry=[box(10.0, 51.0, 10.01, 51.005), box(10.03, 51.0, 10.05, 51.01)],
+        crs="EPSG:4326",
+    )
+    settlements.to_crs(GERMANY_CRS).to_file(paths["settlements"], driver="GPKG", engine="pyogrio")
+    protected.to_crs(GERMANY_CRS).to_file(paths["protected_areas"], driver="GPKG", engine="pyogrio")
+
+    def start_services(app):
+        app.state.reference_store = ReferenceLayerStore(paths, optional_paths={})
+
+    monkeypatch.setattr(main, "_start_services", start_services)
+    parcel = {"type": "Polygon", "coordinates": [[[10.0, 51.0], [10.05, 51.0], [10.05, 51.03], [10.0, 51.03], [10.0, 51.0]]]}
+    with TestClient(main.app) as client:
+        main.app.state.ready.wait(5)
+        result = client.post("/api/layout", json={"site_geojson": parcel, "spacing_m": 400, "time_budget_s": 0.5}).json()
+
+    buildable = shape(result["buildable_area"])
+    # The Ortslage and the LSG do not count for the rules, the NSG and the Hof's distance do.
+    assert buildable.contains(Point(10.01, 51.012)) and buildable.contains(Point(10.04, 51.005))
+    assert not buildable.intersects(box(10.001, 51.001, 10.009, 51.004))
+    assert not buildable.contains(Point(10.049, 51.029))
+    assert result["turbines"]
+    assert all(turbine["rule_results"]["is_compliant"] is True for turbine in result["turbines"])
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import geopandas as gpd
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from shapely.geometry import Point, box
+
+from app.api.timing import run_in_threadpool, timing_middleware
+from app.core.config import get_settings
+from app.core.metrics import record_llm_usage, render_metrics, stage
+from app.geo.analysis import analyze_constraints
+
+app = FastAPI()
+app.middleware("http")(timing_middleware)
+
+
+def _work() -> int:
+    with stage("test_work"):
+        return sum(range(10_000))
+
+
+@app.get("/work")
+async def work():
+    with stage("test_prepare"):
+        pass
+    return {"result": await run_in_threadpool(_work)}
+
+
+@app.get("/constraints")
+async def constraints():
+    roads = gpd.GeoDataFrame({"name": ["A1"], "type": "road"}, geometry=[box(0, 0, 1000, 10)], crs="EPSG:25832")
+    result = await run_in_threadpool(analyze_constraints, Point(500, 100), {"roads": roads})
+    return {"nearest": result["roads"]["nearest_distance_m"]}
+
+
+def test_server_timing_header_and_histograms():
+    client = TestClient(app)
+    response = client.get("/work")
+
+    assert response.json() == {"result": sum(range(10_000))}
+    entries = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert entries == ["test_prepare", "test_work", "total"]
+
+    metrics = render_metrics()
+    assert 'windgpt_stage_duration_seconds_count{stage="test_work"}' in metrics
+    assert 'windgpt_request_duration_seconds_bucket{method="GET",route="work",status="200",le="+Inf"}' in metrics
+
+
+def test_constraint_pool_stages_reach_server_timing():
+    response = TestClient(app).get("/constraints")
+
+    assert response.json() == {"nearest": 90.0}
+    assert "constraint_roads;dur=" in response.headers["Server-Timing"]
+
+
+def test_profile_returns_cprofile_report(monkeypatch):
+    response = TestClient(app).get("/work", params={"profile": "1"})
+    assert response.headers["content-type"].startswith("application/json")
+
+    monkeypatch.setattr(get_settings(), "allow_request_profiling", True)
+    response = TestClient(app).get("/work", params={"profile": "1"})
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "_work" in response.text and "cumulative" in response.text
+
+
+def test_llm_token_counter():
+    record_llm_usage("test-model", SimpleNamespace(input_tokens=120, output_tokens=30))
+    record_llm_usage("test-model", None)
+    metrics = render_metrics()
+    assert 'windgpt_llm_tokens_total{model="test-model",kind="input"} 120' in metrics
+    assert 'windgpt_llm_tokens_total{model="test-model",kind="output"} 30' in metrics
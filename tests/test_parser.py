@@ -0,0 +1,36 @@
+import io
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+from app.geo.parser import features_to_geodataframe, iter_geoparquet_chunks
+
+
+def test_features_to_geodataframe_accepts_features_and_geometries():
+    gdf = features_to_geodataframe([
+        {"type": "Feature", "id": "a", "properties": {}, "geometry": {"type": "Point", "coordinates": [10, 50]}},
+        {"type": "Point", "coordinates": [11, 51]},
+    ])
+
+    assert gdf.crs == "EPSG:4326"
+    assert gdf["id"].tolist() == ["a", None]
+    assert gdf.geometry.iloc[1].equals(Point(11, 51))
+
+
+def test_iter_geoparquet_chunks_reads_record_batches():
+    gdf = gpd.GeoDataFrame(
+        {"id": [f"s{i}" for i in range(7)], "other": range(7)},
+        geometry=[Point(10 + i, 50) for i in range(7)],
+        crs="EPSG:4326",
+    )
+    buffer = io.BytesIO()
+    gdf.to_parquet(buffer)
+    buffer.seek(0)
+
+    chunks = list(iter_geoparquet_chunks(buffer, chunk_size=3))
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert chunks[0].crs.equals(gdf.crs)
+    assert chunks[2]["id"].tolist() == ["s6"]
+    assert chunks[2].geometry.iloc[0].equals(Point(16, 50))
+    assert "other" not in chunks[0].columns
@@ -0,0 +1,144 @@
+import importlib.util
+from pathlib import Path
+
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point, box
+
+SCRIPT_PATH = Path(__file__).parents[1] / "scripts" / "preprocess_all_data.py"
+
+
+@pytest.fixture
+def preprocess(tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location("preprocess_all_data", SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "STAGING_DIR", tmp_path / "staging")
+    monkeypatch.setattr(module, "PROCESSED_DIR", tmp_path / "processed")
+    monkeypatch.setattr(module, "WFS_PAGE_SIZE", 10)
+    monkeypatch.setattr(module, "FETCH_RETRIES", 1)
+    return module
+
+
+class FakeWFS:
+    """Local stand-in for a WFS: serves layers of points page by page and records the requests."""
+
+    def __init__(self, sizes: dict[str, int]):
+        self.sizes = sizes
+        self.requests = []
+        self.fail_pages = set()
+        self.empty_pages = set()
+
+    def count(self, endpoint, layer):
+        return self.sizes[layer]
+
+    def page(self, endpoint, layer, start_index, count):
+        self.requests.append((layer, start_index))
+        if (layer, start_index) in self.fail_pages:
+            raise ConnectionError("connection reset")
+        start_index = start_index or 0
+        stop = self.sizes[layer] if count is None else min(start_index + count, self.sizes[layer])
+        if (layer, start_index) in self.empty_pages:
+            stop = start_index
+        return gpd.GeoDataFrame(
+            {"NAME": [f"{layer} {i}" for i in range(start_index, stop)]},
+            geometry=[Point(10 + i * 0.001, 52) for i in range(start_index, stop)],
+            crs="EPSG:4326",
+        )
+
+
+def _run(preprocess, wfs):
+    preprocess.fetch_and_process_layers(
+        "WFS:https://wfs.example/ows?SERVICE=WFS",
+        ["ns:Big", "ns:Small"],
+        "areas.gpkg",
+        ["NAME"],
+        fetch_count=wfs.count,
+        fetch=wfs.page,
+    )
+
+
+def test_paged_download_resumes_and_skips_unchanged_layers(preprocess, tmp_path):
+    wfs = FakeWFS({"ns:Big": 25, "ns:Small": 3})
+    wfs.fail_pages.add(("ns:Big", 20))
+
+    with pytest.raises(RuntimeError, match="ns:Big"):
+        _run(preprocess, wfs)
+    assert not (tmp_path / "processed" / "areas.gpkg").exists()
+
+    wfs.fail_pages.clear()
+    wfs.requests.clear()
+    _run(preprocess, wfs)
+    # first pages are re-checked, only the failed page is downloaded again
+    assert sorted(wfs.requests, key=str) == sorted([("ns:Big", 0), ("ns:Small", None), ("ns:Big", 20)], key=str)
+
+    result = gpd.read_file(tmp_path / "processed" / "areas.gpkg")
+    assert len(result) == 28
+    assert set(result["type"]) == {"Big", "Small"}
+    assert result["name"].is_unique
+
+    wfs.requests.clear()
+    wfs.sizes["ns:Big"] = 26
+    _run(preprocess, wfs)
+    assert sorted(r for r in wfs.requests if r[0] == "ns:Big") == [("ns:Big", 0), ("ns:Big", 10), ("ns:Big", 20)]
+    assert len(gpd.read_file(tmp_path / "processed" / "areas.gpkg")) == 29
+
+
+def test_new_download_never_reuses_pages_of_an_earlier_one(preprocess, tmp_path):
+    wfs = FakeWFS({"ns:Big": 25, "ns:Small": 3})
+    _run(preprocess, wfs)
+
+    # The layer changed and its second page now comes back empty: the old page must not reappear.
+    wfs.sizes["ns:Big"] = 26
+    wfs.empty_pages.add(("ns:Big", 10))
+    _run(preprocess, wfs)
+
+    result = gpd.read_file(tmp_path / "processed" / "areas.gpkg")
+    assert (result["type"] == "Big").sum() == 16
+    assert len(list((tmp_path / "staging" / "areas").glob("ns_Big.*.gpkg"))) == 1
+
+
+def test_failed_download_does_not_stop_the_others(preprocess, monkeypatch):
+    def fetch_and_process_layers(output_filename, **kwargs):
+        if output_filename == preprocess.SETTLEMENTS_OUTPUT_FILE:
+            raise RuntimeError("1 layer(s) failed")
+        return gpd.GeoDataFrame({"name": ["NSG"], "type": ["Naturschutzgebiete"]}, geometry=[Point(0, 0)])
+
+    published = {}
+    monkeypatch.setattr(preprocess, "fetch_and_process_layers", fetch_and_process_layers)
+    monkeypatch.setattr(preprocess, "publish_snapshot", published.update)
+    monkeypatch.setattr(preprocess, "pack_shared_layers", lambda: None)
+    monkeypatch.setattr(preprocess, "seed_vector_tiles", lambda max_zoom: None)
+    monkeypatch.setattr("sys.argv", ["preprocess_all_data.py"])
+
+    with pytest.raises(SystemExit) as exit_info:
+        preprocess.main()
+
+    assert exit_info.value.code == 1
+    assert list(published) == ["protected_areas"]
+
+
+def test_wfs_urls(preprocess):
+    endpoint = preprocess.wfs_endpoint(preprocess.BKG_DLM250_WFS_URL)
+    assert endpoint == "https://sgx.geodatenzentrum.de/wfs_dlm250"
+    url = preprocess.get_feature_url(endpoint, "dlm250:objart_31001_p", startindex=20, count=10)
+    assert "STARTINDEX=20" in url and "COUNT=10" in url and "TYPENAMES=dlm250%3Aobjart_31001_p" in url
+
+
+def test_deduplicate_and_dissolve_merges_overlaps_per_type(preprocess):
+    gdf = gpd.GeoDataFrame(
+        {
+            "type": ["Biosphaerenreservate", "Biosphaerenreservate", "Biosphaerenreservate", "Naturparke", "AX_Gebaeude", "AX_Gebaeude"],
+            "name": ["Elbe", "Elbe", "Elbe", "Elbe", "Haus", "Haus"],
+        },
+        geometry=[box(0, 0, 2, 2), box(1, 1, 3, 3), box(10, 10, 11, 11), box(0, 0, 2, 2), Point(5, 5), Point(5, 5)],
+        crs="EPSG:25832",
+    )
+
+    result = preprocess.deduplicate_and_dissolve(gdf)
+
+    reserves = result[result["type"] == "Biosphaerenreservate"]
+    assert len(reserves) == 2  # overlapping boxes merged, disjoint part kept separate
+    assert sorted(reserves.area) == [1, 7]
+    assert len(result[result["type"] == "Naturparke"]) == 1
+    assert len(result[result["type"] == "AX_Gebaeude"]) == 1
@@ -0,0 +1,49 @@
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import Point, box
+
+from app.geo.raster import compute_suitability_grid, create_raster_pool
+
+CRS = "EPSG:25832"
+
+
+def test_suitability_grid_distances_and_mask():
+    settlements = gpd.GeoDataFrame({"name": ["Dorf"], "type": ["AX_Ortslage"]}, geometry=[Point(0, 0)], crs=CRS)
+    protected_areas = gpd.GeoDataFrame(
+        {"name": ["NSG"], "type": ["Naturschutzgebiete"]}, geometry=[box(3000, 3000, 4000, 4000)], crs=CRS
+    )
+
+    grid = compute_suitability_grid(
+        (0, 0, 4000, 4000), 1000, settlements, protected_areas, min_distance_to_settlements_m=1000
+    )
+
+    assert grid.shape == (4, 4)
+    # bottom-left cell center is (500, 500)
+    assert grid.distance_to_settlements_m[3, 0] == np.float32(np.hypot(500, 500))
+    assert grid.in_protected_area[0, 3]
+    assert not grid.compliant[3, 0]
+    assert not grid.compliant[0, 3]
+    assert grid.compliant[0, 0]
+
+
+def test_suitability_grid_in_shared_pool_matches_in_thread(tmp_path):
+    settlements = gpd.GeoDataFrame({"name": ["Dorf"], "type": ["AX_Ortslage"]}, geometry=[Point(0, 0)], crs=CRS)
+    protected_areas = gpd.GeoDataFrame(
+        {"name": ["NSG"], "type": ["Naturschutzgebiete"]}, geometry=[box(3000, 3000, 4000, 4000)], crs=CRS
+    )
+    layer_files = (tmp_path / "settlements.fgb", tmp_path / "protected_areas.fgb")
+    settlements.to_file(layer_files[0], driver="FlatGeobuf", engine="pyogrio")
+    protected_areas.to_file(layer_files[1], driver="FlatGeobuf", engine="pyogrio")
+    bbox = (0, 0, 4000, 40_000)
+
+    expected = compute_suitability_grid(bbox, 100, settlements, protected_areas, min_distance_to_settlements_m=1000)
+    pool = create_raster_pool(2)
+    try:
+        for _ in range(2):  # the second grid reuses the workers and their trees
+            grid = compute_suitability_grid(
+                bbox, 100, None, None, min_distance_to_settlements_m=1000, pool=pool, layer_files=layer_files
+            )
+            np.testing.assert_array_equal(grid.distance_to_settlements_m, expected.distance_to_settlements_m)
+            np.testing.assert_array_equal(grid.compliant, expected.compliant)
+    finally:
+        pool.shutdown()
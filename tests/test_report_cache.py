@@ -0,0 +1,42 @@
+from app.llm.cache import MemoryReportCache, SQLiteReportCache, report_cache_key
+
+METRICS = {"distance_to_settlements_m": 1234.4, "overlaps_protected_area": False, "nearest_settlement_name": "A"}
+RULES = {"findings": [], "is_compliant": True}
+
+
+def test_cache_key_is_canonical_and_rounds_distances():
+    key = report_cache_key(METRICS, RULES, "gpt-4.1-mini", "1", precision=1.0)
+    reordered = dict(reversed(list({**METRICS, "distance_to_settlements_m": 1234.2}.items())))
+
+    assert report_cache_key(reordered, RULES, "gpt-4.1-mini", "1", precision=1.0) == key
+    assert report_cache_key({**METRICS, "distance_to_settlements_m": 1236.0}, RULES, "gpt-4.1-mini", "1", precision=1.0) != key
+    assert report_cache_key(METRICS, RULES, "gpt-4.1", "1", precision=1.0) != key
+    assert report_cache_key(METRICS, RULES, "gpt-4.1-mini", "2", precision=1.0) != key
+
+
+def test_memory_cache_evicts_least_recently_used_and_counts():
+    cache = MemoryReportCache(max_entries=2)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+    assert cache.stats() == {"backend": "MemoryReportCache", "hits": 2, "misses": 1, "size": 2}
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryReportCache(ttl_s=-1)
+    cache.set("a", "A")
+    assert cache.get("a") is None
+
+
+def test_sqlite_cache_persists_across_instances(tmp_path):
+    path = tmp_path / "reports.sqlite3"
+    SQLiteReportCache(path).set("a", "Bericht")
+
+    cache = SQLiteReportCache(path)
+    assert cache.get("a") == "Bericht"
+    assert cache.get("b") is None
+    assert len(cache) == 1
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from openai import AsyncOpenAI
+
+from app.llm.cache import MemoryReportCache
+from app.llm.jobs import ReportJobRegistry
+
+REPORT_CHUNKS = ["### 1. Standort", " & Eckdaten\n", "- **Ort:** Siedlung A"]
+
+fake_openai = FastAPI()
+
+
+@fake_openai.post("/v1/responses")
+async def fake_responses(body: dict):
+    """Minimal stand-in for the OpenAI Responses API streaming endpoint."""
+    if body["input"][1]["content"].startswith("fail"):
+        return StreamingResponse(iter([]), status_code=500)
+
+    async def events():
+        for i, chunk in enumerate(REPORT_CHUNKS):
+            event = {"type": "response.output_text.delta", "delta": chunk, "item_id": "msg_1",
+                     "output_index": 0, "content_index": 0, "sequence_number": i, "logprobs": []}
+            yield f"event: response.output_text.delta\ndata: {json.dumps(event)}\n\n"
+            await asyncio.sleep(0)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _fake_client() -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_openai))
+    return AsyncOpenAI(api_key="test", base_url="http://fake-openai/v1", http_client=http_client, max_retries=0)
+
+
+def test_report_job_streams_chunks_and_completes():
+    async def run():
+        registry = ReportJobRegistry(llm_client=_fake_client())
+        job = await registry.submit({"distance_to_settlements_m": 1200.0}, {"findings": [], "is_compliant": True})
+        assert registry.get(job.id) is job
+
+        streamed = [chunk async for chunk in job.iter_chunks()]
+        return job, streamed
+
+    job, streamed = asyncio.run(run())
+    assert streamed == REPORT_CHUNKS
+    assert job.status == "done"
+    assert job.report == "".join(REPORT_CHUNKS)
+
+
+def test_report_job_failure_is_recorded(monkeypatch):
+    monkeypatch.setattr(
+        "app.llm.agent._build_messages",
+        lambda geo_metrics, rule_results: [{"role": "system", "content": ""}, {"role": "user", "content": "fail"}],
+    )
+
+    async def run(fallback_to_template):
+        registry = ReportJobRegistry(llm_client=_fake_client(), fallback_to_template=fallback_to_template)
+        job = await registry.submit({}, {"findings": [], "is_compliant": True})
+        return job, [chunk async for chunk in job.iter_chunks()]
+
+    job, streamed = asyncio.run(run(fallback_to_template=False))
+    assert streamed == []
+    assert job.status == "failed"
+    assert job.report is None
+
+    job, streamed = asyncio.run(run(fallback_to_template=True))
+    assert streamed == []
+    assert job.status == "done"
+    assert job.fallback
+    assert job.report.startswith("### 1. Standort & Eckdaten")
+
+
+def test_report_job_uses_cache():
+    async def run():
+        registry = ReportJobRegistry(llm_client=_fake_client(), cache=MemoryReportCache())
+        metrics = {"distance_to_settlements_m": 1200.0}
+        rules = {"findings": [], "is_compliant": True}
+        first = await registry.submit(metrics, rules)
+        _ = [chunk async for chunk in first.iter_chunks()]
+        second = await registry.submit(metrics, rules)
+        return first, second, registry.cache
+
+    first, second, cache = asyncio.run(run())
+    assert second.status == "done"
+    assert second.report == first.report
+    assert (cache.hits, cache.misses) == (1, 1)
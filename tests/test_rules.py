@@ -0,0 +1,97 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+
+from app.geo.analysis import analyze_site, analyze_sites_batch
+from app.rules.engine import compile_rules, evaluate_rules, evaluate_rules_batch, get_rule_set, typed_metric
+
+CONFIG = {
+    "rules": [
+        {"type": "min_distance", "metric": "distance_to_settlements_m", "min_m": 1000,
+         "message": "Mindestabstand ({min_m} m) nicht erfüllt."},
+        {"type": "min_distance", "metric": "distance_to_settlements_m", "min_m": 1500, "types": ["AX_Ortslage"],
+         "message": "Mindestabstand zu Ortslagen ({min_m} m) nicht erfüllt."},
+        {"type": "forbidden_overlap", "metric": "overlaps_protected_area", "types": ["Naturschutzgebiete"],
+         "message": "Standort liegt in einem Naturschutzgebiet."},
+        {"type": "max_slope", "max_deg": 15, "message": "Hang zu steil."},
+    ]
+}
+
+
+def test_compiled_rules_single_and_batch_agree(monkeypatch):
+    monkeypatch.setattr("app.rules.engine.get_rule_set", lambda: compile_rules(CONFIG))
+    metrics = pd.DataFrame({
+        "distance_to_settlements_m": [500.0, 1200.0, 1200.0, 2000.0, np.nan],
+        "distance_to_settlements_m[AX_Ortslage]": [500.0, 1200.0, 1800.0, 2000.0, np.nan],
+        "overlaps_protected_area": [False, True, True, False, False],
+        "protected_area_type": [None, "Landschaftsschutzgebiete", "Naturparke, Naturschutzgebiete", None, None],
+        "slope_deg": [3.0, 3.0, 3.0, 3.0, 3.0],
+    })
+
+    batch = evaluate_rules_batch(metrics)
+    assert batch["is_compliant"].tolist() == [False, False, False, True, None]
+    assert batch["findings"][0] == ["Mindestabstand (1000 m) nicht erfüllt.", "Mindestabstand zu Ortslagen (1500 m) nicht erfüllt."]
+    assert batch["findings"][1] == ["Mindestabstand zu Ortslagen (1500 m) nicht erfüllt."]
+    assert batch["findings"][2] == ["Standort liegt in einem Naturschutzgebiet."]
+    assert batch["not_evaluated"][4] == ["Mindestabstand (1000 m) nicht erfüllt.",
+                                         "Mindestabstand zu Ortslagen (1500 m) nicht erfüllt."]
+
+    for i, row in enumerate(metrics.astype(object).where(metrics.notna(), None).to_dict("records")):
+        single = evaluate_rules(row)
+        assert single["findings"] == batch["findings"][i]
+        assert single["not_evaluated"] == batch["not_evaluated"][i]
+        assert single["is_compliant"] == batch["is_compliant"][i]
+
+
+def test_missing_metrics_make_the_result_unknown():
+    # An empty FeatureCollection has no metrics at all; no rule can be checked.
+    result = evaluate_rules({})
+
+    assert result["is_compliant"] is None
+    assert result["findings"] == []
+    assert len(result["not_evaluated"]) == len(get_rule_set().rules)
+
+    # A violated rule still decides, even if others cannot be evaluated.
+    assert evaluate_rules({"overlaps_protected_area": True})["is_compliant"] is False
+
+
+def test_typed_min_distance_checks_nearest_feature_of_that_type(monkeypatch):
+    rules = compile_rules({"rules": [
+        {"type": "min_distance", "metric": "distance_to_settlements_m", "min_m": 600, "types": ["AX_Gebaeude"],
+         "message": "Mindestabstand zu Einzelgebäuden ({min_m} m) nicht erfüllt."},
+    ]})
+    monkeypatch.setattr("app.rules.engine.get_rule_set", lambda: rules)
+    # The nearest settlement is a village; the building it hides is closer than 600 m as well.
+    settlements = gpd.GeoDataFrame(
+        {"name": ["Dorf", "Hof"], "type": ["AX_Ortslage", "AX_Gebaeude"]},
+        geometry=[Point(500, 0), Point(0, 550)],
+        crs="EPSG:25832",
+    )
+    protected_areas = gpd.GeoDataFrame({"name": [], "type": []}, geometry=[], crs="EPSG:25832")
+    site = gpd.GeoDataFrame(geometry=[Point(0, 0)], crs="EPSG:25832")
+    typed_distances = rules.typed_distances("distance_to_settlements_m")
+    key = typed_metric("distance_to_settlements_m", ["AX_Gebaeude"])
+
+    metrics = analyze_site(site, settlements, protected_areas, typed_distances=typed_distances)["metrics"]
+    assert metrics["nearest_settlement_type"] == "AX_Ortslage"
+    assert metrics[key] == 550
+    assert evaluate_rules(metrics)["is_compliant"] is False
+
+    batch = analyze_sites_batch(site, settlements, protected_areas, typed_distances=typed_distances)
+    assert batch[key].tolist() == [550]
+    assert evaluate_rules_batch(batch)["is_compliant"].tolist() == [False]
+
+
+def test_rule_set_is_cached_until_file_changes(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(
+        "rules:\n  - type: min_distance\n    metric: distance_to_settlements_m\n    min_m: 1000\n    message: x\n",
+        encoding="utf-8",
+    )
+    first = get_rule_set(path)
+    assert get_rule_set(path) is first
+    assert first.min_distance("distance_to_settlements_m") == 1000
+
+    path.write_text(path.read_text(encoding="utf-8").replace("1000", "750"), encoding="utf-8")
+    assert get_rule_set(path).min_distance("distance_to_settlements_m") == 750
@@ -0,0 +1,69 @@
+import geopandas as gpd
+from shapely.geometry import Point
+
+from app.geo.analysis import GERMANY_CRS
+from app.geo.snapshots import current_snapshot, write_snapshot
+from app.geo.store import ReferenceLayerStore, WindowedReferenceStore
+
+
+def _layer(xs) -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame(
+        {"name": [f"S{x}" for x in xs], "type": ["Ortslage"] * len(xs)},
+        geometry=[Point(500_000 + x, 5_800_000) for x in xs],
+        crs=GERMANY_CRS,
+    )
+
+
+def test_write_snapshot_diffs_and_links_unchanged_layers(tmp_path):
+    first, written = write_snapshot({"settlements": _layer([0, 1, 2]), "protected_areas": _layer([5])}, tmp_path)
+    assert written
+    assert first.manifest["layers"]["settlements"]["diff"] == {"added": 3, "removed": 0, "unchanged": 0}
+
+    second, written = write_snapshot({"settlements": _layer([1, 2, 3, 4]), "protected_areas": _layer([5])}, tmp_path)
+    assert written
+    assert current_snapshot(tmp_path).version == second.version != first.version
+    assert second.manifest["previous_version"] == first.version
+    assert second.manifest["layers"]["settlements"]["diff"] == {"added": 2, "removed": 1, "unchanged": 2}
+    assert second.manifest["layers"]["protected_areas"]["diff"] == {"added": 0, "removed": 0, "unchanged": 1}
+    # The unchanged layer is the same file, not a copy
+    assert (second.directory / "protected_areas.fgb").samefile(first.directory / "protected_areas.fgb")
+
+    # Same features in another order: nothing to publish
+    same, written = write_snapshot({"settlements": _layer([4, 3, 2, 1]), "protected_areas": _layer([5])}, tmp_path)
+    assert not written
+    assert same.version == second.version
+
+
+def test_write_snapshot_prunes_old_snapshots(tmp_path):
+    versions = [write_snapshot({"settlements": _layer(range(n))}, tmp_path, keep=2)[0].version for n in (1, 2, 3)]
+
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == sorted(versions[1:])
+
+
+def test_store_switches_snapshots_and_pinned_views_keep_theirs(tmp_path):
+    snapshots_dir = tmp_path / "snapshots"
+    write_snapshot({"settlements": _layer([0])}, snapshots_dir)
+    store = ReferenceLayerStore({"settlements": tmp_path / "settlements.gpkg"}, optional_paths={}, snapshots_dir=snapshots_dir)
+    store.load_all()
+    old_version = store.version()
+    pinned = store.pinned()
+
+    assert not store.refresh()
+    write_snapshot({"settlements": _layer([0, 1])}, snapshots_dir)
+    assert store.refresh()
+
+    assert len(store.get("settlements")) == 2
+    assert store.version() == current_snapshot(snapshots_dir).version != old_version
+    assert len(pinned.get("settlements")) == 1
+    assert pinned.version() == old_version
+
+
+def test_windowed_store_reads_snapshot_layers(tmp_path):
+    snapshots_dir = tmp_path / "snapshots"
+    write_snapshot({"settlements": _layer([0, 1]), "protected_areas": _layer([50_000])}, snapshots_dir)
+    store = WindowedReferenceStore({}, optional_paths={}, snapshots_dir=snapshots_dir)
+
+    settlements, protected_areas = store.layers_for_site(Point(500_000, 5_800_000).buffer(10))
+
+    assert len(settlements) >= 1
+    assert len(protected_areas) == 1
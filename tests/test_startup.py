@@ -0,0 +1,93 @@
+"""
+Cold-start guards: importing app.main must stay cheap (no geo stack, no openai, no settings) and
+the app must come up without OPENAI_API_KEY.
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+REPO_DIR = Path(__file__).parents[1]
+
+# Imported lazily by the app; pulling any of them into `import app.main` is a cold-start regression.
+HEAVY_MODULES = ["geopandas", "shapely", "pandas", "numpy", "pyogrio", "pyproj", "openai", "yaml", "jinja2"]
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def import_app() -> dict:
+    """Imports app.main in a fresh interpreter without OPENAI_API_KEY; returns the time taken and heavy modules loaded."""
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_import_app_main_loads_no_heavy_modules():
+    assert import_app()["loaded"] == []
+
+
+@pytest.mark.skipif(importlib.util.find_spec("pytest_benchmark") is None, reason="needs pytest-benchmark")
+def test_import_app_main_time(benchmark):
+    benchmark.group = "cold start"
+    result = benchmark.pedantic(import_app, rounds=5, iterations=1)
+    assert result["loaded"] == []
+
+
+def test_health_answers_before_ready(monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "_start_services", lambda app: time.sleep(0.5))
+    with TestClient(main.app) as client:
+        assert client.get("/api/health").json() == {"status": "ok"}
+        assert client.get("/api/ready").status_code == 503
+
+        main.app.state.ready.wait(5)
+        assert client.get("/api/ready").json() == {"status": "ready"}
+
+
+def test_ready_reports_startup_failure(monkeypatch):
+    import app.main as main
+
+    def fail(app):
+        raise RuntimeError("settlements.gpkg is broken")
+
+    monkeypatch.setattr(main, "_start_services", fail)
+    with TestClient(main.app) as client:
+        main.app.state.ready.wait(5)
+        response = client.get("/api/ready")
+        assert response.status_code == 503
+        assert response.json() == {"status": "failed", "error": "settlements.gpkg is broken"}
+        assert client.get("/api/evaluate/cache").status_code == 503
+
+
+def test_requests_await_the_warm_up(monkeypatch):
+    import app.main as main
+    from app.core.config import get_settings
+    from app.geo.cache import AnalysisCache
+
+    def start_services(app):
+        time.sleep(0.5)
+        app.state.analysis_cache = AnalysisCache()
+
+    monkeypatch.setattr(main, "_start_services", start_services)
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(get_settings(), "startup_wait_s", 0.05)
+        assert client.get("/api/evaluate/cache").status_code == 503
+
+        monkeypatch.setattr(get_settings(), "startup_wait_s", 5.0)
+        assert client.get("/api/evaluate/cache").status_code == 200
+        assert client.get("/api/ready").json() == {"status": "ready"}
@@ -0,0 +1,61 @@
+import os
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+from app.geo.store import ReferenceLayerStore
+
+
+def _write_layer(path, points, crs="EPSG:4326"):
+    gdf = gpd.GeoDataFrame(
+        {"name": [f"S{i}" for i in range(len(points))], "type": ["Ortslage"] * len(points)},
+        geometry=[Point(p) for p in points],
+        crs=crs,
+    )
+    gdf.to_file(path, driver="GPKG", engine="pyogrio")
+
+
+def test_store_projects_and_caches_layer(tmp_path):
+    path = tmp_path / "settlements.gpkg"
+    _write_layer(path, [(10.2, 52.5), (10.3, 52.4)])
+    store = ReferenceLayerStore({"settlements": path})
+
+    first = store.get("settlements")
+    assert first.crs == "EPSG:25832"
+    assert store.get("settlements") is first
+
+
+def test_store_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "settlements.gpkg"
+    _write_layer(path, [(10.2, 52.5)])
+    store = ReferenceLayerStore({"settlements": path})
+    first = store.get("settlements")
+
+    _write_layer(path, [(10.2, 52.5), (10.3, 52.4), (10.4, 52.3)])
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    second = store.get("settlements")
+    assert second is not first
+    assert len(second) == 3
+
+
+def test_pinned_views_share_what_they_load(tmp_path, monkeypatch):
+    path = tmp_path / "settlements.gpkg"
+    _write_layer(path, [(10.2, 52.5)])
+    store = ReferenceLayerStore({"settlements": path}, optional_paths={})
+    store.load_all()
+
+    _write_layer(path, [(10.2, 52.5), (10.3, 52.4)])
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    loads = []
+    load = store._load
+    monkeypatch.setattr(store, "_load", lambda *args: loads.append(args) or load(*args))
+
+    reloaded = [store.pinned().get("settlements") for _ in range(3)]
+    projected = store.pinned().get_projected("settlements", "EPSG:25833")
+
+    assert len(loads) == 1
+    assert reloaded[0] is reloaded[2] is store.get("settlements")
+    assert store.get_projected("settlements", "EPSG:25833") is projected
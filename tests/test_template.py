@@ -0,0 +1,68 @@
+import pytest
+
+from app.llm.template import render_template_report
+from app.rules.engine import compile_rules, evaluate_rules
+
+# Messages without the words the report sections are named after
+RULES = compile_rules({
+    "rules": [
+        {"type": "min_distance", "metric": "distance_to_settlements_m", "min_m": 1000, "message": "Zu nah ({min_m} m)."},
+        {"type": "forbidden_overlap", "metric": "overlaps_protected_area", "message": "Gebiet ausgeschlossen."},
+        {"type": "min_distance", "metric": "distance_to_settlements_m", "min_m": 600, "types": ["AX_Gebaeude"],
+         "message": "Hof zu nah."},
+    ]
+})
+
+
+@pytest.fixture(autouse=True)
+def rule_set(monkeypatch):
+    monkeypatch.setattr("app.rules.engine.get_rule_set", lambda: RULES)
+    monkeypatch.setattr("app.llm.template.get_rule_set", lambda: RULES)
+
+
+def test_compliant_report():
+    metrics = {
+        "distance_to_settlements_m": 1500.0,
+        "distance_to_settlements_m[AX_Gebaeude]": 2500.0,
+        "overlaps_protected_area": False,
+        "nearest_settlement_name": "Dorf",
+        "nearest_settlement_type": "AX_Ortslage",
+        "protected_area_name": None,
+        "protected_area_type": None,
+    }
+
+    report = render_template_report(metrics, evaluate_rules(metrics))
+
+    assert "**Ort:** Dorf (AX_Ortslage)" in report
+    assert "Der **Mindestabstand** von 1.000 m zur nächsten Siedlung wird mit 1.500 m eingehalten." in report
+    assert "Es liegt keine Überschneidung mit einem **Schutzgebiet** vor." in report
+    assert "Der Standort ist nach Abstands- und Schutzgebietsprüfung grundsätzlich geeignet." in report
+
+
+def test_violation_report_classifies_findings_by_rule():
+    metrics = {
+        "distance_to_settlements_m": 800.0,
+        "distance_to_settlements_m[AX_Gebaeude]": 500.0,
+        "overlaps_protected_area": True,
+        "nearest_settlement_name": "Dorf",
+        "nearest_settlement_type": "AX_Ortslage",
+        "protected_area_name": "NSG Moor",
+        "protected_area_type": "Naturschutzgebiete",
+    }
+
+    report = render_template_report(metrics, evaluate_rules(metrics))
+
+    assert "Der **Mindestabstand** von 1.000 m zur nächsten Siedlung wird mit 800 m unterschritten." in report
+    assert "Standort liegt in **NSG Moor** (Naturschutzgebiete)" in report
+    assert "Eine Bebauung ist nach dem Regelwerk ausgeschlossen." in report
+    # Only the typed rule is listed separately
+    assert "- Hof zu nah." in report
+    assert "- Zu nah" not in report and "- Gebiet ausgeschlossen." not in report
+    assert "Der Standort ist derzeit nicht geeignet: Zu nah (1000 m). Gebiet ausgeschlossen. Hof zu nah." in report
+
+
+def test_unknown_report_lists_unevaluated_rules():
+    report = render_template_report({}, evaluate_rules({}))
+
+    assert "der **Mindestabstand** von 1.000 m konnte nicht geprüft werden." in report
+    assert "Die Eignung kann nicht abschließend beurteilt werden" in report
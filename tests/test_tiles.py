@@ -0,0 +1,135 @@
+import os
+
+import geopandas as gpd
+from fastapi.testclient import TestClient
+from shapely.geometry import Point, box
+
+from app.geo.tiles import TILE_EXTENT, VectorTileStore, render_tile, tiles_for_bounds
+
+
+def _read_fields(data: bytes):
+    """Minimal protobuf reader yielding (field, value) with bytes for length-delimited fields."""
+    pos = 0
+
+    def varint():
+        nonlocal pos
+        result, shift = 0, 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                return result
+
+    while pos < len(data):
+        key = varint()
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            yield field, varint()
+        elif wire_type == 1:
+            yield field, data[pos:pos + 8]
+            pos += 8
+        else:
+            length = varint()
+            yield field, data[pos:pos + length]
+            pos += length
+
+
+def _packed(data: bytes) -> list[int]:
+    values, value, shift = [], 0, 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            values.append(value)
+            value, shift = 0, 0
+    return values
+
+
+def _decode_layer(tile: bytes) -> dict:
+    (field, layer), = list(_read_fields(tile))
+    assert field == 3
+    decoded = {"features": [], "keys": [], "values": []}
+    for field, value in _read_fields(layer):
+        if field == 1:
+            decoded["name"] = value.decode()
+        elif field == 2:
+            decoded["features"].append(dict(_read_fields(value)))
+        elif field == 3:
+            decoded["keys"].append(value.decode())
+        elif field == 4:
+            decoded["values"].append(dict(_read_fields(value))[1].decode())
+        elif field == 5:
+            decoded["extent"] = value
+        elif field == 15:
+            decoded["version"] = value
+    return decoded
+
+
+def _write_areas(path, areas):
+    gpd.GeoDataFrame(
+        {"name": [f"Gebiet {i}" for i in range(len(areas))], "type": "Naturschutzgebiete"},
+        geometry=areas,
+        crs="EPSG:4326",
+    ).to_file(path, driver="GPKG", engine="pyogrio")
+
+
+def test_tile_encodes_features_and_is_cached(tmp_path):
+    path = tmp_path / "protected_areas.gpkg"
+    _write_areas(path, [box(10.0, 52.0, 10.1, 52.1), box(10.2, 52.0, 10.25, 52.05)])
+    store = VectorTileStore({"protected_areas": path}, tiles_dir=tmp_path / "tiles")
+
+    bounds = gpd.GeoSeries([Point(10.05, 52.05)], crs="EPSG:4326").to_crs("EPSG:3857").total_bounds
+    (x, y), = tiles_for_bounds(bounds, 10)
+    tile = store.get_tile("protected_areas", 10, x, y)
+
+    layer = _decode_layer(tile)
+    assert layer["name"] == "protected_areas"
+    assert layer["version"] == 2 and layer["extent"] == TILE_EXTENT
+    assert layer["keys"] == ["name", "type"]
+    assert {feature[3] for feature in layer["features"]} == {3}  # polygons
+    geometry = _packed(layer["features"][0][4])
+    assert geometry[0] == (1 | 1 << 3) and geometry[-1] == (7 | 1 << 3)  # MoveTo(1) ... ClosePath
+
+    assert store.get_tile("protected_areas", 10, x, y) == tile
+    # Rendered from a window read, identical to a render from the whole layer
+    assert tile == render_tile("protected_areas", gpd.read_file(path).to_crs("EPSG:3857"), 10, x, y)
+    assert store.get_tile("protected_areas", 3, 0, 0) == b""  # below the layer's minimum zoom
+
+    # A regenerated source invalidates the cached tiles.
+    _write_areas(path, [box(10.0, 52.0, 10.1, 52.1)])
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    store = VectorTileStore({"protected_areas": path}, tiles_dir=tmp_path / "tiles")
+    assert len(_decode_layer(store.get_tile("protected_areas", 10, x, y))["features"]) == 1
+
+
+def test_seed_stores_non_empty_tiles(tmp_path):
+    path = tmp_path / "protected_areas.gpkg"
+    _write_areas(path, [box(10.0, 52.0, 10.1, 52.1)])
+    store = VectorTileStore({"protected_areas": path}, tiles_dir=tmp_path / "tiles")
+    assert store.seed("protected_areas", max_zoom=8) == 3  # one tile each at zoom 6, 7 and 8
+
+
+def test_tile_route_allows_the_frontend_origin_only(tmp_path, monkeypatch):
+    import app.main as main
+
+    path = tmp_path / "protected_areas.gpkg"
+    _write_areas(path, [box(10.0, 52.0, 10.1, 52.1)])
+
+    def start_services(app):
+        app.state.tile_store = VectorTileStore({"protected_areas": path}, tiles_dir=tmp_path / "tiles")
+
+    monkeypatch.setattr(main, "_start_services", start_services)
+    frontend = {"Origin": "http://localhost:8501"}
+    with TestClient(main.app) as client:
+        main.app.state.ready.wait(5)
+        response = client.get("/api/tiles/protected_areas/8/135/84.mvt", headers=frontend)
+        assert response.status_code == 200 and response.content
+        assert response.headers["access-control-allow-origin"] == "http://localhost:8501"
+
+        other = client.get("/api/tiles/protected_areas/8/135/84.mvt", headers={"Origin": "http://example.com"})
+        assert "access-control-allow-origin" not in other.headers
+        # The rest of the API is not opened up
+        assert "access-control-allow-origin" not in client.get("/api/health", headers=frontend).headers
@@ -0,0 +1,134 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point, box
+
+from app.geo.analysis import analyze_site, analyze_sites_batch
+from app.geo.packed import PackedLayer, pack_layer
+from app.geo.raster import compute_suitability_grid
+from app.geo.store import SharedReferenceStore, WindowedReferenceStore
+
+CRS = "EPSG:25832"
+
+
+@pytest.fixture
+def layer_paths(tmp_path):
+    rng = np.random.default_rng(3)
+    xy = rng.uniform(500_000, 540_000, size=(300, 2))
+    settlements = gpd.GeoDataFrame(
+        {"name": [f"Dorf {i}" for i in range(len(xy))], "type": "AX_Ortslage"},
+        geometry=gpd.points_from_xy(xy[:, 0], xy[:, 1]),
+        crs=CRS,
+    )
+    protected_areas = gpd.GeoDataFrame(
+        {"name": ["NSG", "LSG", "FFH"], "type": ["Naturschutzgebiete", "Landschaftsschutzgebiete", "FFH"]},
+        geometry=[box(505_000, 505_000, 512_000, 507_000), box(530_000, 500_000, 531_000, 540_000),
+                  box(560_000, 560_000, 561_000, 561_000)],
+        crs=CRS,
+    )
+    paths = {"settlements": tmp_path / "settlements.gpkg", "protected_areas": tmp_path / "protected_areas.gpkg"}
+    settlements.to_file(paths["settlements"], driver="GPKG", engine="pyogrio")
+    protected_areas.to_file(paths["protected_areas"], driver="GPKG", engine="pyogrio")
+    return paths
+
+
+@pytest.mark.parametrize("center", [(510_000, 506_000), (520_000, 520_000), (600_000, 600_000), (498_000, 541_000)])
+@pytest.mark.parametrize("store_type", ["windowed", "shared"])
+def test_windowed_analysis_matches_full_layers(layer_paths, tmp_path, center, store_type):
+    site = gpd.GeoDataFrame(geometry=[Point(center).buffer(300)], crs=CRS)
+    full = analyze_site(site, gpd.read_file(layer_paths["settlements"]), gpd.read_file(layer_paths["protected_areas"]))
+
+    if store_type == "windowed":
+        store = WindowedReferenceStore(layer_paths, tile_size_m=2_000, max_tiles=8)
+    else:
+        store = SharedReferenceStore(layer_paths, packed_dir=tmp_path / "packed")
+    settlements, protected_areas = store.layers_for_site(site.union_all())
+    windowed = analyze_site(site, settlements, protected_areas)
+
+    assert len(settlements) < 300 or center == (600_000, 600_000)
+    assert windowed["metrics"] == full["metrics"]
+
+
+@pytest.mark.parametrize("store_type", ["windowed", "shared"])
+def test_window_holds_nearest_settlement_of_each_typed_rule(tmp_path, store_type):
+    settlements = gpd.GeoDataFrame(
+        {"name": ["Dorf", "Hof"], "type": ["AX_Ortslage", "AX_Gebaeude"]},
+        geometry=[Point(510_000, 510_000), Point(540_000, 540_000)],
+        crs=CRS,
+    )
+    paths = {"settlements": tmp_path / "settlements.gpkg", "protected_areas": tmp_path / "protected_areas.gpkg"}
+    settlements.to_file(paths["settlements"], driver="GPKG", engine="pyogrio")
+    settlements.iloc[:1].to_file(paths["protected_areas"], driver="GPKG", engine="pyogrio")
+    if store_type == "windowed":
+        store = WindowedReferenceStore(paths, tile_size_m=2_000, max_tiles=8)
+    else:
+        store = SharedReferenceStore(paths, packed_dir=tmp_path / "packed")
+    site = gpd.GeoDataFrame(geometry=[Point(509_000, 509_000)], crs=CRS)
+    typed_distances = {"distance_to_settlements_m[AX_Gebaeude]": frozenset({"AX_Gebaeude"})}
+
+    assert len(store.layers_for_site(site.union_all())[0]) == 1
+    windowed, protected_areas = store.layers_for_site(site.union_all(), settlement_types=typed_distances.values())
+    metrics = analyze_site(site, windowed, protected_areas, typed_distances=typed_distances)["metrics"]
+
+    assert metrics["distance_to_settlements_m[AX_Gebaeude]"] == pytest.approx(np.hypot(31_000, 31_000))
+
+
+@pytest.mark.parametrize("store_type", ["windowed", "shared"])
+def test_batch_and_raster_windows_match_full_layers(layer_paths, tmp_path, store_type):
+    full = [gpd.read_file(layer_paths["settlements"]), gpd.read_file(layer_paths["protected_areas"])]
+    if store_type == "windowed":
+        store = WindowedReferenceStore(layer_paths, tile_size_m=2_000, max_tiles=8)
+    else:
+        store = SharedReferenceStore(layer_paths, packed_dir=tmp_path / "packed")
+    sites = gpd.GeoDataFrame(
+        geometry=[Point(506_000, 506_500).buffer(200), Point(515_000, 512_000), Point(511_000, 508_000)], crs=CRS
+    )
+
+    settlements, protected_areas = store.layers_for_sites(sites.geometry.values)
+    assert len(settlements) < 300
+    windowed = analyze_sites_batch(sites, settlements, protected_areas)
+    assert windowed.equals(analyze_sites_batch(sites, *full))
+
+    bbox = (504_000, 503_000, 509_000, 507_000)
+    settlements, protected_areas = store.layers_for_bbox(bbox)
+    assert len(settlements) < 300
+    windowed_grid = compute_suitability_grid(bbox, 250, settlements, protected_areas, 1_000)
+    full_grid = compute_suitability_grid(bbox, 250, *full, 1_000)
+    np.testing.assert_array_equal(windowed_grid.distance_to_settlements_m, full_grid.distance_to_settlements_m)
+    np.testing.assert_array_equal(windowed_grid.in_protected_area, full_grid.in_protected_area)
+
+
+@pytest.mark.parametrize("store_type", ["windowed", "shared"])
+def test_empty_site_gets_empty_windows(layer_paths, tmp_path, store_type):
+    if store_type == "windowed":
+        store = WindowedReferenceStore(layer_paths, tile_size_m=2_000, max_tiles=8)
+    else:
+        store = SharedReferenceStore(layer_paths, packed_dir=tmp_path / "packed")
+
+    settlements, protected_areas = store.layers_for_site(Point().buffer(1))
+
+    assert settlements.empty and protected_areas.empty
+
+
+def test_packed_tree_query_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(4)
+    xy = rng.uniform(0, 100_000, size=(5_000, 2))
+    size = rng.uniform(1, 2_000, size=(5_000, 1))
+    boxes = gpd.GeoDataFrame(
+        {"name": [f"F{i}" for i in range(len(xy))], "type": None},
+        geometry=[box(x, y, x + s, y + s) for (x, y), (s,) in zip(xy, size)],
+        crs=CRS,
+    )
+    pack_layer(boxes, tmp_path / "boxes")
+    layer = PackedLayer(tmp_path / "boxes")
+    packed_bounds = np.array([geometry.bounds for geometry in layer.read(np.arange(layer.count)).geometry])
+
+    for query in [(10_000, 10_000, 12_000, 15_000), (0, 0, 100_000, 100_000), (-10, -10, -5, -5)]:
+        expected = np.flatnonzero(
+            (packed_bounds[:, 0] <= query[2]) & (packed_bounds[:, 2] >= query[0])
+            & (packed_bounds[:, 1] <= query[3]) & (packed_bounds[:, 3] >= query[1])
+        )
+        np.testing.assert_array_equal(layer.query(query), expected)
+
+    window = layer.read(layer.query((10_000, 10_000, 12_000, 15_000)))
+    assert window["name"].str.startswith("F").all() and window["type"].isna().all()